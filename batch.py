@@ -0,0 +1,239 @@
+"""
+This module is the non-interactive counterpart of main.py. It runs one job described by command
+line flags, or every job listed in a TOML (or YAML, when PyYAML is installed) job file, back to back.
+Networks are built or loaded once and the worker pool is kept while consecutive jobs use the same
+network.
+
+Example job file:
+
+	workers = 8
+
+	[payoffs]
+	weak = [[1.2, -0.1], [1.3, 0]]
+
+	[defaults]
+	games = 10
+	turns = 100
+
+	[[jobs]]
+	graph = "gh"
+	choice_factor = 1
+	beta = 0.1
+	payoff = "gh_k15"
+
+	[[jobs]]
+	graph = "ws"
+	nodes = 1000
+	k = 4
+	choice_factor = 2
+	payoff = "weak"
+"""
+import os
+import argparse
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from contextlib import ExitStack
+from graph_cache import load_network
+from payoff_presets import PAYOFF_PRESETS
+from replica_runner import replica_pool
+from result_cache import ResultCache
+from work_queue import queue_pool
+from time_series_plots import plot_time_series, path
+
+# Default values given by the notes of main.py
+JOB_DEFAULTS = {"graph": "ws", "nodes": 1000, "k": 4, "games": 10, "turns": 25, "init_coop": 0.5,
+				"choice_factor": 1, "beta": 0.0, "payoff": "ws", "seed": None}
+# For 2d, nodes is the side of the grid, the default gives about as many players as ws
+GRID_SIDE_DEFAULT = 32
+
+
+def _read_job_file(file_path):
+	"""
+	Reads a TOML or YAML job file
+	Parameters
+	----------
+	file_path : str
+	Returns
+	-------
+	config : dict
+		Optional workers, payoffs and defaults entries and the list of jobs
+	"""
+	if file_path.endswith((".yaml", ".yml")):
+		import yaml
+		with open(file_path) as file:
+			return yaml.safe_load(file)
+	try:
+		import tomllib
+	except ModuleNotFoundError:
+		# tomllib is part of the standard library from Python 3.11
+		import tomli as tomllib
+	with open(file_path, "rb") as file:
+		return tomllib.load(file)
+
+
+def _job_settings(job):
+	"""
+	Fills the missing settings of a job with their default value
+	Parameters
+	----------
+	job : dict
+	Returns
+	-------
+	job : dict
+		Every key of JOB_DEFAULTS, nodes being GRID_SIDE_DEFAULT for a 2d job that gives none
+	"""
+	defaults = dict(JOB_DEFAULTS, nodes=GRID_SIDE_DEFAULT) if job.get("graph") == "2d" else JOB_DEFAULTS
+	return dict(defaults, **job)
+
+
+def _job_title(job, network_title):
+	"""
+	Builds the title main.py would give the same configuration
+	Parameters
+	----------
+	job : dict
+	network_title : str
+		Title returned by load_network
+	Returns
+	-------
+	title : str
+	"""
+	title = "{0}, {1} Games, {2} Turns".format(network_title, job["games"], job["turns"])
+	if (job["choice_factor"] == 1 or job["choice_factor"] == 3):
+		title = "{0}, Strategy {1}, Beta={2}".format(title, job["choice_factor"], job["beta"])
+	else:
+		title = "{0}, Strategy {1}".format(title, job["choice_factor"])
+	payoff_name = job["payoff"] if isinstance(job["payoff"], str) else "custom"
+	return title + ", " + payoff_name + " payoff"
+
+
+def _check_payoffs(jobs, presets):
+	"""
+	Checks that every job names a known payoff preset or gives a matrix, before any job runs
+	Parameters
+	----------
+	jobs : list
+	presets : dict
+		Named payoff matrices
+	"""
+	for number, job in enumerate(jobs, start=1):
+		payoff = _job_settings(job)["payoff"]
+		if isinstance(payoff, str) and payoff not in presets:
+			raise ValueError("job {0}: unknown payoff '{1}', valid presets are {2}".format(number, payoff, ", ".join(sorted(presets))))
+
+
+def run_jobs(jobs, presets=PAYOFF_PRESETS, workers=1, checkpoint_dir=None, checkpoint_every=None, checkpoint_seconds=None, cache=None, queue_dir=None):
+	"""
+	Runs simulation jobs one after another, saving the time series plot of each
+	Parameters
+	----------
+	jobs : list
+		Dicts with the keys of JOB_DEFAULTS, missing keys take the default value (GRID_SIDE_DEFAULT
+		for the nodes of a 2d job)
+	presets : dict, default PAYOFF_PRESETS
+		Named payoff matrices, a job's payoff is either one of these names or a 2x2 matrix
+	workers : int, default 1
+		Number of worker processes shared by all jobs
+	checkpoint_dir : str, optional
+		Directory where the replicas of job k keep their checkpoints under job_<k>, running the same
+		jobs again resumes every unfinished replica and skips the finished ones
+	checkpoint_every : int, optional
+		Steps between checkpoints
+	checkpoint_seconds : float, optional
+		Seconds between checkpoints
+	cache : result_cache.ResultCache, optional
+		Games of seeded jobs already simulated are read from it instead of run again
+	queue_dir : str, optional
+		Shared directory of a work_queue, the games are run by the workers polling it instead of
+		local processes
+	Returns
+	-------
+	p_arr : list
+		Overall mean proportion of cooperators of each job
+	"""
+	_check_payoffs(jobs, presets)
+	os.makedirs(os.path.normpath(path[0] + "/reports/figures/time_series"), exist_ok=True)
+	networks = {}
+	p_arr = []
+	with ExitStack() as stack:
+		pool, pool_key = None, None
+		for number, job in enumerate(jobs, start=1):
+			job = _job_settings(job)
+			key = (job["graph"], job["nodes"], job["k"], job["seed"]) if job["graph"] in ("ws", "er", "2d") else (job["graph"],)
+			if key not in networks:
+				networks[key] = load_network(job["graph"], job["nodes"], job["k"], seed=job["seed"])
+			g, network_title = networks[key]
+			if (queue_dir is not None and key != pool_key):
+				stack.close()
+				pool, pool_key = stack.enter_context(queue_pool(g, queue_dir)), key
+			elif (workers > 1 and key != pool_key):
+				stack.close()
+				pool, pool_key = stack.enter_context(replica_pool(g, workers)), key
+			W = presets[job["payoff"]] if isinstance(job["payoff"], str) else job["payoff"]
+			title = _job_title(job, network_title)
+			print("[Job {0}/{1}] {2}".format(number, len(jobs), title))
+			options = {}
+			if checkpoint_dir is not None:
+				options = {"checkpoint_dir": os.path.join(checkpoint_dir, "job_%03d" % number),
+							"checkpoint_every": checkpoint_every, "checkpoint_seconds": checkpoint_seconds}
+			means_arr = plot_time_series(g, W, job["turns"], job["init_coop"], job["beta"], job["games"],
+										job["choice_factor"], title, workers=workers, seed=job["seed"], pool=pool, cache=cache, **options)
+			plt.close("all")
+			p_arr.append(np.mean(means_arr))
+	return p_arr
+
+
+def main(argv=None):
+	"""
+	Parses the command line and runs the requested jobs
+	Parameters
+	----------
+	argv : list, optional
+		Command line arguments, sys.argv when omitted
+	"""
+	parser = argparse.ArgumentParser(description="Runs Prisoner's Dilemma simulations without prompts.")
+	parser.add_argument("--jobs", help="TOML or YAML file listing jobs, the flags below override its defaults")
+	parser.add_argument("--graph", choices=["ws", "er", "fb", "bfb", "gh", "2d"])
+	parser.add_argument("--nodes", type=int, help="players for ws and er, side of the grid for 2d")
+	parser.add_argument("--k", type=int, help="average edges per node for ws and er")
+	parser.add_argument("--games", type=int)
+	parser.add_argument("--turns", type=int)
+	parser.add_argument("--init-coop", dest="init_coop", type=float)
+	parser.add_argument("--choice-factor", dest="choice_factor", type=int, choices=[1, 2, 3])
+	parser.add_argument("--beta", type=float)
+	parser.add_argument("--payoff", help="name of a payoff preset: " + ", ".join(sorted(PAYOFF_PRESETS)) + " or one defined in the job file")
+	parser.add_argument("--seed", type=int)
+	parser.add_argument("--workers", type=int)
+	parser.add_argument("--checkpoint-dir", dest="checkpoint_dir", help="keep replica checkpoints here and resume from them")
+	parser.add_argument("--checkpoint-every", dest="checkpoint_every", type=int, help="steps between checkpoints")
+	parser.add_argument("--checkpoint-seconds", dest="checkpoint_seconds", type=float, help="seconds between checkpoints")
+	parser.add_argument("--cache", action="store_true", help="read the games of seeded jobs from the result cache and store new ones")
+	parser.add_argument("--queue-dir", dest="queue_dir", help="run the games on the workers of this shared work queue directory")
+	args = vars(parser.parse_args(argv))
+	job_file, workers, use_cache, queue_dir = args.pop("jobs"), args.pop("workers"), args.pop("cache"), args.pop("queue_dir")
+	checkpoints = {name: args.pop(name) for name in ("checkpoint_dir", "checkpoint_every", "checkpoint_seconds")}
+	flags = {key: value for key, value in args.items() if value is not None}
+
+	if job_file is None:
+		jobs, presets = [flags], PAYOFF_PRESETS
+	else:
+		config = _read_job_file(job_file)
+		defaults = dict(config.get("defaults", {}), **flags)
+		jobs = [dict(defaults, **job) for job in config.get("jobs", [])]
+		presets = dict(PAYOFF_PRESETS, **config.get("payoffs", {}))
+		if workers is None:
+			workers = config.get("workers")
+	try:
+		_check_payoffs(jobs, presets)
+	except ValueError as error:
+		parser.error(str(error))
+	p_arr = run_jobs(jobs, presets=presets, workers=workers or 1, cache=ResultCache() if use_cache else None,
+						queue_dir=queue_dir, **checkpoints)
+	for job, p in zip(jobs, p_arr):
+		print("{0}: overall average cooperation {1}%".format(_job_settings(job), round(p*100, 3)))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,308 @@
+"""
+This module is the benchmark harness of the simulation. It times one_replica_simulation, the
+payoff kernel the engines run (sparse product on CSR arrays, shifted sums on a Lattice), the
+reference _compute_all_payoffs, multi_replica_simulation and the density sweep on Watts-Strogatz and 2D grid
+networks of growing size (the grid both as CSR arrays and as a Lattice run by the stencil engine)
+and on the Facebook and GitHub networks, for each update rule. Every case
+runs in a fresh process so the reported peak RSS belongs to that case, and the results are stored
+as JSON so runs of different commits can be compared.
+
+Examples:
+
+	python benchmarks.py
+	python benchmarks.py --graphs ws 2d lattice --sizes 1000 10000 100000 1000000 --targets one_replica
+	python benchmarks.py --compare reports/benchmarks/bench_1a2b3c4.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import subprocess
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from csr_graph import to_csr, to_networkx
+from graph_cache import load_network, path, NETWORK_FILES
+from graph_generators import Lattice, watts_strogatz_csr, grid_csr, lattice_degree
+from profiling import _max_rss_kb
+
+BENCH_GRAPHS = ("ws", "2d", "lattice", "fb", "gh")
+BENCH_TARGETS = ("one_replica", "payoffs", "compute_all_payoffs", "multi_replica", "density")
+# Targets that do not depend on the update rule
+PAYOFF_TARGETS = ("payoffs", "compute_all_payoffs")
+# Sizes of the synthetic networks, the 2D grid and the lattice use the closest square
+BENCH_SIZES = (1000, 10000, 100000)
+BENCH_W = [[1, -0.2], [1.3, 0]]
+
+
+def _build_graph(graph, nodes, k):
+	"""
+	Builds the network of a case
+	Parameters
+	----------
+	graph : str
+		ws, 2d, lattice, fb or gh
+	nodes : int
+		Number of nodes of the synthetic networks, ignored for fb and gh
+	k : int
+		Average edges per node of the Watts-Strogatz network
+	Returns
+	-------
+	G : CSRGraph or Lattice
+	"""
+	if (graph == "ws"):
+		return watts_strogatz_csr(nodes, k, 0.1, seed=0)
+	elif (graph in ("2d", "lattice")):
+		side = int(round(math.sqrt(nodes)))
+		return grid_csr(side) if graph == "2d" else Lattice(side, side)
+	return to_csr(load_network(graph)[0])
+
+
+def _graph_size(G):
+	"""
+	Counts the nodes and CSR entries of a network without building CSR arrays for a Lattice
+	Parameters
+	----------
+	G : CSRGraph or Lattice
+	Returns
+	-------
+	nodes : int
+	nnz : int
+		Twice the number of edges
+	"""
+	if isinstance(G, Lattice):
+		return G.rows * G.cols, int(lattice_degree(G).sum())
+	return len(G.degree), len(G.indices)
+
+
+def _run_target(target, network, choice_factor, steps, options):
+	"""
+	Runs the timed part of a case
+	Parameters
+	----------
+	target : str
+		One of BENCH_TARGETS
+	network : CSRGraph or Lattice
+	choice_factor : int
+	steps : int
+	options : dict
+		replicas, workers and density_size of the run
+	Returns
+	-------
+	seconds : float
+	runs : int
+		Number of replicas simulated, each of them for steps steps
+	pairs : int
+		Number of (i, j) pairs evaluated: one per CSR entry and step for the synchronous rules and
+		the payoffs, one per node and step for the asynchronous rule, whose Monte Carlo step is N
+		elementary updates of one pair each
+	"""
+	from evolutionary_game_theory import (one_replica_simulation, multi_replica_simulation, _compute_all_payoffs, _count_coop_neighbors,
+										_payoffs_from_coop, _lattice_coop_neighbors)
+	from csr_graph import adjacency_matrix
+	from density_plots import _compute_cooperation_density_matrix
+	n, nnz = _graph_size(network)
+	W = np.asarray(BENCH_W, dtype=float)
+	if (target == "compute_all_payoffs"):
+		# The dict engine works on networkx graphs and strategy dicts, built outside the timing
+		G = to_networkx(to_csr(network))
+		strategy = {node: int(s) for node, s in zip(G.nodes, np.random.randint(0, 2, n))}
+		start = time.perf_counter()
+		for _ in range(steps):
+			_compute_all_payoffs(G, BENCH_W, strategy)
+		return time.perf_counter() - start, 1, nnz * steps
+	if (target == "payoffs"):
+		strategy = np.random.randint(0, 2, n).astype(np.int8)
+		if isinstance(network, Lattice):
+			strategy, degree = strategy.reshape(network.rows, network.cols), lattice_degree(network)
+			start = time.perf_counter()
+			for _ in range(steps):
+				_payoffs_from_coop(degree, W, strategy, _lattice_coop_neighbors(strategy, network.periodic))
+		else:
+			A = adjacency_matrix(network)
+			start = time.perf_counter()
+			for _ in range(steps):
+				_payoffs_from_coop(network.degree, W, strategy, _count_coop_neighbors(A, strategy))
+		return time.perf_counter() - start, 1, nnz * steps
+	start = time.perf_counter()
+	if (target == "one_replica"):
+		one_replica_simulation(network, BENCH_W, steps, 0.5, 0.1, choice_factor, None, early_stop=False)
+		runs = 1
+	elif (target == "multi_replica"):
+		multi_replica_simulation(network, BENCH_W, steps, 0.5, 0.1, options["replicas"], choice_factor, workers=options["workers"], seed=0)
+		runs = options["replicas"]
+	elif (target == "density"):
+		_compute_cooperation_density_matrix(network, 0.5, steps, options["replicas"], options["density_size"], 0.1, choice_factor,
+											workers=options["workers"], seed=0)
+		runs = options["replicas"] * options["density_size"]**2
+	else:
+		raise ValueError("Unknown target: " + str(target))
+	return time.perf_counter() - start, runs, (n if choice_factor == 3 else nnz) * steps * runs
+
+
+def _run_case(case):
+	"""
+	Builds the network and times one case, inside the process of the case
+	Parameters
+	----------
+	case : dict
+		target, graph, nodes, k, choice_factor, steps and the options of _run_target
+	Returns
+	-------
+	result : dict
+		The case with the network size, timing, rates and peak RSS
+	"""
+	np.random.seed(0)
+	network = _build_graph(case["graph"], case["nodes"], case["k"])
+	n, nnz = _graph_size(network)
+	result = dict(case, nodes=n, edges=nnz // 2)
+	with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+		# One warm-up step pays for imports, caches and the numba compilation
+		_run_target(case["target"], network, case["choice_factor"], 1, case)
+		seconds, runs, pairs = _run_target(case["target"], network, case["choice_factor"], case["steps"], case)
+	# Replica steps, so a sweep of many replicas compares with a single one
+	result.update(seconds=seconds, steps_per_sec=case["steps"] * runs / seconds, edges_per_sec=pairs / seconds,
+				peak_rss_kb=_max_rss_kb())
+	return result
+
+
+def _bench_cases(graphs, sizes, targets, choice_factors, steps, k, max_dict_nodes, options):
+	"""
+	Lists the cases of a run
+	Parameters
+	----------
+	graphs, sizes, targets, choice_factors : list
+		The combinations to run, sizes only apply to ws, 2d and lattice
+	steps : int
+	k : int
+	max_dict_nodes : int
+		Largest network given to the networkx based _compute_all_payoffs
+	options : dict
+		replicas, workers and density_size
+	Returns
+	-------
+	cases : list
+	"""
+	cases = []
+	for graph in graphs:
+		for nodes in (sizes if graph in ("ws", "2d", "lattice") else [None]):
+			for target in targets:
+				# Payoffs do not depend on the update rule
+				for choice_factor in ([None] if target in PAYOFF_TARGETS else choice_factors):
+					if (target == "compute_all_payoffs" and nodes is not None and nodes > max_dict_nodes):
+						continue
+					cases.append(dict(options, target=target, graph=graph, nodes=nodes, k=k, choice_factor=choice_factor, steps=steps))
+	return cases
+
+
+def _case_key(result):
+	"""
+	Identifies a case across result files
+	Parameters
+	----------
+	result : dict
+	Returns
+	-------
+	key : tuple
+	"""
+	return (result["target"], result["graph"], result["nodes"], result["choice_factor"])
+
+
+def _run_metadata():
+	"""
+	Describes the code and machine of a run
+	Returns
+	-------
+	metadata : dict
+	"""
+	try:
+		commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=path[0], capture_output=True, text=True).stdout.strip()
+	except OSError:
+		commit = ""
+	return {"commit": commit or "unknown", "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+			"numpy": np.__version__, "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def compare_results(old, new):
+	"""
+	Prints the speed-up of every case present in both runs
+	Parameters
+	----------
+	old, new : dict
+		Contents of two result files
+	"""
+	previous = {_case_key(result): result for result in old["results"]}
+	print("Compared with {0} ({1})".format(old["metadata"]["commit"], old["metadata"]["date"]))
+	for result in new["results"]:
+		before = previous.get(_case_key(result))
+		if before is not None:
+			print("{0:>20} {1:>3} {2:>8} cf={3}: {4:7.2f}x steps/sec, peak RSS {5} -> {6} kB".format(result["target"], result["graph"],
+				result["nodes"], result["choice_factor"], result["steps_per_sec"] / before["steps_per_sec"], before["peak_rss_kb"], result["peak_rss_kb"]))
+
+
+def run_benchmarks(cases):
+	"""
+	Runs every case in its own process
+	Parameters
+	----------
+	cases : list
+		Cases built by _bench_cases
+	Returns
+	-------
+	results : list
+	"""
+	results = []
+	for case in cases:
+		source = NETWORK_FILES.get(case["graph"])
+		if source is not None and not os.path.exists(os.path.normpath(path[0] + "/" + source[0])):
+			print("Skipping {0} on {1}, the network file is missing".format(case["target"], case["graph"]))
+			continue
+		with ProcessPoolExecutor(max_workers=1) as executor:
+			result = executor.submit(_run_case, case).result()
+		print("{0:>20} {1:>3} {2:>8} cf={3}: {4:10.2f} steps/sec {5:14.0f} edges/sec {6:>9} kB".format(result["target"], result["graph"],
+			result["nodes"], result["choice_factor"], result["steps_per_sec"], result["edges_per_sec"], result["peak_rss_kb"]))
+		results.append(result)
+	return results
+
+
+def main(argv=None):
+	"""
+	Parses the command line, runs the benchmarks and writes the result file
+	Parameters
+	----------
+	argv : list, optional
+		Command line arguments, sys.argv when omitted
+	"""
+	parser = argparse.ArgumentParser(description="Benchmarks the Prisoner's Dilemma simulation.")
+	parser.add_argument("--graphs", nargs="+", choices=BENCH_GRAPHS, default=list(BENCH_GRAPHS))
+	parser.add_argument("--sizes", nargs="+", type=int, default=list(BENCH_SIZES), help="nodes of the ws, 2d and lattice networks")
+	parser.add_argument("--targets", nargs="+", choices=BENCH_TARGETS, default=list(BENCH_TARGETS))
+	parser.add_argument("--choice-factors", dest="choice_factors", nargs="+", type=int, choices=[1, 2, 3], default=[1, 2])
+	parser.add_argument("--steps", type=int, default=10)
+	parser.add_argument("--k", type=int, default=4, help="average edges per node of the ws networks")
+	parser.add_argument("--replicas", type=int, default=2)
+	parser.add_argument("--workers", type=int, default=1)
+	parser.add_argument("--density-size", dest="density_size", type=int, default=3)
+	parser.add_argument("--max-dict-nodes", dest="max_dict_nodes", type=int, default=100000)
+	parser.add_argument("--output", help="result file, reports/benchmarks/bench_<commit>.json by default")
+	parser.add_argument("--compare", help="earlier result file to compare with")
+	args = parser.parse_args(argv)
+
+	options = {"replicas": args.replicas, "workers": args.workers, "density_size": args.density_size}
+	cases = _bench_cases(args.graphs, args.sizes, args.targets, args.choice_factors, args.steps, args.k, args.max_dict_nodes, options)
+	run = {"metadata": _run_metadata(), "results": run_benchmarks(cases)}
+	output = args.output or os.path.normpath(path[0] + "/reports/benchmarks/bench_{0}.json".format(run["metadata"]["commit"]))
+	os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+	with open(output, "w") as file:
+		json.dump(run, file, indent=1)
+	print("Results written to " + output)
+	if args.compare is not None:
+		with open(args.compare) as file:
+			compare_results(json.load(file), run)
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,240 @@
+"""
+This module contains functions to convert a network into compressed sparse row (CSR) arrays so the
+simulation engine can work with integer node IDs and NumPy arrays instead of networkx dicts.
+"""
+import sys
+import zlib
+import numpy as np
+import scipy.sparse as sp
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+CSRGraph = namedtuple("CSRGraph", ["indptr", "indices", "degree", "nodes"])
+CSRGraph.__doc__ = """
+Read-only CSR view of an undirected network
+Parameters
+----------
+indptr : array
+	Offsets into indices, the neighbors of node k are indices[indptr[k]:indptr[k+1]]
+indices : array
+	Concatenated neighbor lists using integer node IDs
+degree : array
+	Number of neighbors of each node
+nodes : sequence
+	Original node labels, node ID k corresponds to nodes[k]
+"""
+
+
+def to_csr(G):
+	"""
+	Converts a graph into CSR arrays with integer node IDs. Neighbors keep the order given by
+	G.neighbors so the CSR engine visits them in the same order as the networkx loop.
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or graph_generators.Lattice
+		If a CSRGraph is given it is returned unchanged, a Lattice is built with grid_csr
+	Returns
+	-------
+	csr : CSRGraph
+		CSR representation of the graph
+	"""
+	if isinstance(G, CSRGraph):
+		return G
+	from graph_generators import Lattice, grid_csr
+	if isinstance(G, Lattice):
+		return grid_csr(G.rows, G.cols, G.periodic)
+	nodes = list(G.nodes())
+	index = {node: k for k, node in enumerate(nodes)}
+	adj = G.adj
+	degree = np.fromiter((len(adj[node]) for node in nodes), dtype=np.int64, count=len(nodes))
+	indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+	np.cumsum(degree, out=indptr[1:])
+	indices = np.fromiter((index[j] for node in nodes for j in adj[node]), dtype=np.int32, count=int(indptr[-1]))
+	return CSRGraph(indptr, indices, degree, nodes)
+
+
+def csr_from_edges(edges):
+	"""
+	Builds CSR arrays straight from an edge list. Node IDs follow the order in which labels first
+	appear and neighbors keep the file order, as nx.read_edgelist would, so a cached graph gives the
+	same node IDs as the networkx one. Repeated edges are dropped
+	Parameters
+	----------
+	edges : array
+		Array of shape (E, 2) with the labels of the two ends of each edge
+	Returns
+	-------
+	csr : CSRGraph
+		CSR representation of the graph
+	"""
+	edges = np.asarray(edges).reshape(-1, 2)
+	labels, first, ids = np.unique(edges.ravel(), return_index=True, return_inverse=True)
+	order = np.argsort(first, kind="stable")
+	rank = np.empty(len(labels), dtype=np.int64)
+	rank[order] = np.arange(len(labels))
+	ids = rank[ids.ravel()].reshape(-1, 2)
+	# Both directions of each edge, interleaved so a stable sort keeps the file order per node
+	pairs = np.stack([ids, ids[:, ::-1]], axis=1).reshape(-1, 2)
+	pairs = pairs[np.sort(np.unique(pairs, axis=0, return_index=True)[1])]
+	pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+	n = len(labels)
+	degree = np.bincount(pairs[:, 0], minlength=n).astype(np.int64)
+	indptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(degree, out=indptr[1:])
+	return CSRGraph(indptr, pairs[:, 1].astype(np.int32), degree, labels[order])
+
+
+def to_networkx(csr):
+	"""
+	Rebuilds a networkx graph from a CSR graph for code that still needs networkx
+	Parameters
+	----------
+	csr : CSRGraph
+	Returns
+	-------
+	G : nx.Graph
+	"""
+	import networkx as nx
+	G = nx.Graph()
+	nodes = list(csr.nodes)
+	G.add_nodes_from(nodes)
+	sources = edge_sources(csr)
+	G.add_edges_from((nodes[i], nodes[j]) for i, j in zip(sources.tolist(), csr.indices.tolist()))
+	return G
+
+
+def edge_sources(csr):
+	"""
+	Expands indptr into the source node ID of every entry of indices
+	Parameters
+	----------
+	csr : CSRGraph
+	Returns
+	-------
+	sources : array
+		sources[e] is the node whose neighbor list contains indices[e]
+	"""
+	return np.repeat(np.arange(len(csr.degree), dtype=np.int32), csr.degree)
+
+
+def neighbor_slots(csr, nodes):
+	"""
+	Gathers the positions in indices of the neighbor lists of a set of nodes
+	Parameters
+	----------
+	csr : CSRGraph
+	nodes : array
+		Node IDs whose neighbor lists are wanted
+	Returns
+	-------
+	slots : array
+		Concatenated CSR positions, indices[slots] are the neighbors of nodes in order
+	"""
+	lengths = csr.degree[nodes]
+	starts = csr.indptr[nodes] - (np.cumsum(lengths) - lengths)
+	return np.repeat(starts, lengths) + np.arange(int(lengths.sum()))
+
+
+def graph_fingerprint(csr):
+	"""
+	Returns a checksum of the structure of a CSR graph, used to tell whether files derived from a
+	network (checkpoints, layouts) belong to it
+	Parameters
+	----------
+	csr : CSRGraph
+	Returns
+	-------
+	fingerprint : int
+		CRC-32 of indptr and indices
+	"""
+	return zlib.crc32(np.ascontiguousarray(csr.indices).tobytes(), zlib.crc32(np.ascontiguousarray(csr.indptr).tobytes()))
+
+
+def adjacency_matrix(csr):
+	"""
+	Builds the sparse adjacency matrix of a CSR graph
+	Parameters
+	----------
+	csr : CSRGraph
+	Returns
+	-------
+	A : scipy.sparse.csr_matrix
+		N x N matrix with a one for every edge
+	"""
+	n = len(csr.degree)
+	data = np.ones(len(csr.indices), dtype=np.float64)
+	return sp.csr_matrix((data, csr.indices, csr.indptr), shape=(n, n))
+
+
+def _csr_views(buffer, n, nnz):
+	"""
+	Lays out indptr, degree and indices over one buffer
+	Parameters
+	----------
+	buffer : memoryview
+	n : int
+		Number of nodes
+	nnz : int
+		Number of CSR entries (twice the number of edges)
+	Returns
+	-------
+	indptr, degree, indices : array
+		Views over the buffer
+	"""
+	indptr = np.ndarray((n + 1,), dtype=np.int64, buffer=buffer, offset=0)
+	degree = np.ndarray((n,), dtype=np.int64, buffer=buffer, offset=8 * (n + 1))
+	indices = np.ndarray((nnz,), dtype=np.int32, buffer=buffer, offset=8 * (2 * n + 1))
+	return indptr, degree, indices
+
+
+def share_csr(csr):
+	"""
+	Copies a CSR graph into one shared memory block so worker processes can attach to it without
+	each holding their own copy of the network
+	Parameters
+	----------
+	csr : CSRGraph
+	Returns
+	-------
+	shm : SharedMemory
+		The block, the caller must close and unlink it once every worker is done
+	handle : tuple
+		Picklable description of the block to pass to attach_csr
+	"""
+	n, nnz = len(csr.degree), len(csr.indices)
+	shm = shared_memory.SharedMemory(create=True, size=max(8 * (2 * n + 1) + 4 * nnz, 1))
+	indptr, degree, indices = _csr_views(shm.buf, n, nnz)
+	indptr[:] = csr.indptr
+	degree[:] = csr.degree
+	indices[:] = csr.indices
+	# Integer labels 0..n-1 (GitHub, Facebook) are rebuilt in the worker instead of being pickled
+	nodes = None if np.array_equal(np.asarray(csr.nodes), np.arange(n)) else list(csr.nodes)
+	return shm, (shm.name, n, nnz, nodes)
+
+
+def attach_csr(handle):
+	"""
+	Attaches to a CSR graph created by share_csr. The arrays are read-only views over the shared
+	block, so attaching costs no copy of the network
+	Parameters
+	----------
+	handle : tuple
+		Description returned by share_csr
+	Returns
+	-------
+	shm : SharedMemory
+		The attached block, it must stay referenced while the graph is in use
+	csr : CSRGraph
+		Read-only CSR graph backed by the shared block
+	"""
+	name, n, nnz, nodes = handle
+	if sys.version_info >= (3, 13):
+		shm = shared_memory.SharedMemory(name=name, track=False)
+	else:
+		# Pool workers share the resource tracker of the creating process, which owns the block
+		shm = shared_memory.SharedMemory(name=name)
+	arrays = _csr_views(shm.buf, n, nnz)
+	for array in arrays:
+		array.flags.writeable = False
+	indptr, degree, indices = arrays
+	return shm, CSRGraph(indptr, indices, degree, range(n) if nodes is None else nodes)
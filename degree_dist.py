@@ -1,32 +1,33 @@
+import os
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
-from evolutionary_game_theory import *
-from time_series_plots import *
-from density_plots import *
 from matplotlib.cm import ScalarMappable
+from graph_cache import load_edgelist, path
+from graph_stats import graph_statistics
 
-def makeClusteringGraph(g):
-    gc = g.subgraph(max(nx.connected_components(g)))
-    lcc = nx.clustering(gc)
+def makeClusteringGraph(stats):
+    # stats come from graph_stats.graph_statistics, a graph is analysed (or read from the cache) here
+    if not isinstance(stats, dict):
+        stats = graph_statistics(stats)
+    lcc = stats["clustering"]
     #cmap = plt.get_cmap('autumn')
-    #norm = plt.Normalize(0, max(lcc.values()))
-    #node_colors = [cmap(norm(lcc[node])) for node in gc.nodes]
+    #norm = plt.Normalize(0, max(lcc))
+    #node_colors = [cmap(norm(c)) for c in lcc]
     fig, (ax1, ax2) = plt.subplots(ncols=2, figsize=(12, 4))
     #nx.draw_spring(gc, node_color=node_colors, with_labels=False, ax=ax1)
     #fig.colorbar(ScalarMappable(cmap=cmap, norm=norm), label='Clustering', shrink=0.95, ax=ax1)
-    ax2.hist(lcc.values(), bins=10)
+    ax2.hist(lcc, bins=10)
     ax2.set_xlabel('Clustering')
     ax2.set_ylabel('Frequency')
     plt.tight_layout()
     plt.show()
 
 def makeDoubleHistogram(G1, G2):
-    degree_hist = nx.degree_histogram(G1) 
-    degree_hist = np.array(degree_hist, dtype=float)
-    degree_prob = degree_hist
-    degree_hist2 = nx.degree_histogram(G2) 
-    degree_hist2 = np.array(degree_hist2, dtype=float)
-    degree_prob2 = degree_hist2
+    stats1 = G1 if isinstance(G1, dict) else graph_statistics(G1)
+    stats2 = G2 if isinstance(G2, dict) else graph_statistics(G2)
+    degree_prob = np.array(stats1["degree_histogram"], dtype=float)
+    degree_prob2 = np.array(stats2["degree_histogram"], dtype=float)
     plt.loglog(np.arange(degree_prob2.shape[0]),degree_prob2,'r.')
     plt.loglog(np.arange(degree_prob.shape[0]),degree_prob,'b.')
     plt.xlabel('Degree (d)')
@@ -34,15 +35,19 @@ def makeDoubleHistogram(G1, G2):
     plt.title('Degree Distribution')
     plt.show()
     
-def findAvgClust(g):
-    avgClust = nx.average_clustering(g)
-    print(avgClust)
+def findAvgClust(stats):
+    if not isinstance(stats, dict):
+        stats = graph_statistics(stats)
+    # The error is a bound at 95% confidence when the clustering was sampled, 0 otherwise
+    print(stats["average_clustering"], "+/-", stats["clustering_error"])
 
-ws = nx.watts_strogatz_graph(1000, 4, 0.1)
-fb = nx.read_edgelist(os.path.normpath(path[0] + "/facebook_combined.txt.gz"), create_using = nx.Graph(), nodetype = int)
-gh = nx.read_edgelist(os.path.normpath(path[0] + "/musae_git_edges.csv"), delimiter=",", create_using = nx.Graph(), nodetype = int)
-bfb = nx.read_edgelist(os.path.normpath(path[0] + "/BFacebook.csv"), delimiter=",", create_using = nx.Graph(), nodetype = int)
-makeClusteringGraph(fb)
-makeClusteringGraph(bfb)
-makeClusteringGraph(gh)
-#findAvgClust(bfb)
+if __name__ == "__main__":
+    # Networks are loaded from the binary graph cache and analysed once, later runs read the cached statistics
+    ws = graph_statistics(nx.watts_strogatz_graph(1000, 4, 0.1))
+    fb = graph_statistics(load_edgelist(os.path.normpath(path[0] + "/facebook_combined.txt.gz")))
+    gh = graph_statistics(load_edgelist(os.path.normpath(path[0] + "/musae_git_edges.csv"), delimiter=","))
+    bfb = graph_statistics(load_edgelist(os.path.normpath(path[0] + "/BFacebook.csv"), delimiter=","), sample=100000)
+    makeClusteringGraph(fb)
+    makeClusteringGraph(bfb)
+    makeClusteringGraph(gh)
+    #findAvgClust(bfb)
@@ -2,15 +2,26 @@
 This module contains the necessary functions to plot a cooperation density plot
 """
 
+import os
+import json
+import logging
 import numpy as np
 import matplotlib.pyplot as plt
-from evolutionary_game_theory import multi_replica_simulation
+from contextlib import ExitStack
+from concurrent.futures import as_completed
+from replica_runner import run_replicas, replica_pool, _run_replica, _run_tasks
+from result_cache import graph_digest
+from work_queue import queue_pool
 
 
-def _compute_cooperation_density_matrix(G, x0, steps, replicas, size, beta):
+def _compute_cooperation_density_matrix(G, x0, steps, replicas, size, beta, choice_factor=1, workers=1, checkpoint_path=None, seed=None, cache=None,
+										adaptive=False, threshold=0.1, max_replicas=None, coarse=5, queue_dir=None):
 	"""
 	Compute the average cooperator density of each set contained in the following
-	 range of parameters T ∈ [0, 2] and S ∈ [-1, 1]
+	 range of parameters T ∈ [0, 2] and S ∈ [-1, 1]. With several workers every (S, T, replica)
+	 simulation is a separate task of one process pool. Each finished cell is appended to the
+	 checkpoint file, so an interrupted sweep started again with the same file only runs the
+	 missing cells
 	Parameters
 	----------
 	G : nx.Graph
@@ -24,20 +35,375 @@ def _compute_cooperation_density_matrix(G, x0, steps, replicas, size, beta):
 		Number of divisions per side, the plot will contain nxn games
 	beta : float
 		Parameter that models the importance of the difference between payoffs in a game
+	choice_factor : int, default 1
+		Choice of how nodes will decide to update their strategy
+	workers : int, default 1
+		Number of worker processes
+	checkpoint_path : str, optional
+		File where finished cells are recorded and read back when resuming
+	seed : int, optional
+		Root seed, each cell gets its own stream so resumed sweeps give the same matrix
+	cache : result_cache.ResultCache, optional
+		Replicas of a seeded sweep already simulated, with any number of workers, are read from it
+		instead of run again
+	adaptive : bool, default False
+		If True the grid is refined around the transitions only, see _adaptive_density_matrix
+	threshold : float, default 0.1
+		Density difference across a cell that makes the adaptive sweep split it
+	max_replicas : int, optional
+		Replicas the adaptive sweep can give a high-variance point, 4 * replicas when omitted
+	coarse : int, default 5
+		Points per side of the grid the adaptive sweep starts from
+	queue_dir : str, optional
+		Shared directory of a work_queue, the replicas are run by the workers polling it instead of
+		a local pool
 	Returns
 	-------
 	Z : array
 		Matrix of densities
 	"""
-	matrix = []
-	for S in np.linspace(-1, 1, size):
-		row = []
-		for T in np.linspace(0, 2, size):
-			W = np.array([[1, S], [T, 0]])
-			row.append(multi_replica_simulation(G, W, steps=steps, x0=x0,
-													beta=beta, replicas=replicas))
-		matrix.append(row)
-	return np.array(matrix)
+	if adaptive:
+		return _adaptive_density_matrix(G, x0, steps, replicas, size, beta, choice_factor, workers, checkpoint_path, seed, cache,
+										threshold, max_replicas, coarse, queue_dir)
+	params = {"x0": x0, "steps": steps, "replicas": replicas, "size": size, "beta": beta,
+			"choice_factor": choice_factor, "seed": seed}
+	Z = np.full((size, size), np.nan)
+	done = _load_density_checkpoint(checkpoint_path, params)
+	for (i, j), p in done.items():
+		Z[i, j] = p
+	cell_seeds = np.random.SeedSequence(seed).spawn(size * size)
+	pending = [(i, j) for i in range(size) for j in range(size) if (i, j) not in done]
+	S_values, T_values = np.linspace(-1, 1, size), np.linspace(0, 2, size)
+	# Without a seed the cell streams are new every time, nothing could be found again in the cache
+	cache = cache if seed is not None else None
+
+	if (workers == 1 and queue_dir is None):
+		for i, j in pending:
+			W = np.array([[1, S_values[i]], [T_values[j], 0]])
+			results = run_replicas(G, W, steps, x0, beta, replicas, choice_factor, seed=cell_seeds[i*size + j], cache=cache)
+			Z[i, j] = np.mean([p for p, _ in results])
+			_append_density_checkpoint(checkpoint_path, params, i, j, Z[i, j])
+		return Z
+
+	digest = graph_digest(G) if cache is not None else None
+	with (queue_pool(G, queue_dir) if queue_dir is not None else replica_pool(G, workers)) as pool:
+		futures = {}
+		cells = {cell: [None] * replicas for cell in pending}
+		for i, j in pending:
+			W = np.array([[1, S_values[i]], [T_values[j], 0]])
+			for r, child in enumerate(cell_seeds[i*size + j].spawn(replicas)):
+				key = cache.key(digest, W, steps, x0, beta, choice_factor, child) if cache is not None else None
+				entry = cache.get(key) if key is not None else None
+				if entry is not None:
+					cells[(i, j)][r] = entry["p"]
+					continue
+				task = (W, steps, x0, beta, choice_factor, None, child, {} if cache is None else {"return_state": True})
+				futures[pool.submit(_run_replica, task)] = (i, j, r, key)
+		for i, j in pending:
+			if all(p is not None for p in cells[(i, j)]):
+				Z[i, j] = np.mean(cells.pop((i, j)))
+				_append_density_checkpoint(checkpoint_path, params, i, j, Z[i, j])
+		for future in as_completed(futures):
+			i, j, r, key = futures[future]
+			result = future.result()
+			if key is not None:
+				cache.put(key, *result)
+			cells[(i, j)][r] = result[0]
+			if all(p is not None for p in cells[(i, j)]):
+				Z[i, j] = np.mean(cells.pop((i, j)))
+				_append_density_checkpoint(checkpoint_path, params, i, j, Z[i, j])
+	if futures and cache is not None:
+		cache.evict()
+	return Z
+
+
+def _adaptive_density_matrix(G, x0, steps, replicas, size, beta, choice_factor=1, workers=1, checkpoint_path=None, seed=None, cache=None,
+								threshold=0.1, max_replicas=None, coarse=5, queue_dir=None):
+	"""
+	Computes the same matrix as _compute_cooperation_density_matrix while simulating only part of
+	its points. A coarse grid of cells is simulated at its corners and a cell is split in four
+	(quadtree-style) while its corner densities differ by more than threshold, reusing the corners
+	already simulated. Points left inside flat cells are bilinearly interpolated from the corners of
+	the smallest cell holding them. A point whose replicas spread widely gets more replicas, doubling
+	until the standard error of its mean is below threshold / 2 or max_replicas is reached. Point
+	(i, j) draws from the same streams as in the uniform sweep, so simulated points match it
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	x0, steps, replicas, size, beta, choice_factor, workers, checkpoint_path, seed, cache, queue_dir :
+		As in _compute_cooperation_density_matrix, replicas being the replicas of every point
+	threshold : float, default 0.1
+		Largest difference of corner densities a cell is left unsplit with
+	max_replicas : int, optional
+		Replicas a high-variance point can grow to, 4 * replicas when omitted
+	coarse : int, default 5
+		Points per side of the initial grid
+	Returns
+	-------
+	Z : array
+		Matrix of densities
+	"""
+	max_replicas = 4 * replicas if max_replicas is None else max(max_replicas, replicas)
+	params = {"x0": x0, "steps": steps, "replicas": replicas, "size": size, "beta": beta, "choice_factor": choice_factor, "seed": seed,
+			"adaptive": {"threshold": threshold, "max_replicas": max_replicas, "coarse": coarse}}
+	# Mean density of each simulated point, the points of an earlier run come from the checkpoint
+	density = _load_density_checkpoint(checkpoint_path, params)
+	point_seeds = np.random.SeedSequence(seed).spawn(size * size)
+	S_values, T_values = np.linspace(-1, 1, size), np.linspace(0, 2, size)
+	cache = cache if seed is not None else None
+	digest = graph_digest(G) if cache is not None else None
+	edges = np.unique(np.round(np.linspace(0, size - 1, max(min(coarse, size), 2))).astype(int)).tolist()
+	cells = [(i0, i1, j0, j1) for i0, i1 in zip(edges[:-1], edges[1:]) for j0, j1 in zip(edges[:-1], edges[1:])]
+	if not cells:
+		# A single point is a cell whose four corners coincide
+		cells = [(0, 0, 0, 0)]
+	leaves = []
+	simulations = 0
+
+	with ExitStack() as stack:
+		pool = None
+		if queue_dir is not None:
+			pool = stack.enter_context(queue_pool(G, queue_dir))
+		elif (workers > 1):
+			pool = stack.enter_context(replica_pool(G, workers))
+		while cells:
+			corners = sorted({corner for cell in cells for corner in _cell_corners(cell)} - set(density))
+			simulations += _simulate_points(G, corners, density, point_seeds, size, S_values, T_values, x0, steps, beta, replicas, max_replicas,
+											threshold / 2, choice_factor, pool, cache, digest)
+			for i, j in corners:
+				_append_density_checkpoint(checkpoint_path, params, i, j, density[(i, j)])
+			split = []
+			for cell in cells:
+				values = [density[corner] for corner in _cell_corners(cell)]
+				children = _split_cell(cell)
+				if max(values) - min(values) > threshold and children:
+					split.extend(children)
+				else:
+					leaves.append(cell)
+			cells = split
+	if cache is not None and simulations:
+		cache.evict()
+	logging.info("Adaptive sweep: {0} of {1} points simulated with {2} simulations, {3} for the uniform grid".format(
+		len(density), size * size, simulations, size * size * replicas))
+	return _resample_density(density, leaves, size)
+
+
+def _cell_corners(cell):
+	"""
+	Lists the corner points of a cell
+	Parameters
+	----------
+	cell : tuple
+		(i0, i1, j0, j1), first and last row and column of the cell
+	Returns
+	-------
+	corners : list
+	"""
+	i0, i1, j0, j1 = cell
+	return [(i0, j0), (i0, j1), (i1, j0), (i1, j1)]
+
+
+def _split_cell(cell):
+	"""
+	Splits a cell at its middle row and column, a side without points between its corners is kept
+	Parameters
+	----------
+	cell : tuple
+		(i0, i1, j0, j1)
+	Returns
+	-------
+	children : list
+		Up to four cells sharing their edges, empty when the cell has no inner point left
+	"""
+	i0, i1, j0, j1 = cell
+	rows = [(i0, (i0 + i1) // 2), ((i0 + i1) // 2, i1)] if i1 - i0 > 1 else [(i0, i1)]
+	cols = [(j0, (j0 + j1) // 2), ((j0 + j1) // 2, j1)] if j1 - j0 > 1 else [(j0, j1)]
+	if (len(rows) == 1 and len(cols) == 1):
+		return []
+	return [(r0, r1, c0, c1) for r0, r1 in rows for c0, c1 in cols]
+
+
+def _simulate_points(G, points, density, point_seeds, size, S_values, T_values, x0, steps, beta, replicas, max_replicas, tolerance,
+					choice_factor, pool, cache, digest):
+	"""
+	Simulates a batch of points, giving replicas to every point and doubling the replicas of the
+	points whose mean has a standard error above tolerance, until max_replicas
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	points : list
+		(i, j) points to simulate
+	density : dict
+		Mean density of each point, the new points are added to it
+	point_seeds : list
+		SeedSequence of every point, replica k of point (i, j) draws from its k-th child
+	size : int
+	S_values, T_values : array
+	x0, steps, beta, choice_factor :
+		Parameters of the simulations
+	replicas : int
+	max_replicas : int
+	tolerance : float
+		Largest standard error of a point's mean that stops adding replicas
+	pool : ProcessPoolExecutor or None
+		Pool opened by replica_pool or work_queue.queue_pool, the simulations run in this process without one
+	cache : result_cache.ResultCache or None
+	digest : str or None
+		graph_digest of G when a cache is given
+	Returns
+	-------
+	simulations : int
+		Number of replicas run or read from the cache
+	"""
+	samples = {point: [] for point in points}
+	wanted = {point: replicas for point in points}
+	simulations = 0
+	while wanted:
+		tasks, owners = [], []
+		for (i, j), count in wanted.items():
+			W = np.array([[1, S_values[i]], [T_values[j], 0]])
+			parent = point_seeds[i*size + j]
+			for k in range(len(samples[(i, j)]), count):
+				# The k-th child of the point's SeedSequence, as spawn would give it
+				child = np.random.SeedSequence(parent.entropy, spawn_key=parent.spawn_key + (k,), pool_size=parent.pool_size)
+				tasks.append((W, steps, x0, beta, choice_factor, None, child, {}))
+				owners.append((i, j))
+		for point, p in zip(owners, _run_density_tasks(G, tasks, pool, cache, digest)):
+			samples[point].append(p)
+		simulations += len(tasks)
+		wanted = {}
+		for point, values in samples.items():
+			count = len(values)
+			if count < max_replicas and count > 1 and np.std(values, ddof=1) / np.sqrt(count) > tolerance:
+				wanted[point] = min(2 * count, max_replicas)
+	for point, values in samples.items():
+		density[point] = float(np.mean(values))
+	return simulations
+
+
+def _run_density_tasks(G, tasks, pool, cache, digest):
+	"""
+	Runs replica tasks of the sweep, reading the ones found in the cache
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	tasks : list
+		Task tuples of replica_runner._run_replica
+	pool : ProcessPoolExecutor or None
+	cache : result_cache.ResultCache or None
+	digest : str or None
+	Returns
+	-------
+	p : list
+		Mean density of each task
+	"""
+	p = [None] * len(tasks)
+	keys = [None] * len(tasks)
+	if cache is not None:
+		for k, (W, steps, x0, beta, choice_factor, _, child, _) in enumerate(tasks):
+			keys[k] = cache.key(digest, W, steps, x0, beta, choice_factor, child)
+			entry = cache.get(keys[k])
+			if entry is not None:
+				p[k] = entry["p"]
+	missing = [k for k in range(len(tasks)) if p[k] is None]
+	options = {} if cache is None else {"return_state": True}
+	runs = _run_tasks(G, [tasks[k][:7] + (options,) for k in missing], pool, 1, options)
+	for k, result in zip(missing, runs):
+		if cache is not None:
+			cache.put(keys[k], *result)
+		p[k] = result[0]
+	return p
+
+
+def _resample_density(density, leaves, size):
+	"""
+	Lays the simulated points of an adaptive sweep on the regular grid, interpolating the others
+	Parameters
+	----------
+	density : dict
+		Mean density of each simulated (i, j) point
+	leaves : list
+		Cells that were not split, the smallest cell holding a point interpolates it
+	size : int
+	Returns
+	-------
+	Z : array
+		Matrix of densities with shape (size, size)
+	"""
+	Z = np.full((size, size), np.nan)
+	for (i, j), p in density.items():
+		if i < size and j < size:
+			Z[i, j] = p
+	for i0, i1, j0, j1 in sorted(leaves, key=lambda cell: (cell[1] - cell[0]) * (cell[3] - cell[2])):
+		u = ((np.arange(i0, i1 + 1) - i0) / max(i1 - i0, 1))[:, None]
+		v = ((np.arange(j0, j1 + 1) - j0) / max(j1 - j0, 1))[None, :]
+		bilinear = ((1 - u) * (1 - v) * density[(i0, j0)] + (1 - u) * v * density[(i0, j1)] +
+					u * (1 - v) * density[(i1, j0)] + u * v * density[(i1, j1)])
+		block = Z[i0:i1 + 1, j0:j1 + 1]
+		np.copyto(block, bilinear, where=np.isnan(block))
+	return Z
+
+
+def _load_density_checkpoint(checkpoint_path, params):
+	"""
+	Reads the cells already finished by an earlier run of the same sweep
+	Parameters
+	----------
+	checkpoint_path : str or None
+		Checkpoint file, nothing is read when None or missing
+	params : dict
+		Parameters of the sweep, they must match the ones the file was written with
+	Returns
+	-------
+	done : dict
+		Mean density of each finished (row, column) cell
+	"""
+	done = {}
+	if checkpoint_path is None or not os.path.exists(checkpoint_path):
+		return done
+	with open(checkpoint_path) as file:
+		lines = file.read().splitlines()
+	if lines and json.loads(lines[0]) != params:
+		raise ValueError("Checkpoint " + checkpoint_path + " was written for different sweep parameters")
+	for line in lines[1:]:
+		try:
+			cell = json.loads(line)
+		except ValueError:
+			# A line cut short by the interruption, that cell runs again
+			continue
+		done[(cell["i"], cell["j"])] = cell["p"]
+	return done
+
+
+def _append_density_checkpoint(checkpoint_path, params, i, j, p):
+	"""
+	Records one finished cell, writing the parameters header first if the file is new
+	Parameters
+	----------
+	checkpoint_path : str or None
+		Checkpoint file, nothing is written when None
+	params : dict
+		Parameters of the sweep
+	i, j : int
+		Row (S) and column (T) of the cell
+	p : float
+		Mean density of the cell
+	"""
+	if checkpoint_path is None:
+		return
+	new = not os.path.exists(checkpoint_path) or os.path.getsize(checkpoint_path) == 0
+	if not new:
+		with open(checkpoint_path, 'rb') as file:
+			file.seek(-1, os.SEEK_END)
+			# Start on a fresh line after a record cut short by an interruption
+			new_line = file.read(1) != b"\n"
+	with open(checkpoint_path, 'a') as file:
+		if new:
+			file.write(json.dumps(params) + "\n")
+		elif new_line:
+			file.write("\n")
+		file.write(json.dumps({"i": i, "j": j, "p": float(p)}) + "\n")
+		file.flush()
 
 
 def _colormesh_coop(Z, title, ax, colorbar=False, saving_path=None):
@@ -70,7 +436,8 @@ def _colormesh_coop(Z, title, ax, colorbar=False, saving_path=None):
 		plt.savefig(saving_path, dpi=300)
 
 
-def plot_cooperation_density_plot(G, x0, steps, replicas, size, beta, ax, title=None, colorbar=False, saving_path=None):
+def plot_cooperation_density_plot(G, x0, steps, replicas, size, beta, ax, title=None, colorbar=False, saving_path=None, choice_factor=1, workers=1, checkpoint_path=None, seed=None,
+									cache=None, adaptive=False, threshold=0.1, max_replicas=None, queue_dir=None):
 	"""
 	Plots the density plot of cooperators
 	Parameters
@@ -93,6 +460,26 @@ def plot_cooperation_density_plot(G, x0, steps, replicas, size, beta, ax, title=
 		If true plots the color bar
 	saving_path : str, optional
 		If its given the figure will be saved in the given path
+	choice_factor : int, default 1
+		Choice of how nodes will decide to update their strategy
+	workers : int, default 1
+		Number of worker processes
+	checkpoint_path : str, optional
+		File used to resume an interrupted sweep
+	seed : int, optional
+		Root seed of the sweep
+	cache : result_cache.ResultCache, optional
+		Result cache of the replicas of seeded sweeps
+	adaptive : bool, default False
+		If True only the points near the transitions are simulated and the others interpolated
+	threshold : float, default 0.1
+		Density difference across a cell that makes the adaptive sweep refine it
+	max_replicas : int, optional
+		Replicas the adaptive sweep can give a high-variance point
+	queue_dir : str, optional
+		Shared directory of a work_queue whose workers run the replicas
 	"""
-	Z = _compute_cooperation_density_matrix(G=G, x0=x0, steps=steps, replicas=replicas, size=size, beta=beta)
+	Z = _compute_cooperation_density_matrix(G=G, x0=x0, steps=steps, replicas=replicas, size=size, beta=beta,
+											choice_factor=choice_factor, workers=workers, checkpoint_path=checkpoint_path, seed=seed, cache=cache,
+											adaptive=adaptive, threshold=threshold, max_replicas=max_replicas, queue_dir=queue_dir)
 	_colormesh_coop(Z=Z, title=title, ax=ax, colorbar=colorbar, saving_path=saving_path)
\ No newline at end of file
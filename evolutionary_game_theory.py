@@ -4,15 +4,25 @@ a Fermi rule approximation strategy on a given network.
 """
 import os
 import numpy as np
-import matplotlib.patches as mpatches
-import random
-import matplotlib.pyplot as plt
-import networkx as nx
-import logging
+import math
 import time
-import csv
-from decimal import *
+import logging
 from collections import deque
+from scipy.special import expit
+try:
+	from numba import njit
+except ImportError:
+	# Without numba the asynchronous kernel runs as plain Python, with the same results but slowly
+	def njit(*args, **kwargs):
+		return lambda function: function
+from csr_graph import to_csr, edge_sources, neighbor_slots, adjacency_matrix, graph_fingerprint
+from graph_generators import Lattice, GridLabels, lattice_shift, lattice_unshift, lattice_valid
+from metrics_writer import MetricsWriter, truncate_metrics
+from node_state import write_influence_table, SnapshotWriter, truncate_snapshots
+from replica_checkpoint import save_checkpoint, load_checkpoint
+from frame_renderer import graph_layout, render_frame, frame_file, _edge_segments, FILM_DIR
+from profiling import NULL_PROFILER
+from rng_streams import CounterStreams, make_rng, step_rng, draw_ranges
 
 def _count_coop(strategies):
 	"""
@@ -53,20 +63,109 @@ def _fermi_updating_rule(wi, wj, beta):
 	# *: i: cooperator, j: defector		| 0.5001358823 or 50.01358823%
 	# *: i: defector, j: cooperator		| 0.4998815882 or 49.98815882%
 	# *: i: defector, j: defector		| 0.5 or 50%
-	# bug: CANNOT HANDLE LARGE NUMBERS BUT DECIMAL SLOWS DOWN PROGRAM A LOT
-	t1 = time.time()
-	chance = 1 / (1 + Decimal(np.e) ** Decimal((-beta * (wj - wi))))
-	t2 = time.time()
-	if (t2 - t1 > 1):
-		logging.warning("Chance Time: " + str(t2-t1))
-	return chance
+	# info: expit is the logistic function evaluated in float64 without overflow for large
+	# info: payoff differences. It agrees with the former Decimal(np.e) ** x evaluation within
+	# info: 1e-15 absolute, the float64 rounding of a probability in [0, 1].
+	return float(expit(beta * (wj - wi)))
 
 
-def one_replica_simulation(G, W, steps, x0, beta, choice_factor, title):
+def one_replica_simulation(G, W, steps, x0, beta, choice_factor, title, engine="csr", fermi_table=False, incremental=False, metrics_path=None, keep_series=True,
+							early_stop=True, convergence_window=None, convergence_epsilon=1e-3, profiler=None, rng=None, influence_format="csv",
+							snapshot_path=None, snapshot_every=None, checkpoint_path=None, checkpoint_every=None, checkpoint_seconds=None,
+							frame_renderer=None, return_state=False):
 	"""
 	Runs one replica simulation of the evolutionary game theory simulation
 	Parameters
 	----------
+	G : nx.Graph, CSRGraph or graph_generators.Lattice
+	W : array
+		Payoff matrix
+	steps : int
+		Number of epochs to run
+	x0 : float
+		Proportion of initial nodes using cooperative strategy
+	beta : float
+		Parameter that models the importance of the difference in Fermi updating rule
+	choice_factor : int
+		Choice of how nodes will decide to update their strategy: 1 payoff difference, 2 popularity,
+		3 asynchronous payoff difference (random sequential updates, CSR engine only)
+	title : string
+		title for video frame filenames and the influence table, if None no table is written
+	engine : str, default "csr"
+		"csr" runs the array engine, "dict" runs the original networkx/dict loop and "lattice" the
+		stencil engine. A Lattice runs on the stencil engine unless it is converted with to_csr
+	fermi_table : bool, default False
+		If True the CSR engine gathers Fermi probabilities from a precomputed lookup table, when the
+		degrees of the network keep it small enough
+	incremental : bool, default False
+		If True the CSR engine updates cooperating-neighbor counts only around nodes that changed
+		strategy instead of recomputing every payoff, and with choice_factor 1 only scores the
+		neighbors of boundary nodes, giving the same run as a full recomputation
+	metrics_path : str, optional
+		File where the CSR engine streams per-step metrics, see metrics_writer.read_metrics
+	keep_series : bool, default True
+		If False the CSR engine does not keep the time series in memory and returns an empty deque
+	early_stop : bool, default True
+		If True the CSR engine stops as soon as every node has the same strategy and fills the rest
+		of the time series with that proportion, which is exactly what the remaining steps would give
+	convergence_window : int, optional
+		If given the CSR engine also stops once the proportion of cooperators stayed within
+		convergence_epsilon over this many steps, repeating the last proportion afterwards. It
+		needs early_stop, a ValueError is raised otherwise
+	convergence_epsilon : float, default 1e-3
+		Largest spread of the proportion of cooperators over the window considered converged
+	profiler : profiling.Profiler, optional
+		Receives the per-step and per-phase timings and counters of the CSR engine
+	rng : int, np.random.SeedSequence, np.random.Generator or rng_streams.CounterStreams, optional
+		Source of every random number of the run, an unseeded Generator when omitted. The same
+		seed gives the same run, and with CounterStreams each step can be regenerated on its own
+	influence_format : str, default "csv"
+		"csv" or "npz", format of the influence table written to reports/influence
+	snapshot_path : str, optional
+		File where the CSR engine writes the node state every snapshot_every steps and at the end,
+		see node_state.read_snapshots
+	snapshot_every : int, optional
+		Steps between snapshots, only the final state is written when omitted
+	checkpoint_path : str, optional
+		File where the CSR engine saves its full state, see replica_checkpoint. If the file exists the
+		run resumes from it and gives the same results as an uninterrupted run
+	checkpoint_every : int, optional
+		Steps between checkpoints
+	checkpoint_seconds : float, optional
+		Seconds between checkpoints, the final state is always saved when checkpoint_path is given
+	frame_renderer : frame_renderer.FrameRenderer, optional
+		If given the CSR engine queues video frames of the steps it wants, rendered in the background
+	return_state : bool, default False
+		If True a third value holds the final strategy and influences arrays, e.g. for result_cache
+	Returns
+	-------
+	p : float
+		mean proportion of nodes using cooperative strategy
+	time_series : deque
+		time series of the proportion of nodes using cooperative strategy in each time step
+	state : dict
+		Only with return_state, the final strategy and influences arrays in node ID order
+	"""
+	# Options shared by the array engines
+	options = dict(metrics_path=metrics_path, keep_series=keep_series, early_stop=early_stop, convergence_window=convergence_window,
+				convergence_epsilon=convergence_epsilon, profiler=profiler, rng=rng, influence_format=influence_format, snapshot_path=snapshot_path,
+				snapshot_every=snapshot_every, checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every,
+				checkpoint_seconds=checkpoint_seconds, frame_renderer=frame_renderer, return_state=return_state)
+	if (engine == "lattice" or (engine == "csr" and isinstance(G, Lattice))):
+		return _lattice_replica_simulation(G, W, steps, x0, beta, choice_factor, title, **options)
+	elif (engine == "csr"):
+		return _csr_replica_simulation(G, W, steps, x0, beta, choice_factor, title, fermi_table=fermi_table, incremental=incremental, **options)
+	elif (engine == "dict"):
+		return _dict_replica_simulation(G, W, steps, x0, beta, choice_factor, title, rng=rng, influence_format=influence_format, return_state=return_state)
+	raise ValueError("Unknown engine: " + str(engine))
+
+
+def _dict_replica_simulation(G, W, steps, x0, beta, choice_factor, title, rng=None, influence_format="csv", return_state=False):
+	"""
+	Runs one replica keeping strategies, payoffs and influences in dicts and walking the networkx
+	adjacency on every step. Kept as the reference implementation of the CSR engine.
+	Parameters
+	----------
 	G : nx.Graph
 	W : array
 		Payoff matrix
@@ -77,22 +176,36 @@ def one_replica_simulation(G, W, steps, x0, beta, choice_factor, title):
 	beta : float
 		Parameter that models the importance of the difference in Fermi updating rule
 	choice_factor : int
-		Choice of how nodes will decide to update their strategy
+		Choice of how nodes will decide to update their strategy, 1 or 2
 	title : string
 		title for video frame filenames
+	rng : int, np.random.SeedSequence, np.random.Generator or CounterStreams, optional
+		Source of the random numbers, drawn in the same order as the CSR engine
+	influence_format : str, default "csv"
+		Format of the influence table
+	return_state : bool, default False
+		If True the final strategies and influences are also returned as arrays in G.nodes order
 	Returns
 	-------
 	p : float
 		mean proportion of nodes using cooperative strategy
 	time_series : deque
 		time series of the proportion of nodes using cooperative strategy in each time step
+	state : dict
+		Only with return_state, the final strategy and influences arrays in node ID order
 	"""
+	if (choice_factor == 3):
+		raise ValueError("Choice factor 3 (asynchronous updates) only runs on the CSR engine")
+	elif (choice_factor != 1 and choice_factor != 2):
+		raise ValueError("Unknown choice factor: " + str(choice_factor))
+	rng = make_rng(rng)
 	# Gets an exact proportion of initial nodes using cooperative strategy
 	# Cooperator : 0, Defector : 1
 	time_series = deque()
 	strategy = dict(zip(G.nodes(), G.nodes()))
 	strategy = strategy.fromkeys(strategy, 1)
-	coop_nodes = random.sample(list(G.nodes()), int(G.number_of_nodes()*x0))
+	nodes = list(G.nodes())
+	coop_nodes = [nodes[k] for k in step_rng(rng, -1).choice(len(nodes), int(len(nodes)*x0), replace=False)]
 	coop_dict = dict(zip(coop_nodes, coop_nodes))
 	coop_dict = coop_dict.fromkeys(coop_dict, 0)
 	strategy.update(coop_dict)
@@ -102,15 +215,17 @@ def one_replica_simulation(G, W, steps, x0, beta, choice_factor, title):
 	if (choice_factor == 1):
 		for t in range(steps):
 			payoffs = _compute_all_payoffs(G, W, strategy)
-			print("--Step " + str(t))
+			logging.debug("Step %d", t)
 			time_series.append(_count_coop(strategy))
 			new_strategy = dict()
+			# One draw per (i, j) pair, generated as a block for the whole step
+			draws = iter(step_rng(rng, t).random(sum(len(neighbors) for neighbors in G.adj.values())).tolist())
 			for i in G.nodes():
 				j_List = list(G.neighbors(i))
 				for j in j_List:
 					wi, wj = payoffs.get(i), payoffs.get(j)
 					pij = _fermi_updating_rule(wi, wj, beta)  # probability of node i to adopt j strategy
-					if np.random.random() < pij:
+					if next(draws) < pij:
 						new_strategy[i] = strategy.get(j)
 			strategy.update(new_strategy)  # update strategies
 			# TODO: Make this an option in the beginning that can be toggled on or off.
@@ -119,7 +234,7 @@ def one_replica_simulation(G, W, steps, x0, beta, choice_factor, title):
 	elif (choice_factor == 2):
 		for t in range(steps):
 			payoffs = _compute_all_payoffs(G, W, strategy)
-			print("--Step " + str(t))
+			logging.debug("Step %d", t)
 			time_series.append(_count_coop(strategy))
 			new_strategy = dict()
 			for i in G.nodes():
@@ -136,13 +251,1155 @@ def one_replica_simulation(G, W, steps, x0, beta, choice_factor, title):
 			strategy.update(new_strategy)  # update strategies
 			# TODO: Make this an option in the beginning that can be toggled on or off.
 			#_decide_to_make_photos(t, steps, G, strategy, title)
-	_make_influence_csv(title, strategy, G, influenceList)
+	if title is not None:
+		_make_influence_csv(title, strategy, G, influenceList, influence_format)
 	p = np.mean(time_series)
+	if return_state:
+		nodes = list(G.nodes())
+		return p, time_series, {"strategy": np.fromiter((strategy[node] for node in nodes), dtype=np.int8, count=len(nodes)),
+								"influences": np.fromiter((influenceList[node] for node in nodes), dtype=np.int64, count=len(nodes))}
+	return p, time_series
+
+def _csr_replica_simulation(G, W, steps, x0, beta, choice_factor, title, fermi_table=False, incremental=False, metrics_path=None, keep_series=True,
+							early_stop=True, convergence_window=None, convergence_epsilon=1e-3, profiler=None, rng=None, influence_format="csv",
+							snapshot_path=None, snapshot_every=None, checkpoint_path=None, checkpoint_every=None, checkpoint_seconds=None,
+							frame_renderer=None, return_state=False):
+	"""
+	Runs one replica on CSR arrays. The graph is converted once, strategies and payoffs are NumPy
+	arrays indexed by integer node IDs and every step is evaluated over all edges at once.
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	W : array
+		Payoff matrix
+	steps : int
+		Number of epochs to run
+	x0 : float
+		Proportion of initial nodes using cooperative strategy
+	beta : float
+		Parameter that models the importance of the difference in Fermi updating rule
+	choice_factor : int
+		Choice of how nodes will decide to update their strategy
+	title : string
+		title for video frame filenames
+	fermi_table : bool, default False
+		If True Fermi probabilities are gathered from a table built by _fermi_lookup_table
+	incremental : bool, default False
+		If True cooperating-neighbor counts are kept between steps and adjusted in O(degree) around
+		each node that changed strategy, giving the same payoffs as a full recomputation. With
+		choice_factor 1 the update also skips the nodes whose neighbors all share their strategy,
+		which cannot change, and only draws the random numbers of the remaining boundary nodes, so
+		a step costs O(boundary edges) instead of O(E) and the run is the same as a full one. The
+		popularity update still scores every edge, as every node credits the neighbor it copies
+	metrics_path : str, optional
+		File where the cooperation fraction, number of flips and mean payoff of every step are
+		streamed with a MetricsWriter
+	keep_series : bool, default True
+		If False the time series is not kept in memory and an empty deque is returned
+	early_stop : bool, default True
+		If True the run stops on an absorbing state (all cooperators or all defectors)
+	convergence_window : int, optional
+		If given the run also stops once the proportion of cooperators stayed within
+		convergence_epsilon over this many steps, only with early_stop
+	convergence_epsilon : float, default 1e-3
+		Largest spread of the proportion of cooperators over the window considered converged
+	profiler : profiling.Profiler, optional
+		Timed phases are payoffs, update_rule, commit and io, counters are edges (pairs i, j
+		evaluated), flips and rng_draws. Without a profiler NULL_PROFILER does nothing
+	rng : int, np.random.SeedSequence, np.random.Generator or CounterStreams, optional
+		Source of the random numbers, each step draws all of its numbers as one block
+	influence_format : str, default "csv"
+		Format of the influence table
+	snapshot_path : str, optional
+		File where a SnapshotWriter records the strategies and influences at the start of every
+		snapshot_every-th step and after the last step
+	snapshot_every : int, optional
+		Steps between snapshots
+	checkpoint_path : str, optional
+		File saved every checkpoint_every steps or checkpoint_seconds seconds and at the end. An
+		existing checkpoint of the same parameters is resumed, truncating the metrics and snapshot
+		files to the steps it covers
+	checkpoint_every : int, optional
+		Steps between checkpoints
+	checkpoint_seconds : float, optional
+		Seconds between checkpoints
+	frame_renderer : frame_renderer.FrameRenderer, optional
+		Receives the strategies at the start of the steps it wants a frame of
+	return_state : bool, default False
+		If True the final strategy and influences arrays are also returned
+	Returns
+	-------
+	p : float
+		mean proportion of nodes using cooperative strategy
+	time_series : deque
+		time series of the proportion of nodes using cooperative strategy in each time step
+	state : dict
+		Only with return_state, the final strategy and influences arrays in node ID order
+	"""
+	csr = to_csr(G)
+	engine = _CSRSteps(csr, W, beta, choice_factor, fermi_table, incremental)
+	# The graph fingerprint stops a checkpoint from resuming on a rewired network of the same size
+	params = {"n": engine.n, "graph": graph_fingerprint(csr)}
+	return _drive_replica(engine, params, steps, x0, title, metrics_path=metrics_path, keep_series=keep_series, early_stop=early_stop,
+						convergence_window=convergence_window, convergence_epsilon=convergence_epsilon, profiler=profiler, rng=rng,
+						influence_format=influence_format, snapshot_path=snapshot_path, snapshot_every=snapshot_every,
+						checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every, checkpoint_seconds=checkpoint_seconds,
+						frame_renderer=frame_renderer, return_state=return_state)
+
+
+def _drive_replica(engine, params, steps, x0, title, metrics_path=None, keep_series=True, early_stop=True, convergence_window=None,
+					convergence_epsilon=1e-3, profiler=None, rng=None, influence_format="csv", snapshot_path=None, snapshot_every=None,
+					checkpoint_path=None, checkpoint_every=None, checkpoint_seconds=None, frame_renderer=None, return_state=False):
+	"""
+	Runs the steps of one replica on an array engine. The engine holds the network and applies the
+	update rule, this loop keeps the time series and handles early stops, checkpoints, snapshots,
+	metrics, frames and the profiler the same way for every engine
+	Parameters
+	----------
+	engine : _CSRSteps or _LatticeSteps
+	params : dict
+		Entries of the checkpoint parameters that identify the network, the ones of the run are added
+	steps, x0, title, metrics_path, keep_series, early_stop, convergence_window, convergence_epsilon,
+	profiler, rng, influence_format, snapshot_path, snapshot_every, checkpoint_path, checkpoint_every,
+	checkpoint_seconds, frame_renderer, return_state :
+		As in _csr_replica_simulation
+	Returns
+	-------
+	p : float
+		mean proportion of nodes using cooperative strategy
+	time_series : deque
+		time series of the proportion of nodes using cooperative strategy in each time step
+	state : dict
+		Only with return_state, the final strategy and influences arrays in node ID order
+	"""
+	if convergence_window and not early_stop:
+		raise ValueError("convergence_window stops the run early, it needs early_stop=True")
+	n = engine.n
+	# Cooperator : 0, Defector : 1
+	time_series = deque()
+	coop_sum = 0.0
+	strategy = np.ones(engine.shape, dtype=np.int8)
+	rng = make_rng(rng)
+	strategy.reshape(-1)[step_rng(rng, -1).choice(n, int(n*x0), replace=False)] = 0
+	influences = np.zeros(engine.shape, dtype=np.int64)
+	recent = deque(maxlen=convergence_window) if convergence_window else None
+	params = dict(params, steps=steps, x0=x0, beta=engine.beta, choice_factor=engine.choice_factor, W=engine.W.tolist(), keep_series=keep_series,
+				early_stop=early_stop, convergence_window=convergence_window, convergence_epsilon=convergence_epsilon)
+	start = 0
+	if checkpoint_path is not None and os.path.exists(checkpoint_path):
+		checkpoint = load_checkpoint(checkpoint_path, params)
+		start, coop_sum, rng, recent = checkpoint["step"], checkpoint["coop_sum"], checkpoint["rng"], checkpoint["recent"]
+		strategy, influences = checkpoint["strategy"].reshape(engine.shape), checkpoint["influences"].reshape(engine.shape)
+		time_series.extend(checkpoint["time_series"].tolist())
+		# Output written after the checkpoint belongs to steps that are about to run again
+		if metrics_path is not None:
+			truncate_metrics(metrics_path, start)
+		if snapshot_path is not None:
+			truncate_snapshots(snapshot_path, len(range(0, start, snapshot_every)) if snapshot_every else 0)
+	engine.start(strategy)
+	metrics = MetricsWriter(metrics_path, mode='ab' if start else 'wb') if metrics_path is not None else None
+	snapshots = SnapshotWriter(snapshot_path, n, mode='ab' if start else 'wb') if snapshot_path is not None else None
+	prof = profiler if profiler is not None else NULL_PROFILER
+	last_checkpoint = time.perf_counter()
+
+	for t in range(start, steps):
+		prof.begin_step(t)
+		with prof.phase("io"):
+			if snapshots is not None and snapshot_every and t % snapshot_every == 0:
+				snapshots.write(t, strategy.reshape(-1), influences.reshape(-1))
+			if checkpoint_path is not None and t > start and ((checkpoint_every and t % checkpoint_every == 0) or
+															(checkpoint_seconds and time.perf_counter() - last_checkpoint >= checkpoint_seconds)):
+				if metrics is not None:
+					metrics.flush()
+				save_checkpoint(checkpoint_path, params, t, strategy.reshape(-1), influences.reshape(-1), time_series, coop_sum, recent, rng)
+				last_checkpoint = time.perf_counter()
+			if frame_renderer is not None and frame_renderer.wants(t, steps):
+				frame_renderer.submit(strategy.reshape(-1), t, title)
+		coop_fraction = engine.coop_fraction(strategy)
+		if recent is not None:
+			recent.append(coop_fraction)
+		if early_stop and (coop_fraction == 0 or coop_fraction == 1 or _window_converged(recent, convergence_epsilon)):
+			# The remaining steps are filled in without simulating them
+			remaining = steps - t
+			coop_sum += coop_fraction * remaining
+			if keep_series:
+				time_series.extend([coop_fraction] * remaining)
+			mean_payoff = engine.absorb(strategy, influences, remaining, metrics is not None)
+			if metrics is not None:
+				with prof.phase("io"):
+					for k in range(t, steps):
+						metrics.write(k, coop_fraction, 0, mean_payoff)
+			prof.end_step()
+			break
+		coop_sum += coop_fraction
+		if keep_series:
+			time_series.append(coop_fraction)
+		strategy, flips, mean_payoff, entries, draws = engine.step(t, rng, strategy, influences, prof, metrics is not None)
+		if metrics is not None:
+			with prof.phase("io"):
+				metrics.write(t, coop_fraction, flips, mean_payoff)
+		if prof.enabled:
+			prof.count("edges", entries)
+			prof.count("flips", flips)
+			prof.count("rng_draws", draws)
+		prof.end_step()
+	if metrics is not None:
+		metrics.close()
+	if snapshots is not None:
+		snapshots.write(steps, strategy.reshape(-1), influences.reshape(-1))
+		snapshots.close()
+	if checkpoint_path is not None:
+		save_checkpoint(checkpoint_path, params, steps, strategy.reshape(-1), influences.reshape(-1), time_series, coop_sum, recent, rng)
+	if title is not None:
+		engine.write_table(title, strategy, influences, influence_format)
+	p = np.mean(time_series) if keep_series else coop_sum / steps
+	if return_state:
+		return p, time_series, {"strategy": strategy.reshape(-1), "influences": influences.reshape(-1)}
 	return p, time_series
 
+
+class _CSRSteps:
+	"""
+	Update rules of the CSR engine, run by _drive_replica. Every step is evaluated over all CSR
+	entries at once, or over the entries of the boundary nodes with the incremental update
+	Parameters
+	----------
+	csr : CSRGraph
+	W : array
+		Payoff matrix
+	beta : float
+	choice_factor : int
+		1 payoff difference, 2 popularity, 3 asynchronous payoff difference
+	fermi_table : bool
+		If True Fermi probabilities are gathered from a table built by _fermi_lookup_table
+	incremental : bool
+		If True cooperating-neighbor counts are kept between steps, see _csr_replica_simulation
+	"""
+
+	def __init__(self, csr, W, beta, choice_factor, fermi_table, incremental):
+		if choice_factor not in (1, 2, 3):
+			raise ValueError("Unknown choice factor: " + str(choice_factor))
+		self.csr, self.beta, self.choice_factor, self.incremental = csr, beta, choice_factor, incremental
+		self.n = len(csr.degree)
+		self.shape = (self.n,)
+		self.W = np.asarray(W, dtype=float)
+		self.A = adjacency_matrix(csr)
+		self.sources = edge_sources(csr)
+		# For updating probability based on payoff difference and beta or on popularity:
+		self.edge_beta = beta if choice_factor == 1 else csr.degree[csr.indices] / (self.n - 1)
+		self.table = _fermi_lookup_table(csr.degree, self.W, beta, choice_factor) if fermi_table else None
+		self.boundary_update = incremental and choice_factor == 1
+
+	def start(self, strategy):
+		"""
+		Counts the cooperating neighbors of the initial or resumed strategies
+		"""
+		self.coop = _count_coop_neighbors(self.A, strategy)
+		if self.boundary_update:
+			self.boundary = _boundary_mask(self.csr.degree, strategy, self.coop)
+			self.defectors = int(np.count_nonzero(strategy))
+
+	def coop_fraction(self, strategy):
+		"""
+		Proportion of cooperators of strategy
+		"""
+		return (self.n - self.defectors) / self.n if self.boundary_update else _count_coop_array(strategy)
+
+	def absorb(self, strategy, influences, remaining, measure):
+		"""
+		Adds the influences of the remaining steps of a stopped run, which all repeat strategy
+		Parameters
+		----------
+		strategy : array
+		influences : array
+			Updated in place
+		remaining : int
+			Number of steps not simulated
+		measure : bool
+			If True the mean payoff is returned
+		Returns
+		-------
+		mean_payoff : float or None
+		"""
+		csr, W = self.csr, self.W
+		if (self.choice_factor == 2):
+			if not self.incremental:
+				self.coop = _count_coop_neighbors(self.A, strategy)
+			pij = _edge_probabilities(self.coop, csr.degree, W, strategy, self.sources, csr.indices, self.edge_beta, self.table)
+			influences += remaining * _popularity_influence_step(csr, strategy, pij, self.sources)
+		if measure:
+			return _payoffs_from_coop(csr.degree, W, strategy, _count_coop_neighbors(self.A, strategy)).mean()
+		return None
+
+	def step(self, t, rng, strategy, influences, prof, measure):
+		"""
+		Runs step t
+		Parameters
+		----------
+		t : int
+		rng : np.random.Generator or CounterStreams
+			Source of the run, the step draws from step_rng(rng, t)
+		strategy : array
+			Strategy at the start of the step, the asynchronous and boundary updates change it in place
+		influences : array
+			Updated in place
+		prof : profiling.Profiler
+		measure : bool
+			If True the number of flips and the mean payoff are returned
+		Returns
+		-------
+		strategy : array
+			Strategy after the step
+		flips : int
+			Nodes that changed strategy, counted when measure or profiling
+		mean_payoff : float or None
+			Mean payoff at the start of the step
+		entries : int
+			Pairs (i, j) evaluated
+		draws : int
+			Random numbers drawn
+		"""
+		csr, W, sources, targets = self.csr, self.W, self.sources, self.csr.indices
+		if (self.choice_factor == 3):
+			# The asynchronous kernel changes strategy and coop in place
+			mean_payoff = _payoffs_from_coop(csr.degree, W, strategy, self.coop).mean() if measure else None
+			with prof.phase("update_rule"):
+				flips = _async_fermi_update(csr, strategy, self.coop, W, self.beta, step_rng(rng, t))
+			return strategy, flips, mean_payoff, self.n, 3 * self.n
+		if self.boundary_update:
+			with prof.phase("update_rule"):
+				changed, values, entries, drawn = _boundary_fermi_update(csr, strategy, self.coop, self.boundary, W, self.beta, self.table, step_rng(rng, t), sources)
+			mean_payoff = _payoffs_from_coop(csr.degree, W, strategy, self.coop).mean() if measure else None
+			with prof.phase("commit"):
+				self.defectors += 2 * int(values.sum()) - len(values)
+				_flip_boundary_nodes(csr, self.coop, self.boundary, strategy, changed, values)
+			return strategy, len(changed), mean_payoff, entries, drawn
+		if not self.incremental:
+			with prof.phase("payoffs"):
+				self.coop = _count_coop_neighbors(self.A, strategy)
+		with prof.phase("update_rule"):
+			pij = _edge_probabilities(self.coop, csr.degree, W, strategy, sources, targets, self.edge_beta, self.table)
+			if (self.choice_factor == 1):
+				new_strategy = _csr_fermi_update(strategy, pij, step_rng(rng, t).random(len(targets)), sources, targets)
+			else:
+				new_strategy = _csr_popularity_update(csr, strategy, pij, influences, sources)
+		flips = int(np.count_nonzero(new_strategy != strategy)) if measure or prof.enabled else 0
+		mean_payoff = _payoffs_from_coop(csr.degree, W, strategy, self.coop).mean() if measure else None
+		if self.incremental:
+			with prof.phase("commit"):
+				_update_coop_neighbors(csr, self.coop, strategy, new_strategy)
+		return new_strategy, flips, mean_payoff, len(targets), len(targets) if self.choice_factor == 1 else 0
+
+	def write_table(self, title, strategy, influences, table_format):
+		"""
+		Writes the influence table of the run
+		"""
+		_make_csr_influence_csv(title, self.csr, strategy, influences, table_format)
+
+
+def _csr_fermi_update(strategy, pij, draws, sources, targets):
+	"""
+	Payoff difference update: every neighbor j of i is accepted with probability pij and, as in the
+	dict loop, the last accepted neighbor of each node sets its new strategy
+	Parameters
+	----------
+	strategy : array
+		Strategy of each node ID with shape (N,), or (K, N) for K replicas
+	pij : array
+		Probability of each CSR entry, shape (E,) or (K, E)
+	draws : array
+		Uniform random numbers with the shape of pij
+	sources : array
+		Source node ID of every CSR entry
+	targets : array
+		Neighbor node ID of every CSR entry
+	Returns
+	-------
+	new_strategy : array
+		Strategy of each node ID after the step
+	"""
+	n, edges = strategy.shape[-1], len(targets)
+	replica, entry = np.divmod(np.flatnonzero(draws < pij), edges)
+	# Entries are sorted by (replica, source), so the last one of each run is the last accepted
+	keys = replica * n + sources[entry]
+	last = np.ones(len(keys), dtype=bool)
+	last[:-1] = keys[1:] != keys[:-1]
+	new_strategy = strategy.copy()
+	new_strategy.reshape(-1)[keys[last]] = strategy.reshape(-1)[replica[last] * n + targets[entry[last]]]
+	return new_strategy
+
+
+def _csr_popularity_update(csr, strategy, pij, influences, sources):
+	"""
+	Popularity update: every node copies the neighbor with the highest adoption probability. The
+	maximum of each neighbor list is found with one segmented reduction over the CSR entries and
+	ties go to the last neighbor, as when the dict loop overwrote probj[pij]
+	Parameters
+	----------
+	csr : CSRGraph
+	strategy : array
+		Strategy of each node ID with shape (N,), or (K, N) for K replicas
+	pij : array
+		Probability of each CSR entry, shape (E,) or (K, E)
+	influences : array
+		Number of times each node was copied, with the shape of strategy, updated in place
+	sources : array
+		Source node ID of every CSR entry
+	Returns
+	-------
+	new_strategy : array
+		Strategy of each node ID after the step
+	"""
+	new_strategy = strategy.copy()
+	n, edges = strategy.shape[-1], len(sources)
+	if (edges == 0):
+		return new_strategy
+	# Isolated nodes own no entries, so the starts of the other nodes delimit every segment
+	connected = np.flatnonzero(csr.degree)
+	segment_max = np.full(strategy.shape, -np.inf)
+	segment_max[..., connected] = np.maximum.reduceat(pij, csr.indptr[connected], axis=-1)
+	replica, entry = np.divmod(np.flatnonzero(pij == segment_max[..., sources]), edges)
+	keys = replica * n + sources[entry]
+	last = np.ones(len(keys), dtype=bool)
+	last[:-1] = keys[1:] != keys[:-1]
+	chosen = replica[last] * n + csr.indices[entry[last]]
+	influences += np.bincount(chosen, minlength=strategy.size).reshape(strategy.shape)
+	new_strategy.reshape(-1)[keys[last]] = strategy.reshape(-1)[chosen]
+	return new_strategy
+
+
+def _window_converged(recent, epsilon):
+	"""
+	Tells whether the proportion of cooperators stayed within epsilon over a full window
+	Parameters
+	----------
+	recent : deque or None
+		Proportions of the last steps, bounded by the window length
+	epsilon : float
+		Largest spread considered converged
+	Returns
+	-------
+	converged : bool
+	"""
+	if recent is None or len(recent) < recent.maxlen:
+		return False
+	return max(recent) - min(recent) <= epsilon
+
+
+def _popularity_influence_step(csr, strategy, pij, sources):
+	"""
+	Counts the influences one popularity step would add. On an absorbing or frozen state every
+	later step copies the same neighbors, so the count of the skipped steps is a multiple of it
+	Parameters
+	----------
+	csr : CSRGraph
+	strategy : array
+		Strategy of each node ID with shape (N,), or (K, N) for K replicas
+	pij : array
+		Probability of each CSR entry
+	sources : array
+		Source node ID of every CSR entry
+	Returns
+	-------
+	increment : array
+		Influences added by one step, with the shape of strategy
+	"""
+	increment = np.zeros(strategy.shape, dtype=np.int64)
+	_csr_popularity_update(csr, strategy, pij, increment, sources)
+	return increment
+
+
+def _async_fermi_update(csr, strategy, coop, W, beta, rng):
+	"""
+	Runs one Monte Carlo step of asynchronous (random sequential) updates: N times a random node i
+	picks a random neighbor j and adopts its strategy with the Fermi probability. The random numbers
+	are drawn in blocks here so the compiled kernel and the pure-Python fallback give the same run
+	Parameters
+	----------
+	csr : CSRGraph
+	strategy : array
+		Strategy of each node ID, updated in place
+	coop : array
+		Number of cooperating neighbors of each node ID, updated in place
+	W : array
+		Matrix payoff
+	beta : float
+		Parameter that models the importance of a payoff difference
+	rng : np.random.Generator
+	Returns
+	-------
+	flips : int
+		Number of elementary updates that changed a strategy
+	"""
+	n = len(strategy)
+	nodes = rng.integers(0, n, n)
+	picks = rng.random(n)
+	draws = rng.random(n)
+	return _async_monte_carlo_step(csr.indptr, csr.indices, csr.degree, strategy, coop, W, beta, nodes, picks, draws)
+
+
+@njit(cache=True)
+def _async_monte_carlo_step(indptr, indices, degree, strategy, coop, W, beta, nodes, picks, draws):
+	"""
+	Elementary updates of one Monte Carlo step, compiled with numba when it is installed. Payoffs
+	are read from the cooperating-neighbor counts, which are adjusted around i as soon as it changes
+	strategy, so every update costs O(degree)
+	Parameters
+	----------
+	indptr, indices, degree : array
+		CSR arrays of the network
+	strategy : array
+		Strategy of each node ID, updated in place
+	coop : array
+		Number of cooperating neighbors of each node ID, updated in place
+	W : array
+		Matrix payoff
+	beta : float
+		Parameter that models the importance of a payoff difference
+	nodes : array
+		Node i of each elementary update
+	picks : array
+		Uniform numbers choosing the neighbor j of each update
+	draws : array
+		Uniform numbers deciding each adoption
+	Returns
+	-------
+	flips : int
+		Number of elementary updates that changed a strategy
+	"""
+	flips = 0
+	for k in range(len(nodes)):
+		i = nodes[k]
+		if (degree[i] == 0):
+			continue
+		j = indices[indptr[i] + int(picks[k] * degree[i])]
+		if (strategy[i] == strategy[j]):
+			continue
+		wi = W[strategy[i], 0] * coop[i] + W[strategy[i], 1] * (degree[i] - coop[i])
+		wj = W[strategy[j], 0] * coop[j] + W[strategy[j], 1] * (degree[j] - coop[j])
+		x = -beta * (wj - wi)
+		pij = 0.0 if x > 700.0 else 1.0 / (1.0 + math.exp(x))
+		if (draws[k] < pij):
+			# i turning cooperator adds one to each neighbor's count, turning defector removes one
+			delta = 1.0 if strategy[j] == 0 else -1.0
+			strategy[i] = strategy[j]
+			for e in range(indptr[i], indptr[i+1]):
+				coop[indices[e]] += delta
+			flips += 1
+	return flips
+
+
+def _lattice_replica_simulation(lattice, W, steps, x0, beta, choice_factor, title, metrics_path=None, keep_series=True, early_stop=True,
+								convergence_window=None, convergence_epsilon=1e-3, profiler=None, rng=None, influence_format="csv",
+								snapshot_path=None, snapshot_every=None, checkpoint_path=None, checkpoint_every=None, checkpoint_seconds=None,
+								frame_renderer=None, return_state=False):
+	"""
+	Runs one replica on a 2D grid without any adjacency structure. Strategies, payoffs and
+	influences are (rows, cols) arrays and the four neighbors of every node are read by shifting
+	them, so memory stays at a few arrays of N values. With the same rng it gives the same run as
+	the CSR engine on to_csr(lattice), neighbors being visited in LATTICE_DIRECTIONS order
+	Parameters
+	----------
+	lattice : graph_generators.Lattice
+	W : array
+		Payoff matrix
+	steps : int
+		Number of epochs to run
+	x0 : float
+		Proportion of initial nodes using cooperative strategy
+	beta : float
+		Parameter that models the importance of the difference in Fermi updating rule
+	choice_factor : int
+		Choice of how nodes will decide to update their strategy, the asynchronous update (3) picks
+		one node at a time and runs on the CSR engine instead
+	title : string
+		title for video frame filenames and the influence table
+	metrics_path, keep_series, early_stop, convergence_window, convergence_epsilon, profiler, rng,
+	influence_format, snapshot_path, snapshot_every, checkpoint_path, checkpoint_every,
+	checkpoint_seconds, frame_renderer, return_state :
+		As in _csr_replica_simulation
+	Returns
+	-------
+	p : float
+		mean proportion of nodes using cooperative strategy
+	time_series : deque
+		time series of the proportion of nodes using cooperative strategy in each time step
+	state : dict
+		Only with return_state, the final strategy and influences arrays in node ID order
+	"""
+	if (choice_factor == 3):
+		return _csr_replica_simulation(to_csr(lattice), W, steps, x0, beta, choice_factor, title, metrics_path=metrics_path, keep_series=keep_series,
+										early_stop=early_stop, convergence_window=convergence_window, convergence_epsilon=convergence_epsilon,
+										profiler=profiler, rng=rng, influence_format=influence_format, snapshot_path=snapshot_path,
+										snapshot_every=snapshot_every, checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every,
+										checkpoint_seconds=checkpoint_seconds, frame_renderer=frame_renderer, return_state=return_state)
+	engine = _LatticeSteps(lattice, W, beta, choice_factor)
+	params = {"n": engine.n, "lattice": list(lattice)}
+	return _drive_replica(engine, params, steps, x0, title, metrics_path=metrics_path, keep_series=keep_series, early_stop=early_stop,
+						convergence_window=convergence_window, convergence_epsilon=convergence_epsilon, profiler=profiler, rng=rng,
+						influence_format=influence_format, snapshot_path=snapshot_path, snapshot_every=snapshot_every,
+						checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every, checkpoint_seconds=checkpoint_seconds,
+						frame_renderer=frame_renderer, return_state=return_state)
+
+
+class _LatticeSteps:
+	"""
+	Update rules of the stencil engine, run by _drive_replica on (rows, cols) arrays
+	Parameters
+	----------
+	lattice : graph_generators.Lattice
+	W : array
+		Payoff matrix
+	beta : float
+	choice_factor : int
+		1 payoff difference or 2 popularity
+	"""
+
+	def __init__(self, lattice, W, beta, choice_factor):
+		if (choice_factor != 1 and choice_factor != 2):
+			raise ValueError("Unknown choice factor: " + str(choice_factor))
+		self.lattice, self.beta, self.choice_factor = lattice, beta, choice_factor
+		self.shape, self.periodic = (lattice.rows, lattice.cols), lattice.periodic
+		self.n = lattice.rows * lattice.cols
+		self.W = np.asarray(W, dtype=float)
+		self.valid = lattice_valid(lattice)
+		self.degree = self.valid.sum(axis=0, dtype=np.int64)
+		self.edges = int(self.degree.sum())
+		# The draws of the CSR engine are laid out node by node, the same slots in the (rows, cols, 4) order
+		self.slots = None if self.periodic else self.valid.transpose(1, 2, 0)
+		self.neighbor_beta = [lattice_shift(self.degree, d, self.periodic) / (self.n - 1) for d in range(4)] if choice_factor == 2 else None
+
+	def start(self, strategy):
+		"""
+		Nothing is kept between steps, every payoff is recomputed from the shifted strategies
+		"""
+
+	def coop_fraction(self, strategy):
+		"""
+		Proportion of cooperators of strategy
+		"""
+		return _count_coop_array(strategy.reshape(-1))
+
+	def _payoffs(self, strategy):
+		return _payoffs_from_coop(self.degree, self.W, strategy, _lattice_coop_neighbors(strategy, self.periodic))
+
+	def absorb(self, strategy, influences, remaining, measure):
+		"""
+		As in _CSRSteps.absorb
+		"""
+		payoffs = self._payoffs(strategy)
+		if (self.choice_factor == 2):
+			increment = np.zeros(self.shape, dtype=np.int64)
+			_lattice_popularity_update(strategy, payoffs, self.valid, self.neighbor_beta, increment, self.periodic)
+			influences += remaining * increment
+		return payoffs.reshape(-1).mean() if measure else None
+
+	def step(self, t, rng, strategy, influences, prof, measure):
+		"""
+		As in _CSRSteps.step
+		"""
+		with prof.phase("payoffs"):
+			payoffs = self._payoffs(strategy)
+		with prof.phase("update_rule"):
+			if (self.choice_factor == 1):
+				if self.slots is None:
+					draws = step_rng(rng, t).random(self.edges).reshape(self.shape + (4,))
+				else:
+					draws = np.zeros(self.shape + (4,))
+					draws[self.slots] = step_rng(rng, t).random(self.edges)
+				new_strategy = _lattice_fermi_update(strategy, payoffs, self.beta, draws, self.valid, self.periodic)
+			else:
+				new_strategy = _lattice_popularity_update(strategy, payoffs, self.valid, self.neighbor_beta, influences, self.periodic)
+		flips = int(np.count_nonzero(new_strategy != strategy)) if measure or prof.enabled else 0
+		return new_strategy, flips, payoffs.reshape(-1).mean() if measure else None, self.edges, self.edges if self.choice_factor == 1 else 0
+
+	def write_table(self, title, strategy, influences, table_format):
+		"""
+		Writes the influence table of the run, nodes labelled by their (row, col)
+		"""
+		write_influence_table(title, GridLabels(self.lattice.rows, self.lattice.cols), strategy.reshape(-1), self.degree.reshape(-1),
+							influences.reshape(-1), table_format)
+
+
+def _lattice_coop_neighbors(strategy, periodic):
+	"""
+	Counts the cooperating neighbors of every node of a lattice with four shifted sums
+	Parameters
+	----------
+	strategy : array
+		Strategy of each node with shape (rows, cols)
+	periodic : bool
+	Returns
+	-------
+	coop : array
+		Number of cooperating neighbors, as float64 like _count_coop_neighbors
+	"""
+	cooperators = (1 - strategy).astype(np.float64)
+	coop = lattice_shift(cooperators, 0, periodic)
+	for d in range(1, 4):
+		coop += lattice_shift(cooperators, d, periodic)
+	return coop
+
+
+def _lattice_fermi_update(strategy, payoffs, beta, draws, valid, periodic):
+	"""
+	Payoff difference update on a lattice: the neighbor in each direction is accepted with its Fermi
+	probability and, as in _csr_fermi_update, the last accepted direction sets the new strategy
+	Parameters
+	----------
+	strategy : array
+		Strategy of each node with shape (rows, cols)
+	payoffs : array
+	beta : float
+	draws : array
+		Uniform random numbers of shape (rows, cols, 4), one per node and direction
+	valid : array
+		Output of lattice_valid
+	periodic : bool
+	Returns
+	-------
+	new_strategy : array
+	"""
+	new_strategy = strategy.copy()
+	for d in range(4):
+		accepted = valid[d] & (draws[..., d] < _fermi_probabilities(payoffs, lattice_shift(payoffs, d, periodic), beta))
+		new_strategy[accepted] = lattice_shift(strategy, d, periodic)[accepted]
+	return new_strategy
+
+
+def _lattice_popularity_update(strategy, payoffs, valid, neighbor_beta, influences, periodic):
+	"""
+	Popularity update on a lattice: every node copies the neighbor with the highest adoption
+	probability, ties going to the last direction as in _csr_popularity_update
+	Parameters
+	----------
+	strategy : array
+		Strategy of each node with shape (rows, cols)
+	payoffs : array
+	valid : array
+		Output of lattice_valid
+	neighbor_beta : list
+		Beta of each direction, the degree of the neighbor / (N - 1)
+	influences : array
+		Number of times each node was copied, updated in place
+	periodic : bool
+	Returns
+	-------
+	new_strategy : array
+	"""
+	best = np.full(strategy.shape, -np.inf)
+	chosen = np.full(strategy.shape, -1, dtype=np.int8)
+	for d in range(4):
+		pij = _fermi_probabilities(payoffs, lattice_shift(payoffs, d, periodic), neighbor_beta[d])
+		take = valid[d] & (pij >= best)
+		best[take] = pij[take]
+		chosen[take] = d
+	new_strategy = strategy.copy()
+	for d in range(4):
+		copied = chosen == d
+		new_strategy[copied] = lattice_shift(strategy, d, periodic)[copied]
+		# Each copy is credited back to the neighbor it came from
+		influences += lattice_unshift(copied.astype(np.int64), d, periodic)
+	return new_strategy
+
+
+def lockstep_replica_simulation(G, W, steps, x0, beta, replicas, choice_factor, titles=None, rng=None, fermi_table=False, early_stop=True):
+	"""
+	Advances several replicas of one parameter set together. Strategies are kept in a (K, N) matrix,
+	so every step scores all replicas with one sparse product and draws all Fermi acceptances at
+	once, which amortises the graph traversal and the Python overhead over the replicas
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	W : array
+		Payoff matrix
+	steps : int
+		Number of epochs to run
+	x0 : float
+		Proportion of initial nodes using cooperative strategy
+	beta : float
+		Parameter that models the importance of the difference in Fermi updating rule
+	replicas : int
+		Number of replicas K
+	choice_factor : int
+		Choice of how nodes will decide to update their strategy
+	titles : list, optional
+		Title of each replica for its influence csv, no csv is written when omitted
+	rng : int, np.random.SeedSequence, np.random.Generator or CounterStreams, optional
+		Generator shared by the replicas. With CounterStreams replica k draws from stream k, so
+		each replica gets the numbers one_replica_simulation would give it with for_replica(k)
+	fermi_table : bool, default False
+		If True Fermi probabilities are gathered from a table built by _fermi_lookup_table
+	early_stop : bool, default True
+		If True the run stops once every replica reached an absorbing state
+	Returns
+	-------
+	results : list
+		(p, time_series) of each replica, as returned by replica_runner.run_replicas
+	"""
+	csr = to_csr(G)
+	n = len(csr.degree)
+	W = np.asarray(W, dtype=float)
+	A = adjacency_matrix(csr)
+	sources = edge_sources(csr)
+	targets = csr.indices
+	rng = make_rng(rng)
+	# Cooperator : 0, Defector : 1
+	time_series = [deque() for _ in range(replicas)]
+	strategy = np.ones((replicas, n), dtype=np.int8)
+	for k in range(replicas):
+		strategy[k, _lockstep_rng(rng, -1, k).choice(n, int(n*x0), replace=False)] = 0
+	influences = np.zeros((replicas, n), dtype=np.int64)
+	edge_beta = beta if choice_factor == 1 else csr.degree[targets] / (n - 1)
+	table = _fermi_lookup_table(csr.degree, W, beta, choice_factor) if fermi_table else None
+
+	for t in range(steps):
+		coop_fractions = (n - np.count_nonzero(strategy, axis=1)) / n
+		coop = _count_coop_neighbors(A, strategy)
+		pij = _edge_probabilities(coop, csr.degree, W, strategy, sources, targets, edge_beta, table)
+		if early_stop and np.all((coop_fractions == 0) | (coop_fractions == 1)):
+			for k, coop_fraction in enumerate(coop_fractions):
+				time_series[k].extend([coop_fraction] * (steps - t))
+			if (choice_factor == 2):
+				influences += (steps - t) * _popularity_influence_step(csr, strategy, pij, sources)
+			break
+		for k, coop_fraction in enumerate(coop_fractions):
+			time_series[k].append(coop_fraction)
+		if (choice_factor == 1):
+			if isinstance(rng, CounterStreams):
+				draws = np.stack([rng.generator(t, k).random(len(targets)) for k in range(replicas)])
+			else:
+				draws = rng.random(pij.shape)
+			strategy = _csr_fermi_update(strategy, pij, draws, sources, targets)
+		elif (choice_factor == 2):
+			strategy = _csr_popularity_update(csr, strategy, pij, influences, sources)
+		else:
+			raise ValueError("Lockstep replicas support choice factors 1 and 2, not " + str(choice_factor))
+	if titles is not None:
+		for k in range(replicas):
+			_make_csr_influence_csv(titles[k], csr, strategy[k], influences[k])
+	return [(np.mean(series), series) for series in time_series]
+
+
+def _lockstep_rng(rng, step, replica):
+	"""
+	Returns the generator of one replica at one step of a lockstep run
+	Parameters
+	----------
+	rng : np.random.Generator or CounterStreams
+	step : int
+		Time step, -1 for the initial strategies
+	replica : int
+	Returns
+	-------
+	rng : np.random.Generator
+		The shared generator, or the stream of the replica for CounterStreams
+	"""
+	if isinstance(rng, CounterStreams):
+		return rng.generator(step, replica)
+	return rng
+
+
+def _count_coop_array(strategy):
+	"""
+	Counts the portion of nodes with cooperative strategy in a strategy array
+	Parameters
+	----------
+	strategy : array
+		Strategy of each node ID (0 for cooperator, 1 for defector)
+	Returns
+	-------
+	proportion_coop : float
+		Proportion of nodes using a cooperative strategy
+	"""
+	return (len(strategy) - int(np.count_nonzero(strategy))) / len(strategy)
+
+
+def _fermi_probabilities(wi, wj, beta):
+	"""
+	Float64 version of the Fermi updating rule evaluated over arrays of payoffs. expit clips the
+	logistic function internally, so large payoff differences give 0 or 1 instead of overflowing
+	Parameters
+	----------
+	wi : array
+		Payoffs of the individuals i
+	wj : array
+		Payoffs of the individuals j
+	beta : float or array
+		Parameter that models the importance of a payoff difference
+	Returns
+	-------
+	pij : array
+		Probabilities of each individual i adopting the strategy of j
+	"""
+	return expit(beta * (wj - wi))
+
+
+def _fermi_lookup_table(degree, W, beta, choice_factor, max_entries=2**22):
+	"""
+	Precomputes the Fermi probability for every pair of payoff classes. A payoff class is a
+	(degree, strategy, cooperating neighbors) triple, which fully determines a node's payoff, so the
+	hot loop only has to gather table[class_i, class_j]. The number of classes grows with the sum of
+	the distinct degrees, which makes the table practical for lattices and Watts-Strogatz networks
+	but not for heavy-tailed networks such as Facebook or GitHub, where no table is built and the
+	probabilities are computed with expit. Both give the same probabilities bit for bit.
+	Parameters
+	----------
+	degree : array
+		Degree of each node ID
+	W : array
+		Matrix payoff
+	beta : float
+		Parameter that models the importance of a payoff difference, unused when choice_factor is 2
+	choice_factor : int
+		With 2 the beta of each class is its degree / (N - 1), as in the popularity update
+	max_entries : int, default 2**22
+		Largest table built, a larger one is skipped with a warning
+	Returns
+	-------
+	table : tuple or None
+		(probabilities, node_base), None when the table would exceed max_entries. probabilities is
+		the matrix of probabilities indexed by payoff class and node_base the first class of each
+		node ID, the class of node i being node_base[i] + strategy[i] * (degree[i] + 1) + cooperating_neighbors[i]
+	"""
+	W = np.asarray(W, dtype=float)
+	degrees, node_degree = np.unique(degree, return_inverse=True)
+	sizes = 2 * (degrees + 1)
+	if (int(sizes.sum())**2 > max_entries):
+		logging.warning("Fermi lookup table would need " + str(int(sizes.sum())**2) + " entries, using expit instead")
+		return None
+	base = np.zeros(len(degrees), dtype=np.int64)
+	np.cumsum(sizes[:-1], out=base[1:])
+	class_degree = np.repeat(degrees, sizes)
+	offset = np.arange(len(class_degree)) - np.repeat(base, sizes)
+	class_strategy = (offset > class_degree).astype(np.int64)
+	class_coop = offset - class_strategy * (class_degree + 1)
+	class_payoff = _payoffs_from_coop(class_degree, W, class_strategy, class_coop)
+	class_beta = beta if choice_factor == 1 else class_degree / (len(degree) - 1)
+	table = _fermi_probabilities(class_payoff[:, None], class_payoff[None, :], class_beta)
+	return table, base[node_degree]
+
+
+def _edge_probabilities(coop, degree, W, strategy, sources, targets, edge_beta, table=None):
+	"""
+	Computes the probability of every node adopting the strategy of each of its neighbors
+	Parameters
+	----------
+	coop : array
+		Number of cooperating neighbors of each node ID
+	degree : array
+		Degree of each node ID
+	W : array
+		Matrix payoff
+	strategy : array
+		Strategy of each node ID with shape (N,), or (K, N) for K replicas
+	sources : array
+		Source node ID of every CSR entry
+	targets : array
+		Neighbor node ID of every CSR entry
+	edge_beta : float or array
+		Beta of the Fermi rule, per CSR entry for the popularity update
+	table : tuple, optional
+		Output of _fermi_lookup_table, if given probabilities are gathered from it
+	Returns
+	-------
+	pij : array
+		Probability of each CSR entry, with a leading replica axis for (K, N) strategies
+	"""
+	if table is None:
+		payoffs = _payoffs_from_coop(degree, W, strategy, coop)
+		return _fermi_probabilities(payoffs[..., sources], payoffs[..., targets], edge_beta)
+	probabilities, node_base = table
+	classes = node_base + strategy * (degree + 1) + coop.astype(np.int64)
+	return probabilities[classes[..., sources], classes[..., targets]]
+
+
+def _count_coop_neighbors(A, strategies):
+	"""
+	Counts the cooperating neighbors of every node with one sparse product
+	Parameters
+	----------
+	A : scipy.sparse.csr_matrix
+		Adjacency matrix of the network
+	strategies : array
+		Strategy of each node ID with shape (N,), or shape (K, N) for K replicas
+	Returns
+	-------
+	coop : array
+		Number of cooperating neighbors with the same shape as strategies
+	"""
+	return (A @ (1 - strategies.T).astype(np.float64)).T
+
+
+def _update_coop_neighbors(csr, coop, strategy, new_strategy):
+	"""
+	Adjusts the cooperating-neighbor counts in place after a strategy update. Only the neighbors of
+	nodes that changed strategy are touched, so the cost is O(changes x degree) instead of O(E)
+	Parameters
+	----------
+	csr : CSRGraph
+	coop : array
+		Number of cooperating neighbors of each node ID, updated in place
+	strategy : array
+		Strategy of each node ID before the update
+	new_strategy : array
+		Strategy of each node ID after the update
+	"""
+	flipped = np.flatnonzero(strategy != new_strategy)
+	if (len(flipped) == 0):
+		return
+	# A new defector (0 -> 1) removes a cooperator from each neighbor's count, a new cooperator adds one
+	delta = strategy[flipped].astype(np.float64) - new_strategy[flipped]
+	np.add.at(coop, csr.indices[neighbor_slots(csr, flipped)], np.repeat(delta, csr.degree[flipped]))
+
+
+# The boundary update gathers the entries of the boundary nodes once they are fewer than 1 / BOUNDARY_FRACTION of all entries
+BOUNDARY_FRACTION = 3
+
+
+def _boundary_mask(degree, strategy, coop):
+	"""
+	Flags the boundary nodes, the ones with at least one neighbor of the other strategy. Only they
+	can change strategy in a payoff difference update
+	Parameters
+	----------
+	degree : array
+		Degree of each node ID, or of the nodes given
+	strategy : array
+		Strategy of the same nodes
+	coop : array
+		Number of cooperating neighbors of the same nodes
+	Returns
+	-------
+	boundary : array
+		Boolean flag of each node
+	"""
+	return np.where(strategy == 0, coop < degree, coop > 0)
+
+
+def _boundary_fermi_update(csr, strategy, coop, boundary, W, beta, table, rng, sources):
+	"""
+	Payoff difference update of the boundary nodes only. Their CSR entries get the same draws as in
+	the block of one number per entry drawn by the full update, the numbers of the other entries are
+	skipped, so the result is the one of _csr_fermi_update. While most entries belong to boundary
+	nodes the full update is run, gathering the boundary entries would cost more
+	Parameters
+	----------
+	csr : CSRGraph
+	strategy : array
+		Strategy of each node ID
+	coop : array
+		Number of cooperating neighbors of each node ID
+	boundary : array
+		Boundary flag of each node ID, see _boundary_mask
+	W : array
+		Matrix payoff
+	beta : float
+	table : tuple or None
+		Output of _fermi_lookup_table
+	rng : np.random.Generator
+		Generator of the step
+	sources : array
+		Source node ID of every CSR entry
+	Returns
+	-------
+	changed : array
+		Node IDs that change strategy
+	values : array
+		Their new strategy
+	entries : int
+		Number of CSR entries scored
+	drawn : int
+		Random numbers drawn, the whole block unless the bit generator skipped ahead
+	"""
+	nodes = np.flatnonzero(boundary)
+	if (int(csr.degree[nodes].sum()) * BOUNDARY_FRACTION > len(csr.indices)):
+		pij = _edge_probabilities(coop, csr.degree, W, strategy, sources, csr.indices, beta, table)
+		new_strategy = _csr_fermi_update(strategy, pij, rng.random(len(csr.indices)), sources, csr.indices)
+		changed = np.flatnonzero(new_strategy != strategy)
+		return changed, new_strategy[changed], len(csr.indices), len(csr.indices)
+	draws, drawn = draw_ranges(rng, len(csr.indices), csr.indptr[nodes], csr.indptr[nodes + 1], return_drawn=True)
+	sources = np.repeat(nodes, csr.degree[nodes])
+	targets = csr.indices[neighbor_slots(csr, nodes)]
+	if table is None:
+		wi = _payoffs_from_coop(csr.degree[sources], W, strategy[sources], coop[sources])
+		wj = _payoffs_from_coop(csr.degree[targets], W, strategy[targets], coop[targets])
+		pij = _fermi_probabilities(wi, wj, beta)
+	else:
+		probabilities, node_base = table
+		source_class = node_base[sources] + strategy[sources] * (csr.degree[sources] + 1) + coop[sources].astype(np.int64)
+		target_class = node_base[targets] + strategy[targets] * (csr.degree[targets] + 1) + coop[targets].astype(np.int64)
+		pij = probabilities[source_class, target_class]
+	accepted = np.flatnonzero(draws < pij)
+	# As in _csr_fermi_update the last accepted neighbor of each node sets its strategy
+	last = np.ones(len(accepted), dtype=bool)
+	last[:-1] = sources[accepted[1:]] != sources[accepted[:-1]]
+	chosen = accepted[last]
+	changed, values = sources[chosen], strategy[targets[chosen]]
+	flip = values != strategy[changed]
+	return changed[flip], values[flip], len(targets), drawn
+
+
+def _flip_boundary_nodes(csr, coop, boundary, strategy, changed, values):
+	"""
+	Applies the strategy changes of a step in place, adjusting the cooperating-neighbor counts and
+	boundary flags of the changed nodes and their neighbors only
+	Parameters
+	----------
+	csr : CSRGraph
+	coop : array
+		Number of cooperating neighbors of each node ID, updated in place
+	boundary : array
+		Boundary flag of each node ID, updated in place
+	strategy : array
+		Strategy of each node ID, updated in place
+	changed : array
+		Node IDs that change strategy
+	values : array
+		Their new strategy
+	"""
+	if (len(changed) == 0):
+		return
+	neighbors = csr.indices[neighbor_slots(csr, changed)]
+	# A new defector (0 -> 1) removes a cooperator from each neighbor's count, a new cooperator adds one
+	delta = np.repeat(strategy[changed].astype(np.float64) - values, csr.degree[changed])
+	strategy[changed] = values
+	if (len(neighbors) * 8 > len(strategy)):
+		# Many changes, one pass over the nodes is cheaper than scattered updates. The counts are
+		# whole numbers, so they come out the same either way
+		coop += np.bincount(neighbors, weights=delta, minlength=len(coop))
+		boundary[:] = _boundary_mask(csr.degree, strategy, coop)
+		return
+	np.add.at(coop, neighbors, delta)
+	touched = np.concatenate((changed, neighbors))
+	boundary[touched] = _boundary_mask(csr.degree[touched], strategy[touched], coop[touched])
+
+
+def _payoffs_from_coop(degree, W, strategies, coop):
+	"""
+	Computes payoffs from the number of cooperating neighbors, as every game of node i is worth
+	W[s_i][0] against a cooperator and W[s_i][1] against a defector
+	Parameters
+	----------
+	degree : array
+		Degree of each node ID
+	W : array
+		Matrix payoff
+	strategies : array
+		Strategy of each node ID
+	coop : array
+		Number of cooperating neighbors of each node ID
+	Returns
+	-------
+	payoffs : array
+		Payoffs with the same shape as strategies
+	"""
+	return W[strategies, 0] * coop + W[strategies, 1] * (degree - coop)
+
+
 def make_simulation_photos(G, strategy, step, title):
 	"""
-	Makes photos that will be combined to make a video
+	Makes photos that will be combined to make a video, on the cached layout of the network
 	Parameters
 	----------
 	G : nx.Graph
@@ -153,27 +1410,18 @@ def make_simulation_photos(G, strategy, step, title):
 	title : str
 		Name of the photos
 	"""
-	### make plot
-	path = os.path.split(os.path.realpath(__file__))
-	title = title + ", Step=" + str(step+1)
-	plt.figure(figsize=(10, 10))
-	ax = plt.gca()
-	my_pos = nx.spring_layout(G, seed = 100)
-	nx.draw(G, my_pos, node_size=10, width=0.3, ax=ax, node_color=['red' if s == 0 else 'royalblue' for s in strategy.values()])
-	plt.title("Time Step : %02d" %(step+1), fontsize = 24)
-	red_patch = mpatches.Patch(color='red', label='Cooperative Player')
-	blue_patch = mpatches.Patch(color='royalblue', label='Non-Cooperative Player')
-	plt.legend(handles=[red_patch, blue_patch], loc='lower right', fontsize = 16)
-	savePath = os.path.normpath(path[0] + "/reports/figures/film/%s.png" %(title))
-	plt.savefig(savePath, dpi = 500)
-	plt.close()
-
-def multi_replica_simulation(G, W, steps, x0, beta, replicas, choice_factor):
+	csr = to_csr(G)
+	positions = graph_layout(G)
+	os.makedirs(FILM_DIR, exist_ok=True)
+	render_frame(np.fromiter(strategy.values(), dtype=np.int8, count=len(strategy)), step, frame_file(title, step),
+				positions=positions, segments=_edge_segments(csr, positions))
+
+def multi_replica_simulation(G, W, steps, x0, beta, replicas, choice_factor, workers=1, seed=None, lockstep=False, counter_rng=False, cache=None, queue_dir=None):
 	"""
 	Runs one a given number of  simulation replicas of the evolutionary game theory simulation
 	Parameters
 	----------
-	G : nx.Graph
+	G : nx.Graph or CSRGraph
 	W : array
 		Payoff matrix
 	steps : int
@@ -186,12 +1434,32 @@ def multi_replica_simulation(G, W, steps, x0, beta, replicas, choice_factor):
 		Number of replicas to execute
 	choice_factor : int
 		Choice of how nodes will decide to update their strategy
+	workers : int, default 1
+		Number of worker processes running replicas in parallel
+	seed : int, np.random.SeedSequence or np.random.Generator, optional
+		Root seed of the replicas' random streams
+	lockstep : bool, default False
+		If True the replicas advance together in one process, see lockstep_replica_simulation
+	counter_rng : bool, default False
+		If True every (replica, step) draws from its own Philox stream, see rng_streams.CounterStreams
+	cache : result_cache.ResultCache, optional
+		Replicas of a seeded run already simulated are read from it instead of run again
+	queue_dir : str, optional
+		Shared directory of a work_queue, the replicas are run by the workers polling it instead of
+		local processes
 	Returns
 	-------
 	p_mean : float
 		Mean proportion of nodes following a cooperative strategy
 	"""
-	return np.mean([one_replica_simulation(G, W, steps, x0, beta, choice_factor)[0] for _ in range(replicas)])
+	from replica_runner import run_replicas
+	if queue_dir is not None:
+		from work_queue import queue_pool
+		with queue_pool(G, queue_dir) as pool:
+			results = run_replicas(G, W, steps, x0, beta, replicas, choice_factor, seed=seed, pool=pool, lockstep=lockstep, counter_rng=counter_rng, cache=cache)
+	else:
+		results = run_replicas(G, W, steps, x0, beta, replicas, choice_factor, workers=workers, seed=seed, lockstep=lockstep, counter_rng=counter_rng, cache=cache)
+	return np.mean([p for p, _ in results])
 
 def _compute_all_payoffs(G, W, strategy):
 	"""
@@ -236,28 +1504,36 @@ def _get_payoff(G, i, W, strategy):
 def _decide_to_make_photos(t, steps, G, strategy, title):
 	if (t == 0 or (t+1)%(steps/2) == 0 or t == steps-1):
 		print("Making photo for timestep " + str(t))
-		t1 = time.time()
 		make_simulation_photos(G, strategy, t, title)
-		t2 = time.time()
-		if (t2 - t1 > 1):
-			logging.warning("WARNING: Time to make photo at step " + str(t) + ": "+ str(t2-t1))
 
-def _make_influence_csv(title, strategy, G, influences):
+def _make_influence_csv(title, strategy, G, influences, table_format="csv"):
 	"""
+	Writes the influence table of a dict engine run, one row per node in the order of strategy
+	Parameters
 	----------
 	title : string
 	strategy : dict
 	G : nx.Graph
+	influences : dict
+	table_format : str, default "csv"
+		"csv" or "npz"
+	"""
+	nodes = list(strategy)
+	degree = np.fromiter((G.degree(node) for node in nodes), dtype=np.int64, count=len(nodes))
+	write_influence_table(title, nodes, np.fromiter(strategy.values(), dtype=np.int8, count=len(nodes)), degree,
+						np.fromiter((influences[node] for node in nodes), dtype=np.int64, count=len(nodes)), table_format)
+
+
+def _make_csr_influence_csv(title, csr, strategy, influences, table_format="csv"):
+	"""
+	Writes the influence table of a CSR engine run, which may not have a networkx graph at hand
+	Parameters
+	----------
+	title : string
+	csr : CSRGraph
+	strategy : array
+	influences : array
+	table_format : str, default "csv"
+		"csv" or "npz"
 	"""
-	with open(title + "_influence" + '.csv', 'w', newline='') as csvfile:
-		csvWriter = csv.writer(csvfile, delimiter=',')
-		csvWriter.writerow(["Node Number"] + ["Strategy (0 = cooperator, 1 = defector)"] + ["Degree"] + ["Number of Influences"])
-		stratkeys = list(strategy.keys())
-		stratvals = list(strategy.values())
-		infvals = list(influences.values())
-		for i in range(len(G.nodes())-1):
-			csv_node = stratkeys[i]
-			csv_strat = stratvals[i]
-			csv_deg = G.degree(stratkeys[i])
-			csv_inf = infvals[i]
-			csvWriter.writerow([csv_node] + [csv_strat] + [csv_deg] + [csv_inf])
\ No newline at end of file
+	write_influence_table(title, csr.nodes, strategy, csr.degree, influences, table_format)
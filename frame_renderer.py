@@ -0,0 +1,246 @@
+"""
+This module renders the video frames of a simulation. The spring layout of a network is computed once
+and cached next to the graph cache, frames are drawn with one scatter and one LineCollection instead
+of nx.draw, and a pool of worker processes renders them while the simulation keeps running, either
+from strategies submitted by the engine or from a snapshot file written by node_state.
+"""
+import os
+import numpy as np
+import networkx as nx
+import matplotlib.pyplot as plt
+import matplotlib.patches as mpatches
+from matplotlib.collections import LineCollection
+from concurrent.futures import ProcessPoolExecutor
+from csr_graph import to_csr, to_networkx, edge_sources, graph_fingerprint
+from graph_generators import Lattice
+from graph_cache import CACHE_DIR
+from node_state import read_snapshots
+
+path = os.path.split(os.path.realpath(__file__))
+FILM_DIR = os.path.normpath(path[0] + "/reports/figures/film")
+VIDEO_DIR = os.path.normpath(path[0] + "/reports/videos")
+
+_frame_positions = None
+_frame_segments = None
+
+
+def graph_layout(G, cache_dir=CACHE_DIR):
+	"""
+	Returns the spring layout of a network, computed once and cached on disk. A Lattice is drawn on
+	its grid instead
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	cache_dir : str, default CACHE_DIR
+	Returns
+	-------
+	positions : array
+		Array of shape (N, 2) with the position of each node ID
+	"""
+	if isinstance(G, Lattice):
+		rows, cols = np.divmod(np.arange(G.rows * G.cols), G.cols)
+		return np.stack([cols, -rows], axis=1).astype(np.float64)
+	csr = to_csr(G)
+	cache = os.path.join(cache_dir, "layout_%08x_%d.npy" % (graph_fingerprint(csr), len(csr.degree)))
+	if os.path.exists(cache):
+		return np.load(cache)
+	layout = nx.spring_layout(G if isinstance(G, nx.Graph) else to_networkx(csr), seed=100)
+	positions = np.array([layout[node] for node in csr.nodes], dtype=np.float64).reshape(-1, 2)
+	os.makedirs(cache_dir, exist_ok=True)
+	# Written under a temporary name so an interrupted write never leaves a corrupt cache behind
+	partial = cache + ".partial.npy"
+	np.save(partial, positions)
+	os.replace(partial, cache)
+	return positions
+
+
+def frame_file(title, step, frame_dir=FILM_DIR):
+	"""
+	Returns the file of a frame, numbered so frames sort in step order
+	Parameters
+	----------
+	title : str
+	step : int
+		Zero-based time step
+	frame_dir : str, default FILM_DIR
+	Returns
+	-------
+	file_path : str
+	"""
+	return os.path.join(frame_dir, "%s, Step=%05d.png" % (title.replace("/", "_"), step + 1))
+
+
+def _init_frame_worker(positions, segments):
+	"""
+	Stores the layout in the worker process so frames only carry the strategies
+	Parameters
+	----------
+	positions : array
+	segments : array
+		Array of shape (E, 2, 2) with the ends of every edge
+	"""
+	global _frame_positions, _frame_segments
+	_frame_positions, _frame_segments = positions, segments
+
+
+def _edge_segments(csr, positions):
+	"""
+	Builds the line segments of the edges of a network, one per undirected edge
+	Parameters
+	----------
+	csr : CSRGraph
+	positions : array
+	Returns
+	-------
+	segments : array
+		Array of shape (E, 2, 2)
+	"""
+	sources = edge_sources(csr)
+	once = sources < csr.indices
+	return np.stack([positions[sources[once]], positions[csr.indices[once]]], axis=1)
+
+
+def render_frame(strategy, step, file_path, dpi=100, positions=None, segments=None):
+	"""
+	Draws the strategies of one step on the cached layout
+	Parameters
+	----------
+	strategy : array
+		Strategy of each node ID (0 for cooperator, 1 for defector)
+	step : int
+		Zero-based time step
+	file_path : str
+	dpi : int, default 100
+	positions, segments : array, optional
+		Layout and edges, the ones of the worker process when omitted
+	Returns
+	-------
+	file_path : str
+	"""
+	positions = _frame_positions if positions is None else positions
+	segments = _frame_segments if segments is None else segments
+	fig = plt.figure(figsize=(10, 10))
+	ax = fig.gca()
+	ax.add_collection(LineCollection(segments, linewidths=0.3, colors="k"))
+	ax.scatter(positions[:, 0], positions[:, 1], s=10, c=np.where(np.asarray(strategy) == 0, "red", "royalblue"), zorder=2)
+	ax.set_axis_off()
+	ax.set_title("Time Step : %02d" %(step+1), fontsize = 24)
+	red_patch = mpatches.Patch(color='red', label='Cooperative Player')
+	blue_patch = mpatches.Patch(color='royalblue', label='Non-Cooperative Player')
+	ax.legend(handles=[red_patch, blue_patch], loc='lower right', fontsize = 16)
+	fig.savefig(file_path, dpi=dpi)
+	plt.close(fig)
+	return file_path
+
+
+class FrameRenderer:
+	"""
+	Renders frames in background processes. submit returns at once, so the simulation never waits
+	for matplotlib
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	workers : int, default 2
+		Number of rendering processes
+	every : int, optional
+		Steps between frames, if omitted the first, middle and last steps are drawn
+	frame_dir : str, default FILM_DIR
+	dpi : int, default 100
+	"""
+
+	def __init__(self, G, workers=2, every=None, frame_dir=FILM_DIR, dpi=100):
+		csr = to_csr(G)
+		positions = graph_layout(G)
+		self.every = every
+		self.frame_dir = frame_dir
+		self.dpi = dpi
+		self.futures = []
+		os.makedirs(frame_dir, exist_ok=True)
+		self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_frame_worker,
+										initargs=(positions, _edge_segments(csr, positions)))
+
+	def wants(self, t, steps):
+		"""
+		Tells whether step t gets a frame
+		Parameters
+		----------
+		t : int
+		steps : int
+		Returns
+		-------
+		wanted : bool
+		"""
+		if self.every:
+			return t % self.every == 0 or t == steps - 1
+		return t == 0 or (t+1)%(steps/2) == 0 or t == steps-1
+
+	def submit(self, strategy, step, title):
+		"""
+		Queues the frame of a step
+		Parameters
+		----------
+		strategy : array
+			Strategy of each node ID, copied before the call returns
+		step : int
+		title : str
+		Returns
+		-------
+		future : Future
+			Resolves to the frame file
+		"""
+		future = self.pool.submit(render_frame, np.array(strategy, dtype=np.int8), step, frame_file(title, step, self.frame_dir), self.dpi)
+		self.futures.append(future)
+		return future
+
+	def close(self):
+		"""
+		Waits for the queued frames and stops the workers
+		Returns
+		-------
+		frames : list
+			Files of the frames rendered since the renderer was opened
+		"""
+		frames = [future.result() for future in self.futures]
+		self.pool.shutdown()
+		return frames
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def render_snapshots(G, snapshot_path, title, workers=2, frame_dir=FILM_DIR, dpi=100):
+	"""
+	Renders one frame per snapshot of a file written by node_state.SnapshotWriter
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+		Network the snapshots were taken on
+	snapshot_path : str
+	title : str
+	workers : int, default 2
+	frame_dir : str, default FILM_DIR
+	dpi : int, default 100
+	Returns
+	-------
+	frames : list
+		Frame files in step order
+	"""
+	with FrameRenderer(G, workers, frame_dir=frame_dir, dpi=dpi) as renderer:
+		submit_snapshots(renderer, snapshot_path, title)
+		return [future.result() for future in renderer.futures]
+
+
+def submit_snapshots(renderer, snapshot_path, title):
+	"""
+	Queues one frame per snapshot of a file on an open renderer
+	Parameters
+	----------
+	renderer : FrameRenderer
+	snapshot_path : str
+	title : str
+	"""
+	for snapshot in read_snapshots(snapshot_path):
+		renderer.submit(snapshot["strategy"], int(snapshot["step"]), title)
@@ -0,0 +1,107 @@
+"""
+This module contains functions to load the edge-list networks through a binary cache. An edge list
+is parsed once and its CSR arrays are written to an .npz file next to the repository, later loads
+read the arrays back as long as the source file keeps the same size and modification time.
+"""
+import os
+import numpy as np
+from csr_graph import CSRGraph, csr_from_edges
+from graph_generators import Lattice, watts_strogatz_csr, erdos_renyi_csr
+
+path = os.path.split(os.path.realpath(__file__))
+CACHE_DIR = os.path.normpath(path[0] + "/graph_cache")
+# Edge list and delimiter of each network read from disk
+NETWORK_FILES = {
+	"fb": ("facebook_combined.txt.gz", None),
+	"bfb": ("BFacebook.csv", ","),
+	"gh": ("musae_git_edges.csv", ","),
+}
+
+
+def _source_stamp(source):
+	"""
+	Returns the size and modification time that key the cache of a source file
+	Parameters
+	----------
+	source : str
+		Path of the edge list
+	Returns
+	-------
+	stamp : array
+		[size in bytes, modification time in nanoseconds]
+	"""
+	stat = os.stat(source)
+	return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def load_edgelist(source, delimiter=None, cache_dir=CACHE_DIR):
+	"""
+	Loads an edge list of integer node labels as a CSRGraph, parsing the file only when its cache
+	is missing or stale
+	Parameters
+	----------
+	source : str
+		Path of the edge list, gzip files are read transparently
+	delimiter : str, optional
+		Column delimiter, whitespace when omitted
+	cache_dir : str, default graph_cache next to this module
+		Directory of the .npz cache files
+	Returns
+	-------
+	csr : CSRGraph
+		The network with node IDs in the order nx.read_edgelist would give them
+	"""
+	stamp = _source_stamp(source)
+	cache = os.path.join(cache_dir, os.path.basename(source) + ".npz")
+	if os.path.exists(cache):
+		with np.load(cache) as data:
+			if np.array_equal(data["stamp"], stamp):
+				return CSRGraph(data["indptr"], data["indices"], data["degree"], data["nodes"])
+	edges = np.loadtxt(source, delimiter=delimiter, dtype=np.int64, comments="#", ndmin=2)
+	csr = csr_from_edges(edges[:, :2])
+	os.makedirs(cache_dir, exist_ok=True)
+	# Written under a temporary name so an interrupted write never leaves a corrupt cache behind
+	partial = cache + ".partial.npz"
+	np.savez(partial, indptr=csr.indptr, indices=csr.indices, degree=csr.degree, nodes=csr.nodes, stamp=stamp)
+	os.replace(partial, cache)
+	return csr
+
+
+def load_network(graphChoice, nodes=None, avgEdgePerNode=None, seed=None):
+	"""
+	Builds or loads one of the networks of the main menu
+	Parameters
+	----------
+	graphChoice : str
+		ws for Watts-Strogatz, er for Erdos-Renyi, fb for Facebook, bfb for Big Facebook, gh for
+		GitHub, or 2d for two dimensional grid
+	nodes : int, optional
+		Number of nodes for ws and er, side of the grid for 2d
+	avgEdgePerNode : int, optional
+		Average edges per node for ws and er
+	seed : int, optional
+		Seed of the ws and er networks, the same seed builds the same network
+	Returns
+	-------
+	g : CSRGraph or Lattice
+		The network, the networks read from disk come from the binary cache and the synthetic ones
+		are built as arrays by graph_generators
+	title : str
+		Title describing the network
+	"""
+	if (graphChoice == "ws"):
+		g = watts_strogatz_csr(nodes, avgEdgePerNode, 0.1, seed=seed)
+		title = "{0}, {1} Nodes, K={2}".format(graphChoice.upper(), nodes, avgEdgePerNode)
+	elif (graphChoice == "er"):
+		g = erdos_renyi_csr(nodes, avgEdgePerNode, seed=seed)
+		title = "{0}, {1} Nodes, K={2}".format(graphChoice.upper(), nodes, avgEdgePerNode)
+	elif (graphChoice in NETWORK_FILES):
+		file_name, delimiter = NETWORK_FILES[graphChoice]
+		g = load_edgelist(os.path.normpath(path[0] + "/" + file_name), delimiter=delimiter)
+		title = "{0}".format(graphChoice.upper())
+	elif (graphChoice == "2d"):
+		g = Lattice(nodes, nodes)
+		title = "{0}".format(graphChoice.upper())
+	else:
+		raise ValueError("Unknown graph: " + str(graphChoice))
+	return g, title
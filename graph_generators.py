@@ -0,0 +1,277 @@
+"""
+This module builds the synthetic networks straight as NumPy arrays, without a networkx graph in
+between: Watts-Strogatz and Erdos-Renyi networks as CSR arrays, and the 2D grid as a Lattice, which
+holds no adjacency at all. The neighbors of a lattice node are found by shifting whole arrays, so
+the stencil engine of evolutionary_game_theory scales to millions of nodes.
+"""
+import numpy as np
+from collections import namedtuple
+from collections.abc import Sequence
+from csr_graph import CSRGraph
+
+Lattice = namedtuple("Lattice", ["rows", "cols", "periodic"], defaults=[False])
+Lattice.__doc__ = """
+2D grid of rows x cols nodes, the array-native counterpart of nx.grid_2d_graph(rows, cols). Node ID
+k is the node (k // cols, k % cols), so strategies can be kept as a (rows, cols) array
+Parameters
+----------
+rows : int
+cols : int
+periodic : bool, default False
+	If True the grid wraps around into a torus and every node has four neighbors
+"""
+# Order in which the neighbors of a lattice node are visited, the order of nx.grid_2d_graph
+LATTICE_DIRECTIONS = ("up", "down", "left", "right")
+# Direction leading back from a neighbor
+_OPPOSITE = (1, 0, 3, 2)
+
+
+class GridLabels(Sequence):
+	"""
+	(row, column) labels of the nodes of a lattice, created when they are read instead of being
+	stored, so a million-node lattice needs no list of tuples
+	Parameters
+	----------
+	rows : int
+	cols : int
+	"""
+
+	def __init__(self, rows, cols):
+		self.rows = rows
+		self.cols = cols
+
+	def __len__(self):
+		return self.rows * self.cols
+
+	def __getitem__(self, k):
+		if isinstance(k, slice):
+			return [self[i] for i in range(*k.indices(len(self)))]
+		k = int(k)
+		if k < 0:
+			k += len(self)
+		if not 0 <= k < len(self):
+			raise IndexError("Node " + str(k) + " is not in the lattice")
+		return divmod(k, self.cols)
+
+
+def _check_lattice(lattice):
+	"""
+	Rejects lattices whose periodic wrap would repeat a neighbor or link a node to itself
+	Parameters
+	----------
+	lattice : Lattice
+	"""
+	if lattice.periodic and (lattice.rows < 3 or lattice.cols < 3):
+		raise ValueError("A periodic lattice needs at least 3 rows and 3 columns")
+
+
+def lattice_shift(values, direction, periodic=False):
+	"""
+	Gives every node the value of its neighbor in one direction
+	Parameters
+	----------
+	values : array
+		Array of shape (rows, cols)
+	direction : int
+		Index into LATTICE_DIRECTIONS
+	periodic : bool, default False
+	Returns
+	-------
+	shifted : array
+		shifted[i, j] is the value of the neighbor of (i, j), 0 where the open grid has no neighbor
+	"""
+	if periodic:
+		return np.roll(values, (1, -1, 1, -1)[direction], axis=direction // 2)
+	shifted = np.zeros_like(values)
+	if (direction == 0):
+		shifted[1:, :] = values[:-1, :]
+	elif (direction == 1):
+		shifted[:-1, :] = values[1:, :]
+	elif (direction == 2):
+		shifted[:, 1:] = values[:, :-1]
+	else:
+		shifted[:, :-1] = values[:, 1:]
+	return shifted
+
+
+def lattice_unshift(values, direction, periodic=False):
+	"""
+	Sends the value of every node back to the node that sees it as its neighbor in a direction,
+	e.g. to credit the neighbors that were copied
+	Parameters
+	----------
+	values : array
+		Array of shape (rows, cols), 0 where the open grid has no neighbor
+	direction : int
+	periodic : bool, default False
+	Returns
+	-------
+	unshifted : array
+	"""
+	return lattice_shift(values, _OPPOSITE[direction], periodic)
+
+
+def lattice_valid(lattice):
+	"""
+	Tells which neighbors exist
+	Parameters
+	----------
+	lattice : Lattice
+	Returns
+	-------
+	valid : array
+		Boolean array of shape (4, rows, cols), valid[d, i, j] is True when (i, j) has a neighbor in
+		direction d
+	"""
+	_check_lattice(lattice)
+	ones = np.ones((lattice.rows, lattice.cols), dtype=bool)
+	return np.stack([lattice_shift(ones, d, lattice.periodic) for d in range(4)])
+
+
+def lattice_degree(lattice):
+	"""
+	Returns the degree of every node of a lattice
+	Parameters
+	----------
+	lattice : Lattice
+	Returns
+	-------
+	degree : array
+		Array of shape (rows, cols)
+	"""
+	return lattice_valid(lattice).sum(axis=0, dtype=np.int64)
+
+
+def grid_csr(rows, cols=None, periodic=False):
+	"""
+	Builds the CSR arrays of a 2D grid, with the node IDs and neighbor order of
+	to_csr(nx.grid_2d_graph(rows, cols))
+	Parameters
+	----------
+	rows : int
+	cols : int, optional
+		Same as rows when omitted
+	periodic : bool, default False
+	Returns
+	-------
+	csr : CSRGraph
+		Nodes are labelled with GridLabels
+	"""
+	lattice = Lattice(rows, rows if cols is None else cols, periodic)
+	valid = lattice_valid(lattice)
+	ids = np.arange(lattice.rows * lattice.cols, dtype=np.int32).reshape(lattice.rows, lattice.cols)
+	neighbors = np.stack([lattice_shift(ids, d, periodic) for d in range(4)])
+	# Node-major, direction-minor order gives every neighbor list in LATTICE_DIRECTIONS order
+	degree = valid.sum(axis=0, dtype=np.int64).ravel()
+	indptr = np.zeros(len(degree) + 1, dtype=np.int64)
+	np.cumsum(degree, out=indptr[1:])
+	indices = neighbors.transpose(1, 2, 0)[valid.transpose(1, 2, 0)]
+	return CSRGraph(indptr, indices, degree, GridLabels(lattice.rows, lattice.cols))
+
+
+def _csr_from_pairs(n, u, v):
+	"""
+	Builds CSR arrays from the two ends of every undirected edge, each listed once. Neighbor lists
+	are sorted by node ID
+	Parameters
+	----------
+	n : int
+		Number of nodes
+	u, v : array
+		Ends of the edges, without self loops or repeated edges
+	Returns
+	-------
+	csr : CSRGraph
+		Nodes are labelled 0..n-1
+	"""
+	sources = np.concatenate([u, v])
+	targets = np.concatenate([v, u])
+	order = np.lexsort((targets, sources))
+	degree = np.bincount(sources, minlength=n).astype(np.int64)
+	indptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(degree, out=indptr[1:])
+	return CSRGraph(indptr, targets[order].astype(np.int32), degree, range(n))
+
+
+def watts_strogatz_csr(n, k, p, seed=None, max_rounds=100):
+	"""
+	Builds a Watts-Strogatz network as CSR arrays. As in nx.watts_strogatz_graph every node starts
+	linked to its k // 2 nearest neighbors on each side of a ring and each of these edges is
+	rewired with probability p to a uniformly chosen node. The rewired ends are drawn all at once
+	and the ones giving a self loop or a repeated edge are drawn again
+	Parameters
+	----------
+	n : int
+		Number of nodes
+	k : int
+		Each node is joined with its k // 2 nearest neighbors on each side
+	p : float
+		Probability of rewiring each edge
+	seed : int or np.random.Generator, optional
+	max_rounds : int, default 100
+		Redraws allowed, edges still clashing afterwards go back to their ring end, or are dropped
+		when that edge is already taken
+	Returns
+	-------
+	csr : CSRGraph
+		Nodes are labelled 0..n-1
+	"""
+	if (k >= n):
+		raise ValueError("k must be smaller than n")
+	rng = np.random.default_rng(seed)
+	half = k // 2
+	u = np.tile(np.arange(n, dtype=np.int64), half)
+	ring = (u + np.repeat(np.arange(1, half + 1), n)) % n
+	v = ring.copy()
+	pending = np.flatnonzero(rng.random(len(u)) < p)
+	rewired = np.zeros(len(u), dtype=bool)
+	rewired[pending] = True
+	for _ in range(max_rounds):
+		if (len(pending) == 0):
+			break
+		v[pending] = rng.integers(0, n, len(pending))
+		# Edges kept on the ring sort first, so a clash is always resolved against a rewired edge
+		keys = np.minimum(u, v) * n + np.maximum(u, v)
+		order = np.lexsort((rewired, keys))
+		repeated = np.zeros(len(u), dtype=bool)
+		repeated[order[1:]] = keys[order[1:]] == keys[order[:-1]]
+		pending = np.flatnonzero(rewired & ((u == v) | repeated))
+	v[pending] = ring[pending]
+	if (len(pending) > 0):
+		# The ring end may have been taken by another rewired edge meanwhile
+		_, kept = np.unique(np.minimum(u, v) * n + np.maximum(u, v), return_index=True)
+		u, v = u[kept], v[kept]
+	return _csr_from_pairs(n, u, v)
+
+
+def erdos_renyi_csr(n, k, seed=None):
+	"""
+	Builds an Erdos-Renyi G(n, m) network as CSR arrays, with m = n * k / 2 edges chosen uniformly
+	among the pairs of distinct nodes
+	Parameters
+	----------
+	n : int
+		Number of nodes
+	k : float
+		Average edges per node
+	seed : int or np.random.Generator, optional
+	Returns
+	-------
+	csr : CSRGraph
+		Nodes are labelled 0..n-1
+	"""
+	m = int(round(n * k / 2))
+	if (m > n * (n - 1) // 2):
+		raise ValueError("A network of " + str(n) + " nodes has fewer than " + str(m) + " edges")
+	rng = np.random.default_rng(seed)
+	keys = np.zeros(0, dtype=np.int64)
+	while (len(keys) < m):
+		u = rng.integers(0, n, 2 * (m - len(keys)) + 16)
+		v = rng.integers(0, n, len(u))
+		drawn = np.minimum(u, v) * n + np.maximum(u, v)
+		keys = np.concatenate([keys, drawn[u != v]])
+		# The first draw of each pair is kept, so the edges stay a uniform sample
+		first = np.unique(keys, return_index=True)[1]
+		keys = keys[np.sort(first)]
+	keys = keys[:m]
+	return _csr_from_pairs(n, keys // n, keys % n)
@@ -0,0 +1,193 @@
+"""
+This module computes network statistics on CSR arrays: degree histograms, connected component
+sizes and local/average clustering from triangle counts done with sparse matrix products. Clustering
+can be estimated from a random sample of nodes with an error bound, and the statistics of a network
+are cached in the graph cache so plots can be redrawn without computing them again.
+"""
+import os
+import json
+import zlib
+import numpy as np
+from scipy.sparse.csgraph import connected_components
+from csr_graph import CSRGraph, to_csr, adjacency_matrix, graph_fingerprint
+from graph_cache import CACHE_DIR
+
+
+def degree_histogram(G):
+	"""
+	Counts the nodes of each degree, as nx.degree_histogram
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	Returns
+	-------
+	histogram : array
+		histogram[d] is the number of nodes with degree d
+	"""
+	return np.bincount(to_csr(G).degree)
+
+
+def component_labels(G):
+	"""
+	Labels the connected components of a network
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	Returns
+	-------
+	labels : array
+		Component of each node ID
+	sizes : array
+		Number of nodes of each component
+	"""
+	count, labels = connected_components(adjacency_matrix(to_csr(G)), directed=False)
+	return labels, np.bincount(labels, minlength=count)
+
+
+def largest_component(G):
+	"""
+	Extracts the largest connected component, keeping the order of the remaining node IDs
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	Returns
+	-------
+	csr : CSRGraph
+	"""
+	csr = to_csr(G)
+	labels, sizes = component_labels(csr)
+	keep = labels == np.argmax(sizes)
+	A = adjacency_matrix(csr)[keep][:, keep].tocsr()
+	A.sort_indices()
+	degree = np.diff(A.indptr).astype(np.int64)
+	return CSRGraph(A.indptr.astype(np.int64), A.indices.astype(np.int32), degree, [csr.nodes[k] for k in np.flatnonzero(keep).tolist()])
+
+
+def _simple_adjacency(csr):
+	"""
+	Builds the adjacency matrix without self loops, which clustering ignores
+	Parameters
+	----------
+	csr : CSRGraph
+	Returns
+	-------
+	A : scipy.sparse.csr_matrix
+	"""
+	A = adjacency_matrix(csr)
+	A.setdiag(0)
+	A.eliminate_zeros()
+	return A
+
+
+def local_clustering(G, nodes=None, chunk_rows=4096):
+	"""
+	Computes the clustering coefficient of nodes from their triangle counts. The triangles of a block
+	of rows are the row sums of (A[rows] @ A) * A[rows], so memory stays bounded by the block
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	nodes : array, optional
+		Node IDs to compute, every node when omitted
+	chunk_rows : int, default 4096
+		Rows multiplied at once
+	Returns
+	-------
+	clustering : array
+		Clustering coefficient of each requested node, 0 for nodes with fewer than two neighbors
+	"""
+	A = _simple_adjacency(to_csr(G))
+	nodes = np.arange(A.shape[0]) if nodes is None else np.asarray(nodes)
+	degree = np.diff(A.indptr)[nodes].astype(np.float64)
+	triangles = np.zeros(len(nodes))
+	for start in range(0, len(nodes), chunk_rows):
+		rows = A[nodes[start:start + chunk_rows]]
+		triangles[start:start + chunk_rows] = np.asarray((rows @ A).multiply(rows).sum(axis=1)).ravel() / 2
+	pairs = degree * (degree - 1)
+	return np.divide(2 * triangles, pairs, out=np.zeros(len(nodes)), where=pairs > 0)
+
+
+def average_clustering(G, sample=None, seed=None, confidence=0.95):
+	"""
+	Computes the average clustering coefficient, exactly or from a uniform sample of nodes
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	sample : int, optional
+		Number of nodes sampled without replacement, every node is used when omitted
+	seed : int, optional
+		Seed of the sample
+	confidence : float, default 0.95
+		Probability that the true average lies within the returned bound of the estimate
+	Returns
+	-------
+	average : float
+	error : float
+		Hoeffding bound sqrt(ln(2 / (1 - confidence)) / (2 * sample)) on the absolute error, as
+		coefficients lie in [0, 1]; 0 when computed exactly
+	"""
+	clustering, error = _sampled_clustering(G, sample, seed, confidence)
+	return float(clustering.mean()) if len(clustering) else 0.0, error
+
+
+def _sampled_clustering(G, sample, seed, confidence):
+	"""
+	Computes the local clustering of every node or of a uniform sample of nodes
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	sample : int or None
+	seed : int or None
+	confidence : float
+	Returns
+	-------
+	clustering : array
+		Clustering of the sampled nodes in node ID order
+	error : float
+		Hoeffding bound on the error of their mean, 0 without sampling
+	"""
+	n = len(to_csr(G).degree)
+	if sample is None or sample >= n:
+		return local_clustering(G), 0.0
+	nodes = np.sort(np.random.default_rng(seed).choice(n, sample, replace=False))
+	return local_clustering(G, nodes), float(np.sqrt(np.log(2 / (1 - confidence)) / (2 * sample)))
+
+
+def graph_statistics(G, sample=None, seed=0, confidence=0.95, cache_dir=CACHE_DIR):
+	"""
+	Computes the statistics plotted by degree_dist.py, reading them from the cache when the same
+	network was analysed before with the same options
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	sample : int, optional
+		Nodes of the largest component sampled for clustering, every node when omitted
+	seed : int, default 0
+		Seed of the sample
+	confidence : float, default 0.95
+		Confidence of the clustering error bound
+	cache_dir : str or None, default CACHE_DIR
+		None disables the cache
+	Returns
+	-------
+	stats : dict
+		degree_histogram, component_sizes (largest first), clustering (local clustering of the
+		sampled or all nodes of the largest component), average_clustering and clustering_error
+	"""
+	csr = to_csr(G)
+	options = {"sample": sample, "seed": seed, "confidence": confidence}
+	key = "%08x_%d_%08x" % (graph_fingerprint(csr), len(csr.degree), zlib.crc32(json.dumps(options, sort_keys=True).encode()))
+	cache = None if cache_dir is None else os.path.join(cache_dir, "stats_" + key + ".npz")
+	if cache is not None and os.path.exists(cache):
+		with np.load(cache) as data:
+			return {name: data[name] if data[name].ndim else data[name].item() for name in data.files}
+	sizes = component_labels(csr)[1]
+	clustering, error = _sampled_clustering(largest_component(csr), sample, seed, confidence)
+	stats = {"degree_histogram": degree_histogram(csr), "component_sizes": np.sort(sizes)[::-1], "clustering": clustering,
+			"average_clustering": float(clustering.mean()) if len(clustering) else 0.0, "clustering_error": error}
+	if cache is not None:
+		os.makedirs(cache_dir, exist_ok=True)
+		# Written under a temporary name so an interrupted write never leaves a corrupt cache behind
+		partial = cache + ".partial.npz"
+		np.savez(partial, **stats)
+		os.replace(partial, cache)
+	return stats
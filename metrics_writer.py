@@ -0,0 +1,158 @@
+"""
+This module contains a buffered writer that streams per-step metrics of a replica to disk while it
+runs. Every flushed buffer is one chunk: the number of steps it holds, followed by one column per
+metric. A run that is killed keeps every complete chunk, the file can be read while it is still being
+written, and a single metric is read without going through the others.
+"""
+import os
+import numpy as np
+
+METRICS_DTYPE = np.dtype([("step", np.int64), ("coop", np.float64), ("flips", np.int64), ("mean_payoff", np.float64)])
+_HEADER = np.dtype(np.int64)
+
+
+class MetricsWriter:
+	"""
+	Appends METRICS_DTYPE columns to a file, writing them in chunks of buffer_steps steps
+	Parameters
+	----------
+	file_path : str
+		File to write, it is truncated unless mode is 'ab'
+	buffer_steps : int, default 1024
+		Number of steps kept in memory between writes
+	mode : str, default 'wb'
+		'ab' appends to an existing file, e.g. when resuming a run
+	"""
+
+	def __init__(self, file_path, buffer_steps=1024, mode='wb'):
+		self.file = open(file_path, mode)
+		self.buffer = np.zeros(buffer_steps, dtype=METRICS_DTYPE)
+		self.size = 0
+
+	def write(self, step, coop, flips, mean_payoff):
+		"""
+		Buffers the metrics of one step
+		Parameters
+		----------
+		step : int
+			Time step
+		coop : float
+			Proportion of cooperators at the start of the step
+		flips : int
+			Number of nodes that changed strategy during the step
+		mean_payoff : float
+			Mean payoff of the nodes during the step
+		"""
+		self.buffer[self.size] = (step, coop, flips, mean_payoff)
+		self.size += 1
+		if (self.size == len(self.buffer)):
+			self.flush()
+
+	def flush(self):
+		"""
+		Writes the buffered steps to the file as one chunk
+		"""
+		if (self.size == 0):
+			return
+		chunk = self.buffer[:self.size]
+		self.file.write(_HEADER.type(self.size).tobytes() + b"".join(chunk[name].tobytes() for name in METRICS_DTYPE.names))
+		self.file.flush()
+		self.size = 0
+
+	def close(self):
+		"""
+		Writes the remaining steps and closes the file
+		"""
+		self.flush()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def _chunks(file):
+	"""
+	Walks the complete chunks of a metrics file
+	Parameters
+	----------
+	file : file
+		Metrics file opened for binary reading
+	Yields
+	------
+	offset : int
+		Position of the first column of the chunk
+	size : int
+		Number of steps in the chunk
+	"""
+	end = os.fstat(file.fileno()).st_size
+	offset = 0
+	while offset + _HEADER.itemsize <= end:
+		file.seek(offset)
+		size = int(np.frombuffer(file.read(_HEADER.itemsize), dtype=_HEADER)[0])
+		offset += _HEADER.itemsize
+		if (offset + size * METRICS_DTYPE.itemsize > end):
+			# A chunk that is still being written
+			return
+		yield offset, size
+		offset += size * METRICS_DTYPE.itemsize
+
+
+def read_metrics(file_path, fields=None):
+	"""
+	Reads the complete chunks of a metrics file, ignoring a chunk that is still being written
+	Parameters
+	----------
+	file_path : str
+	fields : list of str, optional
+		Metrics to read, all of them by default
+	Returns
+	-------
+	metrics : array
+		Structured array with the requested columns out of step, coop, flips and mean_payoff
+	"""
+	fields = METRICS_DTYPE.names if fields is None else tuple(fields)
+	dtype = np.dtype([(name, METRICS_DTYPE[name]) for name in fields])
+	with open(file_path, 'rb') as file:
+		chunks = list(_chunks(file))
+		metrics = np.zeros(sum(size for _, size in chunks), dtype=dtype)
+		position = 0
+		for offset, size in chunks:
+			for name in fields:
+				column = METRICS_DTYPE.names.index(name)
+				file.seek(offset + size * sum(METRICS_DTYPE[k].itemsize for k in range(column)))
+				metrics[name][position:position+size] = np.fromfile(file, dtype=METRICS_DTYPE[name], count=size)
+			position += size
+	return metrics
+
+
+def truncate_metrics(file_path, steps):
+	"""
+	Keeps the first steps of a metrics file, e.g. before resuming a run
+	Parameters
+	----------
+	file_path : str
+	steps : int
+		Number of steps to keep
+	"""
+	if not os.path.exists(file_path):
+		return
+	with open(file_path, 'rb') as file:
+		kept, end, split = 0, 0, None
+		for offset, size in _chunks(file):
+			if (kept + size > steps):
+				split = (offset - _HEADER.itemsize, steps - kept)
+				break
+			kept += size
+			end = offset + size * METRICS_DTYPE.itemsize
+	if split is None:
+		os.truncate(file_path, end)
+		return
+	# The chunk holding the cut is rewritten with its first steps only
+	head = read_metrics(file_path)[kept:kept+split[1]]
+	os.truncate(file_path, split[0])
+	with MetricsWriter(file_path, buffer_steps=max(len(head), 1), mode='ab') as writer:
+		for record in head:
+			writer.write(*record.tolist())
@@ -0,0 +1,287 @@
+"""
+This module contains the per-node outputs of a run: the influence table written when a replica
+ends, as CSV or as compressed columns, and periodic binary snapshots of the full node state so a run
+can be analysed or resumed without simulating it again.
+"""
+import os
+import numpy as np
+from graph_generators import GridLabels
+
+path = os.path.split(os.path.realpath(__file__))
+INFLUENCE_DIR = os.path.normpath(path[0] + "/reports/influence")
+INFLUENCE_HEADER = ["Node Number", "Strategy (0 = cooperator, 1 = defector)", "Degree", "Number of Influences"]
+SNAPSHOT_MAGIC = b"PDSNAP01"
+
+
+def influence_file(title, table_format="csv", directory=INFLUENCE_DIR):
+	"""
+	Returns the file the influence table of a replica is written to
+	Parameters
+	----------
+	title : str
+		Title of the replica, path separators are replaced
+	table_format : str, default "csv"
+		"csv" or "npz"
+	directory : str, default INFLUENCE_DIR
+	Returns
+	-------
+	file_path : str
+	"""
+	name = title.replace("/", "_").replace(os.sep, "_")
+	return os.path.join(directory, name + "_influence." + table_format)
+
+
+def _node_labels(nodes):
+	"""
+	Converts node labels into the node column of the table without building Python tuples
+	Parameters
+	----------
+	nodes : sequence
+	Returns
+	-------
+	labels : array
+		Integer array when the labels are integers, (N, k) integer array for tuples of k integers
+		such as the (row, column) labels of a grid, object array otherwise
+	"""
+	if isinstance(nodes, range):
+		return np.arange(nodes.start, nodes.stop, nodes.step)
+	if isinstance(nodes, GridLabels):
+		return np.stack(np.divmod(np.arange(len(nodes), dtype=np.int64), nodes.cols), axis=1)
+	if isinstance(nodes, np.ndarray):
+		return nodes
+	labels = np.empty(len(nodes), dtype=object)
+	labels[:] = list(nodes)
+	if all(isinstance(label, (int, np.integer)) for label in labels):
+		return labels.astype(np.int64)
+	if len(labels) and all(isinstance(label, tuple) and len(label) == len(labels[0]) for label in labels):
+		columns = np.array(labels.tolist(), dtype=object)
+		if all(isinstance(value, (int, np.integer)) for value in columns.flat):
+			return columns.astype(np.int64)
+	return labels
+
+
+def _text_columns(text):
+	"""
+	Lays out text as rows of UTF-8 bytes
+	Parameters
+	----------
+	text : str or array
+		One string repeated on every row, or a string array with one string per row
+	Returns
+	-------
+	codes : array
+		uint8 array of shape (N, width) or (1, width) for a repeated string
+	keep : array
+		Boolean array of the same shape flagging the bytes that belong to the text
+	"""
+	if isinstance(text, str):
+		codes = np.frombuffer(text.encode(), dtype=np.uint8)[None, :]
+		return codes, np.ones(codes.shape, dtype=bool)
+	encoded = np.char.encode(text, "utf-8")
+	codes = encoded.view(np.uint8).reshape(len(encoded), encoded.dtype.itemsize)
+	return codes, np.arange(codes.shape[1]) < np.char.str_len(encoded)[:, None]
+
+
+def _integer_columns(values):
+	"""
+	Lays out integers as rows of ASCII decimal digits, computed for all rows at once
+	Parameters
+	----------
+	values : array
+	Returns
+	-------
+	codes : array
+		uint8 array of shape (N, width), the digits right-aligned
+	keep : array
+		Boolean array of the same shape flagging the sign and the digits without leading zeros
+	"""
+	values = np.asarray(values, dtype=np.int64)
+	magnitude = np.abs(values)
+	width = len(str(int(magnitude.max()))) if len(values) else 1
+	powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+	codes = (magnitude[:, None] // powers % 10).astype(np.uint8) + ord("0")
+	keep = magnitude[:, None] >= powers
+	keep[:, -1] = True
+	if (values < 0).any():
+		codes = np.concatenate((np.full((len(values), 1), ord("-"), dtype=np.uint8), codes), axis=1)
+		keep = np.concatenate(((values < 0)[:, None], keep), axis=1)
+	return codes, keep
+
+
+def _label_columns(labels):
+	"""
+	Lays out the node column of the CSV. Tuples are written as str would write them, quoted as they
+	contain commas, and other text labels are quoted with their quotes doubled
+	Parameters
+	----------
+	labels : array
+		Output of _node_labels
+	Returns
+	-------
+	pieces : list
+		(codes, keep) pairs of _text_columns and _integer_columns, in row order
+	"""
+	if (labels.ndim == 2):
+		pieces = [_text_columns('"(')]
+		for column in range(labels.shape[1]):
+			if column:
+				pieces.append(_text_columns(", "))
+			pieces.append(_integer_columns(labels[:, column]))
+		# A one-element tuple is written (x,)
+		pieces.append(_text_columns(',)"' if labels.shape[1] == 1 else ')"'))
+		return pieces
+	if (labels.dtype.kind in "iu"):
+		return [_integer_columns(labels)]
+	# Arbitrary labels, e.g. tuples mixing types, only have their str
+	text = np.char.replace(np.frompyfunc(str, 1, 1)(labels).astype(str), '"', '""')
+	return [_text_columns('"'), _text_columns(text), _text_columns('"')]
+
+
+def write_influence_table(title, nodes, strategy, degree, influences, table_format="csv", directory=INFLUENCE_DIR, chunk_rows=65536):
+	"""
+	Writes the node, strategy, degree and influence columns of a replica. The CSV rows of a chunk
+	are laid out as one byte matrix with array operations and written with a single tofile, npz
+	stores each column compressed
+	Parameters
+	----------
+	title : str
+	nodes : sequence
+		Node labels
+	strategy : array
+		Final strategy of each node (0 for cooperator, 1 for defector)
+	degree : array
+	influences : array
+		Number of times each node was copied
+	table_format : str, default "csv"
+		"csv" or "npz"
+	directory : str, default INFLUENCE_DIR
+	chunk_rows : int, default 65536
+		Rows formatted per write of the CSV
+	Returns
+	-------
+	file_path : str
+	"""
+	os.makedirs(directory, exist_ok=True)
+	file_path = influence_file(title, table_format, directory)
+	labels = _node_labels(nodes)
+	if (table_format == "npz"):
+		# Tuple labels are an (N, 2) column and strings a text column, neither needs pickling
+		node = np.asarray(labels.tolist()) if labels.dtype == object else labels
+		np.savez_compressed(file_path, node=node, strategy=np.asarray(strategy, dtype=np.int8),
+							degree=np.asarray(degree, dtype=np.int64), influences=np.asarray(influences, dtype=np.int64))
+		return file_path
+	if (table_format != "csv"):
+		raise ValueError("Unknown table format: " + str(table_format))
+	columns = (np.asarray(strategy), np.asarray(degree), np.asarray(influences))
+	with open(file_path, 'wb') as file:
+		file.write((",".join('"' + name + '"' if "," in name else name for name in INFLUENCE_HEADER) + "\r\n").encode())
+		for start in range(0, len(labels), chunk_rows):
+			stop = start + chunk_rows
+			pieces = _label_columns(labels[start:stop])
+			for column in columns:
+				pieces += [_text_columns(","), _integer_columns(column[start:stop])]
+			pieces.append(_text_columns("\r\n"))
+			rows = len(labels[start:stop])
+			codes = np.concatenate([np.broadcast_to(codes, (rows, codes.shape[1])) for codes, _ in pieces], axis=1)
+			keep = np.concatenate([np.broadcast_to(keep, (rows, keep.shape[1])) for _, keep in pieces], axis=1)
+			codes[keep].tofile(file)
+	return file_path
+
+
+def snapshot_dtype(n):
+	"""
+	Returns the record of one snapshot of n nodes
+	Parameters
+	----------
+	n : int
+	Returns
+	-------
+	dtype : np.dtype
+	"""
+	return np.dtype([("step", np.int64), ("strategy", np.int8, (n,)), ("influences", np.int64, (n,))])
+
+
+class SnapshotWriter:
+	"""
+	Appends fixed-size snapshots of the node state to a file after a header holding the number of
+	nodes, so snapshot k can be read without loading the others
+	Parameters
+	----------
+	file_path : str
+	n : int
+		Number of nodes
+	mode : str, default 'wb'
+		'ab' appends to an existing file of the same network, e.g. when resuming a run
+	"""
+
+	def __init__(self, file_path, n, mode='wb'):
+		self.file = open(file_path, mode)
+		self.record = np.zeros(1, dtype=snapshot_dtype(n))
+		if (self.file.tell() == 0):
+			self.file.write(SNAPSHOT_MAGIC + np.int64(n).tobytes())
+
+	def write(self, step, strategy, influences):
+		"""
+		Writes the state of the nodes at the start of a step
+		Parameters
+		----------
+		step : int
+		strategy : array
+		influences : array
+		"""
+		self.record["step"] = step
+		self.record["strategy"] = strategy
+		self.record["influences"] = influences
+		self.record.tofile(self.file)
+		self.file.flush()
+
+	def close(self):
+		"""
+		Closes the file
+		"""
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def read_snapshots(file_path):
+	"""
+	Maps the complete snapshots of a file, ignoring a snapshot that is still being written
+	Parameters
+	----------
+	file_path : str
+	Returns
+	-------
+	snapshots : array
+		Structured array with the step, strategy and influences of each snapshot
+	"""
+	header = len(SNAPSHOT_MAGIC) + 8
+	with open(file_path, 'rb') as file:
+		if (file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC):
+			raise ValueError("Not a snapshot file: " + str(file_path))
+		n = int(np.frombuffer(file.read(8), dtype=np.int64)[0])
+	dtype = snapshot_dtype(n)
+	count = (os.path.getsize(file_path) - header) // dtype.itemsize
+	if (count == 0):
+		return np.zeros(0, dtype=dtype)
+	return np.memmap(file_path, dtype=dtype, mode='r', offset=header, shape=(count,))
+
+
+def truncate_snapshots(file_path, count):
+	"""
+	Keeps the first snapshots of a file, e.g. before resuming a run
+	Parameters
+	----------
+	file_path : str
+	count : int
+		Number of snapshots to keep
+	"""
+	snapshots = read_snapshots(file_path) if os.path.exists(file_path) else []
+	if (len(snapshots) > count):
+		size = len(SNAPSHOT_MAGIC) + 8 + count * snapshots.dtype.itemsize
+		del snapshots
+		os.truncate(file_path, size)
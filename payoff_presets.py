@@ -0,0 +1,34 @@
+"""
+This module contains the named payoff matrices offered by main.py and the batch driver.
+"""
+# info: b = benefit given by cooperators, c = cost cooperators bear for giving out b
+# info: D is defector, C is cooperator. Left is 'i'or the current node, right is 'j' or neighbor node.
+# info: Assignment of values: [C:C,C:D], [D:C, D:D]
+# info: Values dictated by:   [b-c, -c], [b, 0]
+PAYOFF_PRESETS = {
+	"ws": [[1.5, -0.3], [1.8, 0]],
+	"fb": [[14.5, -0.5], [15, 0]],
+	"gh": [[2.7, -0.3], [3, 0]],
+	"gh_new": [[14.7, -0.3], [15, 0]],
+	"gh_k15": [[4.2, -0.3], [4.5, 0]],
+	"gh_k12": [[3.3, -0.3], [3.6, 0]],
+	"gh_k55": [[16.2, -0.3], [16.5, 0]],
+	"gh_k60": [[17.7, -0.3], [18, 0]],
+	"gh_k65": [[19.2, -0.3], [19.5, 0]],
+	"gh_k70": [[20.7, -0.3], [21, 0]],
+	"gh_k75": [[22.2, -0.3], [22.5, 0]],
+}
+
+PAYOFF_DESCRIPTIONS = {
+	"ws": "Watts-Strogatz's Normal Payoff",
+	"fb": "Facebook's Normal Payoff",
+	"gh": "GitHub's Normal Payoff",
+	"gh_new": "GitHub's NEW Payoff",
+	"gh_k15": "GitHub's k15 Payoff",
+	"gh_k12": "GitHub's k12 Payoff",
+	"gh_k55": "GitHub's k55 Payoff",
+	"gh_k60": "GitHub's k60 Payoff",
+	"gh_k65": "GitHub's k65 Payoff",
+	"gh_k70": "GitHub's k70 Payoff",
+	"gh_k75": "GitHub's k75 Payoff",
+}
@@ -0,0 +1,173 @@
+"""
+This module contains the instrumentation of the simulation loop. A Profiler records per-step and
+per-phase timings, counters and the memory high-water mark, hands each step to callbacks and can
+dump everything as JSON or in the Chrome trace format (chrome://tracing, Perfetto). The engine uses
+NULL_PROFILER when no profiler is given, whose methods do nothing.
+"""
+import json
+from time import perf_counter_ns
+from contextlib import contextmanager, nullcontext
+try:
+	import resource
+except ImportError:
+	# Not available on Windows, memory is then reported as None
+	resource = None
+
+
+def _max_rss_kb():
+	"""
+	Returns the peak resident set size of the process
+	Returns
+	-------
+	max_rss : int or None
+		Kilobytes on Linux, None where it cannot be measured
+	"""
+	if resource is None:
+		return None
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Profiler:
+	"""
+	Collects the timings and counters of a simulation run
+	Parameters
+	----------
+	callbacks : list, optional
+		Functions called with the record of every finished step
+	"""
+
+	enabled = True
+
+	def __init__(self, callbacks=None):
+		self.callbacks = list(callbacks or [])
+		self.steps = []
+		self.events = []
+		self._origin = perf_counter_ns()
+		self._record = None
+		self._step_start = None
+
+	def add_callback(self, callback):
+		"""
+		Registers a function called with the record of every finished step
+		Parameters
+		----------
+		callback : callable
+		"""
+		self.callbacks.append(callback)
+
+	def begin_step(self, step):
+		"""
+		Starts the record of a step
+		Parameters
+		----------
+		step : int
+		"""
+		self._record = {"step": step, "seconds": 0.0, "phases": {}, "counters": {}, "max_rss_kb": None}
+		self._step_start = perf_counter_ns()
+
+	@contextmanager
+	def phase(self, name):
+		"""
+		Times the enclosed block as one phase of the current step
+		Parameters
+		----------
+		name : str
+			payoffs, update_rule, commit or io in the engine
+		"""
+		start = perf_counter_ns()
+		try:
+			yield
+		finally:
+			end = perf_counter_ns()
+			phases = self._record["phases"]
+			phases[name] = phases.get(name, 0.0) + (end - start) / 1e9
+			self.events.append((name, start, end, self._record["step"]))
+
+	def count(self, name, value=1):
+		"""
+		Adds to a counter of the current step
+		Parameters
+		----------
+		name : str
+			edges, flips or rng_draws in the engine
+		value : int, default 1
+		"""
+		counters = self._record["counters"]
+		counters[name] = counters.get(name, 0) + value
+
+	def end_step(self):
+		"""
+		Closes the record of the current step and hands it to the callbacks
+		"""
+		end = perf_counter_ns()
+		record = self._record
+		record["seconds"] = (end - self._step_start) / 1e9
+		record["max_rss_kb"] = _max_rss_kb()
+		self.events.append(("step " + str(record["step"]), self._step_start, end, record["step"]))
+		self.steps.append(record)
+		for callback in self.callbacks:
+			callback(record)
+
+	def summary(self):
+		"""
+		Totals of the recorded steps
+		Returns
+		-------
+		summary : dict
+			Number of steps, total seconds, seconds per phase, counter totals and peak memory
+		"""
+		phases, counters = {}, {}
+		for record in self.steps:
+			for name, seconds in record["phases"].items():
+				phases[name] = phases.get(name, 0.0) + seconds
+			for name, value in record["counters"].items():
+				counters[name] = counters.get(name, 0) + value
+		memory = [record["max_rss_kb"] for record in self.steps if record["max_rss_kb"] is not None]
+		return {"steps": len(self.steps), "seconds": sum(record["seconds"] for record in self.steps),
+				"phases": phases, "counters": counters, "max_rss_kb": max(memory) if memory else None}
+
+	def dump_json(self, file_path):
+		"""
+		Writes the summary and every step record as JSON
+		Parameters
+		----------
+		file_path : str
+		"""
+		with open(file_path, 'w') as file:
+			json.dump({"summary": self.summary(), "steps": self.steps}, file, indent=1)
+
+	def dump_chrome_trace(self, file_path):
+		"""
+		Writes the steps and phases as complete events of the Chrome trace format
+		Parameters
+		----------
+		file_path : str
+		"""
+		events = [{"name": name, "ph": "X", "pid": 0, "tid": 0, "ts": (start - self._origin) / 1e3,
+					"dur": (end - start) / 1e3, "args": {"step": step}} for name, start, end, step in self.events]
+		with open(file_path, 'w') as file:
+			json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+class _NullProfiler:
+	"""
+	Stand-in used when profiling is off, every call returns immediately
+	"""
+
+	enabled = False
+	_phase = nullcontext()
+
+	def begin_step(self, step):
+		pass
+
+	def phase(self, name):
+		return self._phase
+
+	def count(self, name, value=1):
+		pass
+
+	def end_step(self):
+		pass
+
+
+NULL_PROFILER = _NullProfiler()
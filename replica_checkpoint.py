@@ -0,0 +1,113 @@
+"""
+This module contains the checkpoint file of a single replica. A checkpoint holds everything the CSR
+engine needs to continue a run exactly where it stopped: the next step, strategies, influence
+counts, the time series so far and the state of the random number source. It is an npz file
+replaced atomically, so a job killed while writing keeps the previous checkpoint.
+"""
+import os
+import json
+import numpy as np
+from collections import deque
+from rng_streams import CounterStreams
+
+
+def _rng_state(rng):
+	"""
+	Describes a random source so it can be rebuilt
+	Parameters
+	----------
+	rng : np.random.Generator or CounterStreams
+	Returns
+	-------
+	state : dict
+	"""
+	if isinstance(rng, CounterStreams):
+		return {"counter": {"entropy": rng.seed.entropy, "spawn_key": list(rng.seed.spawn_key), "replica": rng.replica}}
+	return {"bit_generator": rng.bit_generator.state}
+
+
+def _restore_rng(state):
+	"""
+	Rebuilds the random source described by _rng_state
+	Parameters
+	----------
+	state : dict
+	Returns
+	-------
+	rng : np.random.Generator or CounterStreams
+	"""
+	if "counter" in state:
+		counter = state["counter"]
+		return CounterStreams(np.random.SeedSequence(counter["entropy"], spawn_key=counter["spawn_key"]), counter["replica"])
+	bit_generator = getattr(np.random, state["bit_generator"]["bit_generator"])()
+	bit_generator.state = state["bit_generator"]
+	return np.random.Generator(bit_generator)
+
+
+def _to_list(value):
+	"""
+	Lets json write the arrays found in some bit generator states
+	Parameters
+	----------
+	value : array
+	Returns
+	-------
+	value : list
+	"""
+	return np.asarray(value).tolist()
+
+
+def save_checkpoint(checkpoint_path, params, step, strategy, influences, time_series, coop_sum, recent, rng):
+	"""
+	Writes the state of a replica at the start of a step
+	Parameters
+	----------
+	checkpoint_path : str
+	params : dict
+		Parameters of the run, checked when resuming
+	step : int
+		Next step to run, the number of steps when the run is finished
+	strategy : array
+	influences : array
+	time_series : deque
+		Proportions of cooperators of the steps already run, empty when the series is not kept
+	coop_sum : float
+		Sum of the proportions of the steps already run
+	recent : deque or None
+		Proportions of the convergence window
+	rng : np.random.Generator or CounterStreams
+		Random source about to draw the numbers of step
+	"""
+	header = {"params": params, "step": step, "coop_sum": coop_sum, "rng": _rng_state(rng),
+			"window": None if recent is None else recent.maxlen}
+	partial = checkpoint_path + ".partial"
+	with open(partial, 'wb') as file:
+		np.savez(file, header=np.array(json.dumps(header, default=_to_list)), strategy=strategy, influences=influences,
+				time_series=np.fromiter(time_series, dtype=np.float64, count=len(time_series)),
+				recent=np.array([] if recent is None else list(recent), dtype=np.float64))
+	os.replace(partial, checkpoint_path)
+
+
+def load_checkpoint(checkpoint_path, params=None):
+	"""
+	Reads a replica checkpoint
+	Parameters
+	----------
+	checkpoint_path : str
+	params : dict, optional
+		Parameters of the run being resumed, a ValueError is raised if they differ from the saved ones
+	Returns
+	-------
+	checkpoint : dict
+		params, step, coop_sum, rng (the rebuilt random source), strategy, influences, time_series
+		and recent (a bounded deque or None)
+	"""
+	with np.load(checkpoint_path) as data:
+		header = json.loads(str(data["header"]))
+		checkpoint = {name: data[name] for name in ("strategy", "influences", "time_series")}
+		recent = data["recent"].tolist()
+	if params is not None and json.loads(json.dumps(params, default=_to_list)) != header["params"]:
+		raise ValueError("Checkpoint " + str(checkpoint_path) + " was written with other parameters")
+	checkpoint.update(params=header["params"], step=header["step"], coop_sum=header["coop_sum"], rng=_restore_rng(header["rng"]),
+					recent=None if header["window"] is None else deque(recent, maxlen=header["window"]))
+	return checkpoint
@@ -0,0 +1,298 @@
+"""
+This module contains functions to run independent replicas of the simulation over a pool of worker
+processes. The network is placed once in shared memory, every worker attaches to it when the pool
+starts and each replica gets its own reproducible random stream spawned from a single SeedSequence.
+"""
+import os
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from evolutionary_game_theory import one_replica_simulation, lockstep_replica_simulation
+from csr_graph import to_csr, share_csr, attach_csr
+from graph_generators import Lattice
+from rng_streams import CounterStreams, seed_sequence
+from result_cache import graph_digest, cacheable, write_cached_influences
+
+_worker_graph = None
+_worker_shm = None
+
+
+def _init_worker(G):
+	"""
+	Stores the network in the worker process so tasks only carry the simulation parameters
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	"""
+	global _worker_graph
+	_worker_graph = G
+
+
+def _attach_worker(handle):
+	"""
+	Attaches the worker process to the shared CSR graph
+	Parameters
+	----------
+	handle : tuple
+		Description returned by share_csr
+	"""
+	global _worker_graph, _worker_shm
+	_worker_shm, _worker_graph = attach_csr(handle)
+
+
+def _run_replica(task):
+	"""
+	Runs one replica inside a worker process
+	Parameters
+	----------
+	task : tuple
+		(W, steps, x0, beta, choice_factor, title, rng, options), rng is the replica's spawned
+		SeedSequence or CounterStreams
+	Returns
+	-------
+	p : float
+		mean proportion of nodes using cooperative strategy
+	time_series : deque
+		time series of the proportion of nodes using cooperative strategy in each time step
+	"""
+	W, steps, x0, beta, choice_factor, title, rng, options = task
+	return one_replica_simulation(_worker_graph, W, steps, x0, beta, choice_factor, title, rng=rng, **options)
+
+
+def run_replicas(G, W, steps, x0, beta, replicas, choice_factor, titles=None, workers=1, seed=None, metrics_dir=None, pool=None, lockstep=False, counter_rng=False, checkpoint_dir=None, snapshot_dir=None,
+					cache=None, **options):
+	"""
+	Runs a given number of replicas and returns their results in replica order
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	W : array
+		Payoff matrix
+	steps : int
+		Number of epochs to run
+	x0 : float
+		Proportion of initial nodes using cooperative strategy
+	beta : float
+		Parameter that models the importance of the difference in Fermi updating rule
+	replicas : int
+		Number of replicas to execute
+	choice_factor : int
+		Choice of how nodes will decide to update their strategy
+	titles : list, optional
+		Title of each replica for its influence csv, no csv is written when omitted
+	workers : int, default 1
+		Number of worker processes, 1 runs every replica in the calling process
+	seed : int, np.random.SeedSequence or np.random.Generator, optional
+		Root seed, the same seed gives the same results for any number of workers. A Generator
+		gives a new root on every call, see rng_streams.seed_sequence
+	metrics_dir : str, optional
+		Directory where replica k streams its per-step metrics to replica_<k+1>.metrics
+	pool : ProcessPoolExecutor, optional
+		Pool opened by replica_pool for the same network, reused instead of starting a new one
+	lockstep : bool, default False
+		If True all replicas advance together in the calling process with
+		lockstep_replica_simulation, which only takes the fermi_table and early_stop options
+	counter_rng : bool, default False
+		If True replica k draws step t from the Philox stream (k, t) of rng_streams.CounterStreams
+		instead of its own spawned Generator, so lockstep and separate replicas get the same numbers
+	checkpoint_dir : str, optional
+		Directory where replica k keeps its checkpoint replica_<k+1>.ckpt, running the same
+		replicas again resumes each one from its checkpoint (pass checkpoint_every or
+		checkpoint_seconds in options for periodic checkpoints)
+	snapshot_dir : str, optional
+		Directory where replica k writes its node-state snapshots to replica_<k+1>.snap (pass
+		snapshot_every in options for periodic snapshots)
+	cache : result_cache.ResultCache, optional
+		Cache the replicas are read from and stored in. Only seeded runs that stream no metrics,
+		checkpoints or snapshots are cached, replica k of a seed is the same for any number of
+		replicas so only the missing ones are simulated
+	**options
+		Extra keyword arguments for one_replica_simulation
+	Returns
+	-------
+	results : list
+		(p, time_series) of each replica
+	"""
+	root = seed_sequence(seed)
+	if lockstep:
+		if metrics_dir is not None or checkpoint_dir is not None or snapshot_dir is not None:
+			raise ValueError("Lockstep replicas do not stream metrics, checkpoints or snapshots")
+		return lockstep_replica_simulation(G, W, steps, x0, beta, replicas, choice_factor, titles, rng=CounterStreams(root) if counter_rng else root,
+											fermi_table=options.get("fermi_table", False), early_stop=options.get("early_stop", True))
+	if titles is None:
+		titles = [None] * replicas
+	if counter_rng:
+		streams = CounterStreams(root)
+		rngs = [streams.for_replica(k) for k in range(replicas)]
+	else:
+		rngs = root.spawn(replicas)
+	tasks = [(W, steps, x0, beta, choice_factor, titles[k], rng, _replica_options(options, metrics_dir, checkpoint_dir, snapshot_dir, k))
+			for k, rng in enumerate(rngs)]
+	if cache is not None and seed is not None and metrics_dir is None and checkpoint_dir is None and snapshot_dir is None and cacheable(options):
+		return _run_cached_replicas(G, tasks, cache, pool, workers, options)
+	return _run_tasks(G, tasks, pool, workers, options)
+
+
+def _run_tasks(G, tasks, pool, workers, options):
+	"""
+	Runs replica tasks in the calling process, an open pool or a new one
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	tasks : list
+		Task tuples of _run_replica
+	pool : ProcessPoolExecutor or None
+	workers : int
+	options : dict
+		Options shared by the replicas, the engine decides how the pool holds the network
+	Returns
+	-------
+	results : list
+		Result of each task
+	"""
+	if pool is not None:
+		return list(pool.map(_run_replica, tasks))
+	if (workers == 1):
+		_init_worker(G)
+		return [_run_replica(task) for task in tasks]
+	with replica_pool(G, workers, options.get("engine", "csr")) as pool:
+		return list(pool.map(_run_replica, tasks))
+
+
+def _run_cached_replicas(G, tasks, cache, pool, workers, options):
+	"""
+	Reads the replicas found in the cache, simulates the others and stores them
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	tasks : list
+		Task tuples of _run_replica
+	cache : result_cache.ResultCache
+	pool : ProcessPoolExecutor or None
+	workers : int
+	options : dict
+	Returns
+	-------
+	results : list
+		(p, time_series) of each replica
+	"""
+	digest = graph_digest(G)
+	keys = [cache.key(digest, W, steps, x0, beta, choice_factor, rng, options) for W, steps, x0, beta, choice_factor, _, rng, _ in tasks]
+	entries = [cache.get(key) for key in keys]
+	missing = [k for k, entry in enumerate(entries) if entry is None]
+	for task, entry in zip(tasks, entries):
+		if entry is not None and task[5] is not None:
+			write_cached_influences(G, task[5], entry, options.get("influence_format", "csv"))
+	runs = _run_tasks(G, [tasks[k][:7] + (dict(tasks[k][7], return_state=True),) for k in missing], pool, workers, options)
+	for k, (p, time_series, state) in zip(missing, runs):
+		cache.put(keys[k], p, time_series, state)
+		entries[k] = {"p": p, "time_series": time_series}
+	if missing:
+		cache.evict()
+	return [(entry["p"], entry["time_series"]) for entry in entries]
+
+
+def metrics_file(metrics_dir, replica):
+	"""
+	Returns the metrics file of a replica streamed by run_replicas
+	Parameters
+	----------
+	metrics_dir : str
+	replica : int
+		Zero-based replica index
+	Returns
+	-------
+	file_path : str
+	"""
+	return os.path.join(metrics_dir, "replica_%03d.metrics" % (replica + 1))
+
+
+def checkpoint_file(checkpoint_dir, replica):
+	"""
+	Returns the checkpoint file of a replica run by run_replicas
+	Parameters
+	----------
+	checkpoint_dir : str
+	replica : int
+		Zero-based replica index
+	Returns
+	-------
+	file_path : str
+	"""
+	return os.path.join(checkpoint_dir, "replica_%03d.ckpt" % (replica + 1))
+
+
+def snapshot_file(snapshot_dir, replica):
+	"""
+	Returns the snapshot file of a replica run by run_replicas
+	Parameters
+	----------
+	snapshot_dir : str
+	replica : int
+		Zero-based replica index
+	Returns
+	-------
+	file_path : str
+	"""
+	return os.path.join(snapshot_dir, "replica_%03d.snap" % (replica + 1))
+
+
+def _replica_options(options, metrics_dir, checkpoint_dir, snapshot_dir, replica):
+	"""
+	Adds the per-replica metrics, checkpoint and snapshot files to the simulation options
+	Parameters
+	----------
+	options : dict
+		Keyword arguments shared by every replica
+	metrics_dir : str or None
+	checkpoint_dir : str or None
+	snapshot_dir : str or None
+	replica : int
+		Zero-based replica index
+	Returns
+	-------
+	options : dict
+		Keyword arguments of this replica
+	"""
+	options = dict(options)
+	if metrics_dir is not None:
+		os.makedirs(metrics_dir, exist_ok=True)
+		options["metrics_path"] = metrics_file(metrics_dir, replica)
+	if checkpoint_dir is not None:
+		os.makedirs(checkpoint_dir, exist_ok=True)
+		options["checkpoint_path"] = checkpoint_file(checkpoint_dir, replica)
+	if snapshot_dir is not None:
+		os.makedirs(snapshot_dir, exist_ok=True)
+		options["snapshot_path"] = snapshot_file(snapshot_dir, replica)
+	return options
+
+
+@contextmanager
+def replica_pool(G, workers, engine="csr"):
+	"""
+	Opens a process pool whose workers hold the network, tasks submitted to it are run with
+	_run_replica. For the CSR engine the network is placed in shared memory for the pool's lifetime
+	Parameters
+	----------
+	G : nx.Graph or CSRGraph
+	workers : int
+		Number of worker processes
+	engine : str, default "csr"
+		Engine the tasks will use
+	Yields
+	------
+	pool : ProcessPoolExecutor
+	"""
+	# The original dict engine walks a networkx graph, so only the CSR engine can use shared memory. A
+	# Lattice holds no adjacency and is sent to the workers as it is
+	if (engine != "csr" or isinstance(G, Lattice)):
+		with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(G,)) as pool:
+			yield pool
+		return
+	shm, handle = share_csr(to_csr(G))
+	try:
+		with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker, initargs=(handle,)) as pool:
+			yield pool
+	finally:
+		shm.close()
+		shm.unlink()
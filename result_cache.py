@@ -0,0 +1,235 @@
+"""
+This module contains the persistent cache of replica results. Every replica is stored under a hash
+of the network content, the simulation parameters and the identity of its random stream, so a
+configuration that was already simulated is read back instead of run again, and asking for more
+replicas than are cached only runs the missing ones. The least recently used entries are evicted
+once the cache grows past its size cap.
+"""
+import os
+import json
+import hashlib
+import zipfile
+import numpy as np
+from collections import deque
+from csr_graph import to_csr
+from graph_generators import Lattice, GridLabels, lattice_degree
+from node_state import write_influence_table
+from rng_streams import CounterStreams
+
+path = os.path.split(os.path.realpath(__file__))
+RESULT_CACHE_DIR = os.path.normpath(path[0] + "/result_cache")
+# Options that only choose what a run writes besides its results, they are left out of the key
+OUTPUT_OPTIONS = ("influence_format", "snapshot_every", "checkpoint_every", "checkpoint_seconds")
+# Options whose outputs a cached result cannot reproduce, runs using them are never cached
+UNCACHED_OPTIONS = ("metrics_path", "snapshot_path", "checkpoint_path", "frame_renderer", "profiler", "return_state")
+
+
+def graph_digest(G):
+	"""
+	Hashes the structure of a network, node and neighbor order included as they change the runs. Node
+	labels are left out, two networks that only differ by them give the same runs
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	Returns
+	-------
+	digest : str
+		SHA-256 of the indptr and indices CSR arrays, or of the shape of a Lattice
+	"""
+	if isinstance(G, Lattice):
+		return hashlib.sha256(json.dumps(["lattice"] + list(G)).encode()).hexdigest()
+	csr = to_csr(G)
+	digest = hashlib.sha256()
+	digest.update(np.ascontiguousarray(csr.indptr, dtype=np.int64).tobytes())
+	digest.update(np.ascontiguousarray(csr.indices, dtype=np.int32).tobytes())
+	return digest.hexdigest()
+
+
+def _rng_identity(rng):
+	"""
+	Describes the random stream of a replica, two replicas with the same identity draw the same numbers
+	Parameters
+	----------
+	rng : np.random.SeedSequence or CounterStreams
+	Returns
+	-------
+	identity : list
+	"""
+	if isinstance(rng, CounterStreams):
+		return ["counter", rng.seed.entropy, list(rng.seed.spawn_key), rng.replica]
+	return ["seed_sequence", rng.entropy, list(rng.spawn_key), rng.pool_size]
+
+
+def _to_list(value):
+	"""
+	Lets json write arrays, e.g. an array seed or a payoff matrix
+	Parameters
+	----------
+	value : array
+	Returns
+	-------
+	value : list
+	"""
+	return np.asarray(value).tolist()
+
+
+def cacheable(options):
+	"""
+	Tells whether runs with these options can be served from the cache
+	Parameters
+	----------
+	options : dict
+		Keyword arguments for one_replica_simulation
+	Returns
+	-------
+	cacheable : bool
+	"""
+	return options.get("keep_series", True) and not any(options.get(name) is not None for name in UNCACHED_OPTIONS)
+
+
+class ResultCache:
+	"""
+	Directory of replica results, one npz file per replica holding its mean, time series, final
+	strategies and influences. A read refreshes the modification time of the entry, which is the
+	recency evict goes by
+	Parameters
+	----------
+	cache_dir : str, default RESULT_CACHE_DIR
+	max_bytes : int, default 2**30
+		Size the cache is brought back under by evict
+	"""
+
+	def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=2**30):
+		self.cache_dir = cache_dir
+		self.max_bytes = max_bytes
+		os.makedirs(cache_dir, exist_ok=True)
+
+	def key(self, digest, W, steps, x0, beta, choice_factor, rng, options=None):
+		"""
+		Returns the key of one replica
+		Parameters
+		----------
+		digest : str
+			graph_digest of the network
+		W : array
+		steps : int
+		x0 : float
+		beta : float
+		choice_factor : int
+		rng : np.random.SeedSequence or CounterStreams
+			Random stream of the replica
+		options : dict, optional
+			Keyword arguments for one_replica_simulation
+		Returns
+		-------
+		key : str
+		"""
+		options = {name: value for name, value in (options or {}).items() if name not in OUTPUT_OPTIONS}
+		params = {"graph": digest, "W": np.asarray(W, dtype=float).tolist(), "steps": steps, "x0": x0, "beta": beta,
+				"choice_factor": choice_factor, "rng": _rng_identity(rng), "options": options}
+		return hashlib.sha256(json.dumps(params, sort_keys=True, default=_to_list).encode()).hexdigest()
+
+	def entry_file(self, key):
+		"""
+		Returns the file of an entry
+		Parameters
+		----------
+		key : str
+		Returns
+		-------
+		file_path : str
+		"""
+		return os.path.join(self.cache_dir, key + ".npz")
+
+	def get(self, key):
+		"""
+		Reads an entry and marks it as recently used
+		Parameters
+		----------
+		key : str
+		Returns
+		-------
+		entry : dict or None
+			p, time_series (a deque), strategy and influences, None when the entry is missing
+		"""
+		file_path = self.entry_file(key)
+		try:
+			with np.load(file_path) as data:
+				entry = {name: data[name] for name in ("strategy", "influences")}
+				entry.update(p=data["p"][()], time_series=deque(data["time_series"].tolist()))
+		except FileNotFoundError:
+			return None
+		except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+			# An entry another process was evicting or left unreadable is simulated again
+			return None
+		try:
+			os.utime(file_path)
+		except FileNotFoundError:
+			pass
+		return entry
+
+	def put(self, key, p, time_series, state):
+		"""
+		Stores the result of one replica
+		Parameters
+		----------
+		key : str
+		p : float
+		time_series : deque
+		state : dict
+			strategy and influences arrays returned by one_replica_simulation with return_state
+		"""
+		file_path = self.entry_file(key)
+		# Written under a temporary name so an interrupted write never leaves a corrupt entry behind
+		partial = file_path + ".partial.npz"
+		np.savez(partial, p=np.float64(p), time_series=np.fromiter(time_series, dtype=np.float64, count=len(time_series)),
+				strategy=np.asarray(state["strategy"], dtype=np.int8), influences=np.asarray(state["influences"], dtype=np.int64))
+		os.replace(partial, file_path)
+
+	def evict(self):
+		"""
+		Deletes the least recently used entries until the cache fits in max_bytes
+		Returns
+		-------
+		removed : int
+			Number of entries deleted
+		"""
+		entries = []
+		for name in os.listdir(self.cache_dir):
+			if name.endswith(".npz") and not name.endswith(".partial.npz"):
+				try:
+					stat = os.stat(os.path.join(self.cache_dir, name))
+				except FileNotFoundError:
+					continue
+				entries.append((stat.st_mtime_ns, stat.st_size, name))
+		total = sum(size for _, size, _ in entries)
+		removed = 0
+		for _, size, name in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(os.path.join(self.cache_dir, name))
+			except FileNotFoundError:
+				pass
+			total -= size
+			removed += 1
+		return removed
+
+
+def write_cached_influences(G, title, entry, table_format="csv"):
+	"""
+	Writes the influence table of a replica served from the cache, as the run would have
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	title : str
+	entry : dict
+		Entry returned by ResultCache.get
+	table_format : str, default "csv"
+	"""
+	if isinstance(G, Lattice):
+		nodes, degree = GridLabels(G.rows, G.cols), lattice_degree(G).reshape(-1)
+	else:
+		csr = to_csr(G)
+		nodes, degree = csr.nodes, csr.degree
+	write_influence_table(title, nodes, entry["strategy"], degree, entry["influences"], table_format)
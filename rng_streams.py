@@ -0,0 +1,207 @@
+"""
+This module contains the random number sources of the simulation. An engine receives either a
+numpy Generator, drawing each step's numbers as one block from a single stream, or CounterStreams,
+where the numbers of every (replica, step) come from their own Philox counter and can be
+regenerated without replaying the steps before them.
+"""
+import numpy as np
+
+
+class CounterStreams:
+	"""
+	Counter-based Philox streams derived from one seed. The stream of a step is found by setting the
+	counter to (replica, step), so it does not depend on how many numbers earlier steps used and
+	a single step of a single replica can be regenerated on its own
+	Parameters
+	----------
+	seed : int, np.random.SeedSequence or np.random.Generator, optional
+		Seed of the Philox key, see seed_sequence, a fresh one is drawn from the OS when omitted
+	replica : int, default 0
+		Replica whose streams generator returns when no replica is given
+	"""
+
+	def __init__(self, seed=None, replica=0):
+		seed = seed_sequence(seed)
+		self.seed = seed
+		self.key = seed.generate_state(2, dtype=np.uint64)
+		self.replica = replica
+
+	def for_replica(self, replica):
+		"""
+		Returns the streams of another replica under the same key
+		Parameters
+		----------
+		replica : int
+		Returns
+		-------
+		streams : CounterStreams
+		"""
+		return CounterStreams(self.seed, replica)
+
+	def generator(self, step, replica=None):
+		"""
+		Returns the generator of one step
+		Parameters
+		----------
+		step : int
+			Time step, -1 for the initial strategies
+		replica : int, optional
+			Defaults to the replica of these streams
+		Returns
+		-------
+		rng : np.random.Generator
+		"""
+		replica = self.replica if replica is None else replica
+		# Each (replica, step) owns the low 128 bits of the counter, far more than a step draws
+		counter = [0, 0, step + 1, replica]
+		return np.random.Generator(np.random.Philox(key=self.key, counter=counter))
+
+
+def seed_sequence(seed=None):
+	"""
+	Turns a root seed into a SeedSequence
+	Parameters
+	----------
+	seed : int, np.random.SeedSequence or np.random.Generator, optional
+		A Generator gives a child of the SeedSequence it was seeded with, so a Generator seeded
+		the same way gives the same sequence and every further call on it a new one
+	Returns
+	-------
+	seed : np.random.SeedSequence
+	"""
+	if isinstance(seed, np.random.SeedSequence):
+		return seed
+	if isinstance(seed, np.random.Generator):
+		seed_seq = seed.bit_generator.seed_seq
+		if isinstance(seed_seq, np.random.SeedSequence):
+			return seed_seq.spawn(1)[0]
+		# A bit generator restored from a state has no SeedSequence, its numbers seed one instead
+		return np.random.SeedSequence(seed.integers(0, 2**63, 4).tolist())
+	return np.random.SeedSequence(seed)
+
+
+def make_rng(rng=None):
+	"""
+	Turns the rng argument of a simulation entry point into a random source
+	Parameters
+	----------
+	rng : int, np.random.SeedSequence, np.random.Generator or CounterStreams, optional
+		Generators and CounterStreams are returned unchanged, anything else seeds a new Generator
+	Returns
+	-------
+	rng : np.random.Generator or CounterStreams
+	"""
+	if isinstance(rng, CounterStreams):
+		return rng
+	return np.random.default_rng(rng)
+
+
+def step_rng(rng, step):
+	"""
+	Returns the generator the numbers of a step are drawn from
+	Parameters
+	----------
+	rng : np.random.Generator or CounterStreams
+	step : int
+		Time step, -1 for the initial strategies
+	Returns
+	-------
+	rng : np.random.Generator
+	"""
+	if isinstance(rng, CounterStreams):
+		return rng.generator(step)
+	return rng
+
+
+# Python-level cost of jumping to one range of a block, in uniform numbers drawn in the same time
+JUMP_COST = 1024
+
+
+def draw_ranges(rng, total, starts, stops, return_drawn=False):
+	"""
+	Draws the numbers of some ranges of a block of uniform numbers without drawing the rest, when
+	the bit generator can jump ahead (PCG64, Philox). The numbers and the final state of rng are
+	those of rng.random(total), so a run drawing a few ranges matches one drawing the whole block
+	Parameters
+	----------
+	rng : np.random.Generator
+	total : int
+		Size of the block
+	starts, stops : array
+		Sorted, non-overlapping ranges of positions in the block
+	return_drawn : bool, default False
+		If True the number of uniform numbers actually drawn is also returned
+	Returns
+	-------
+	draws : array
+		Numbers of the ranges, concatenated
+	drawn : int
+		Only with return_drawn, total when the whole block was drawn
+	"""
+	starts, stops = np.asarray(starts, dtype=np.int64), np.asarray(stops, dtype=np.int64)
+	if (len(starts) > 1):
+		# Ranges that touch are drawn as one
+		separate = starts[1:] != stops[:-1]
+		starts, stops = starts[np.append(True, separate)], stops[np.append(separate, True)]
+	bit_generator = rng.bit_generator
+	state = bit_generator.state
+	if isinstance(bit_generator, np.random.PCG64):
+		jumps = len(starts) * JUMP_COST < total
+	elif isinstance(bit_generator, np.random.Philox):
+		# Philox jumps by blocks of four numbers, only from an empty buffer
+		jumps = len(starts) * JUMP_COST < total and state["buffer_pos"] == 4
+	else:
+		jumps = False
+	if not jumps:
+		lengths = stops - starts
+		offsets = np.cumsum(lengths) - lengths
+		draws = rng.random(total)[np.repeat(starts - offsets, lengths) + np.arange(int(lengths.sum()))]
+		return (draws, total) if return_drawn else draws
+	parts = []
+	position = 0
+	for start, stop in zip(starts.tolist(), stops.tolist()):
+		position = _jump(rng, state, position, start)
+		parts.append(rng.random(stop - start))
+		position = stop
+	_jump(rng, state, position, total)
+	# Jumping resets the buffered 32-bit half, which random(total) would have left alone
+	final = bit_generator.state
+	final["has_uint32"], final["uinteger"] = state["has_uint32"], state["uinteger"]
+	bit_generator.state = final
+	draws = np.concatenate(parts) if parts else np.empty(0)
+	if not return_drawn:
+		return draws
+	drawn = int((stops - starts).sum())
+	if isinstance(bit_generator, np.random.Philox):
+		# Every jump of Philox draws the numbers between its block of four and the target
+		drawn += int((starts % 4).sum()) + total % 4
+	return draws, drawn
+
+
+def _jump(rng, state, position, target):
+	"""
+	Moves rng from a position of the block to a later one
+	Parameters
+	----------
+	rng : np.random.Generator
+		Using PCG64 or Philox
+	state : dict
+		State of the bit generator at the start of the block
+	position : int
+		Numbers drawn so far
+	target : int
+	Returns
+	-------
+	position : int
+		target
+	"""
+	bit_generator = rng.bit_generator
+	if isinstance(bit_generator, np.random.PCG64):
+		if target > position:
+			bit_generator.advance(target - position)
+		return target
+	bit_generator.state = state
+	if target >= 4:
+		bit_generator.advance(target // 4)
+	rng.random(target % 4)
+	return target
@@ -0,0 +1,7 @@
+"""
+The modules of the repository live at its root, this makes them importable from the tests.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
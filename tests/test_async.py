@@ -0,0 +1,34 @@
+"""
+Tests of the asynchronous (random sequential) update, choice factor 3.
+"""
+import networkx as nx
+import numpy as np
+import pytest
+from csr_graph import to_csr, adjacency_matrix
+from graph_generators import watts_strogatz_csr
+from evolutionary_game_theory import one_replica_simulation, _async_fermi_update, _count_coop_neighbors
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+def test_dict_engine_rejects_async_updates():
+	with pytest.raises(ValueError):
+		one_replica_simulation(nx.cycle_graph(10), W, 5, 0.5, 0.1, 3, None, engine="dict", rng=0)
+
+
+def test_async_step_keeps_neighbor_counts_exact():
+	csr = to_csr(watts_strogatz_csr(500, 6, 0.3, seed=3))
+	rng = np.random.default_rng(8)
+	strategy = (rng.random(500) < 0.5).astype(np.int8)
+	A = adjacency_matrix(csr)
+	coop = _count_coop_neighbors(A, strategy)
+	for _ in range(5):
+		_async_fermi_update(csr, strategy, coop, W, 0.5, rng)
+		assert np.array_equal(coop, _count_coop_neighbors(A, strategy))
+
+
+def test_async_runs_are_reproducible():
+	G = watts_strogatz_csr(400, 4, 0.1, seed=1)
+	first = one_replica_simulation(G, W, 20, 0.5, 0.5, 3, None, rng=4)
+	second = one_replica_simulation(G, W, 20, 0.5, 0.5, 3, None, rng=4)
+	assert first[0] == second[0] and list(first[1]) == list(second[1])
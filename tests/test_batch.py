@@ -0,0 +1,29 @@
+"""
+Unknown payoff names are reported with the valid presets before any job runs.
+"""
+import pytest
+import batch
+
+
+def test_unknown_payoff_lists_presets(monkeypatch):
+	monkeypatch.setattr(batch, "load_network", lambda *args, **kwargs: pytest.fail("a job ran"))
+	with pytest.raises(ValueError, match="valid presets are .*gh_k15.*ws"):
+		batch.run_jobs([{"payoff": "ws"}, {"payoff": "nope"}])
+
+
+def test_unknown_payoff_flag_is_a_usage_error(capsys):
+	with pytest.raises(SystemExit) as exit_info:
+		batch.main(["--payoff", "nope"])
+	assert exit_info.value.code == 2
+	assert "unknown payoff 'nope'" in capsys.readouterr().err
+
+
+def test_job_file_presets_are_valid(tmp_path, monkeypatch):
+	job_file = tmp_path / "jobs.toml"
+	job_file.write_text('[payoffs]\nmine = [[1, 0], [1.5, 0]]\n\n[[jobs]]\npayoff = "mine"\n\n[[jobs]]\nturns = 5\n')
+	ran = []
+	monkeypatch.setattr(batch, "run_jobs", lambda jobs, presets, **kwargs: ran.append((jobs, presets)) or [0.5])
+	batch.main(["--jobs", str(job_file)])
+	assert ran[0][0] == [{"payoff": "mine"}, {"turns": 5}] and "mine" in ran[0][1]
+	with pytest.raises(SystemExit):
+		batch.main(["--jobs", str(job_file), "--payoff", "nope"])
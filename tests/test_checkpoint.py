@@ -0,0 +1,71 @@
+"""
+A replica killed and resumed from its checkpoint must finish exactly as an uninterrupted run.
+"""
+import numpy as np
+import pytest
+from graph_generators import watts_strogatz_csr, Lattice
+from metrics_writer import read_metrics
+from node_state import read_snapshots
+from profiling import Profiler
+from rng_streams import CounterStreams
+from replica_checkpoint import load_checkpoint
+from evolutionary_game_theory import one_replica_simulation
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+class _Killed(Exception):
+	pass
+
+
+class _KillingProfiler(Profiler):
+	"""
+	Stops the run when it reaches a given step, as if the process had been killed
+	"""
+
+	def __init__(self, step):
+		super().__init__()
+		self.kill_step = step
+
+	def begin_step(self, step):
+		if (step == self.kill_step):
+			raise _Killed()
+		super().begin_step(step)
+
+
+def _run(G, tmp_path, rng, choice_factor, profiler=None, **options):
+	return one_replica_simulation(G, W, 60, 0.5, 1.0, choice_factor, None, rng=rng, early_stop=False, profiler=profiler,
+								metrics_path=str(tmp_path / "replica.metrics"), snapshot_path=str(tmp_path / "replica.snap"), snapshot_every=7,
+								checkpoint_path=str(tmp_path / "replica.ckpt"), checkpoint_every=10, return_state=True, **options)
+
+
+@pytest.mark.parametrize("network", ["ws", "ws-incremental", "lattice"])
+@pytest.mark.parametrize("choice_factor", [1, 2, 3])
+@pytest.mark.parametrize("counter_rng", [False, True])
+def test_resumed_run_matches_uninterrupted_run(network, choice_factor, counter_rng, tmp_path):
+	G = Lattice(15, 15, False) if network == "lattice" else watts_strogatz_csr(300, 4, 0.2, seed=2)
+	options = {"choice_factor": choice_factor}
+	if (network == "ws-incremental"):
+		options["incremental"] = True
+	full_dir, resumed_dir = tmp_path / "full", tmp_path / "resumed"
+	full_dir.mkdir()
+	resumed_dir.mkdir()
+	full = _run(G, full_dir, CounterStreams(5) if counter_rng else 5, **options)
+	with pytest.raises(_Killed):
+		_run(G, resumed_dir, CounterStreams(5) if counter_rng else 5, profiler=_KillingProfiler(37), **options)
+	assert load_checkpoint(str(resumed_dir / "replica.ckpt"))["step"] == 30
+	resumed = _run(G, resumed_dir, CounterStreams(5) if counter_rng else 5, **options)
+	assert resumed[0] == full[0]
+	assert list(resumed[1]) == list(full[1])
+	assert np.array_equal(resumed[2]["strategy"], full[2]["strategy"])
+	assert np.array_equal(resumed[2]["influences"], full[2]["influences"])
+	assert np.array_equal(read_metrics(str(resumed_dir / "replica.metrics")), read_metrics(str(full_dir / "replica.metrics")))
+	# The snapshots written after the checkpoint are dropped and written again
+	assert read_snapshots(str(resumed_dir / "replica.snap")).tobytes() == read_snapshots(str(full_dir / "replica.snap")).tobytes()
+
+
+def test_checkpoint_of_other_parameters_is_rejected(tmp_path):
+	G = watts_strogatz_csr(300, 4, 0.2, seed=2)
+	_run(G, tmp_path, 5, choice_factor=1)
+	with pytest.raises(ValueError):
+		one_replica_simulation(G, W, 60, 0.5, 2.0, 1, None, rng=5, early_stop=False, checkpoint_path=str(tmp_path / "replica.ckpt"))
@@ -0,0 +1,82 @@
+"""
+Tests of the density sweeps, resumed from their checkpoint and adaptive.
+"""
+import logging
+import numpy as np
+import pytest
+import density_plots
+from graph_generators import watts_strogatz_csr
+from density_plots import _compute_cooperation_density_matrix
+
+
+@pytest.fixture(scope="module")
+def network():
+	return watts_strogatz_csr(60, 4, 0.2, seed=5)
+
+
+@pytest.mark.parametrize("size", [1, 2, 7])
+def test_adaptive_points_match_uniform_sweep(network, size):
+	uniform = _compute_cooperation_density_matrix(network, 0.5, 8, 2, size, 0.5, seed=3)
+	adaptive = _compute_cooperation_density_matrix(network, 0.5, 8, 2, size, 0.5, seed=3, adaptive=True, threshold=2, max_replicas=2)
+	assert not np.isnan(adaptive).any()
+	# The corners are always simulated, from the same streams as the uniform sweep
+	for i in (0, size - 1):
+		for j in (0, size - 1):
+			assert adaptive[i, j] == uniform[i, j]
+
+
+def test_adaptive_sweep_logs_its_statistics(network, caplog):
+	with caplog.at_level(logging.INFO):
+		_compute_cooperation_density_matrix(network, 0.5, 8, 2, 5, 0.5, seed=3, adaptive=True)
+	assert "Adaptive sweep" in caplog.text
+
+
+class _Interrupted(Exception):
+	pass
+
+
+def test_interrupted_sweep_resumes(network, tmp_path, monkeypatch):
+	checkpoint_path = str(tmp_path / "sweep.ckpt")
+	full = _compute_cooperation_density_matrix(network, 0.5, 8, 2, 4, 0.5, seed=3)
+	calls, interrupt = [], [6]
+	run_replicas = density_plots.run_replicas
+
+	def interrupting(*args, **kwargs):
+		if (len(calls) == interrupt[0]):
+			raise _Interrupted()
+		calls.append(args)
+		return run_replicas(*args, **kwargs)
+
+	monkeypatch.setattr(density_plots, "run_replicas", interrupting)
+	with pytest.raises(_Interrupted):
+		_compute_cooperation_density_matrix(network, 0.5, 8, 2, 4, 0.5, seed=3, checkpoint_path=checkpoint_path)
+	# The process died while writing the seventh cell
+	with open(checkpoint_path, "a") as file:
+		file.write('{"i": 1, "j"')
+	calls.clear()
+	interrupt[0] = None
+	resumed = _compute_cooperation_density_matrix(network, 0.5, 8, 2, 4, 0.5, seed=3, checkpoint_path=checkpoint_path)
+	assert len(calls) == 16 - 6
+	assert np.array_equal(resumed, full)
+	# Everything is done, a third run reads the whole grid back
+	calls.clear()
+	assert np.array_equal(_compute_cooperation_density_matrix(network, 0.5, 8, 2, 4, 0.5, seed=3, checkpoint_path=checkpoint_path), full)
+	assert calls == []
+
+
+def test_pooled_sweep_resumes_from_partial_checkpoint(network, tmp_path):
+	checkpoint_path = str(tmp_path / "sweep.ckpt")
+	full = _compute_cooperation_density_matrix(network, 0.5, 8, 2, 3, 0.5, seed=3, checkpoint_path=checkpoint_path)
+	with open(checkpoint_path) as file:
+		lines = file.read().splitlines()
+	with open(checkpoint_path, "w") as file:
+		file.write("\n".join(lines[:5]) + "\n" + lines[5][:7])
+	resumed = _compute_cooperation_density_matrix(network, 0.5, 8, 2, 3, 0.5, workers=2, seed=3, checkpoint_path=checkpoint_path)
+	assert np.array_equal(resumed, full)
+
+
+def test_checkpoint_of_other_sweep_is_rejected(network, tmp_path):
+	checkpoint_path = str(tmp_path / "sweep.ckpt")
+	_compute_cooperation_density_matrix(network, 0.5, 8, 2, 2, 0.5, seed=3, checkpoint_path=checkpoint_path)
+	with pytest.raises(ValueError):
+		_compute_cooperation_density_matrix(network, 0.5, 8, 2, 2, 0.5, seed=4, checkpoint_path=checkpoint_path)
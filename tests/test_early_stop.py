@@ -0,0 +1,53 @@
+"""
+Runs stopped early must give the time series and mean of the full run.
+"""
+import numpy as np
+import pytest
+from graph_generators import watts_strogatz_csr, Lattice
+from profiling import Profiler
+from evolutionary_game_theory import one_replica_simulation
+
+# Defection pays, the runs end with every node defecting
+W = np.array([[1, -0.5], [1.8, 0]])
+
+
+@pytest.mark.parametrize("network", ["ws", "lattice"])
+@pytest.mark.parametrize("choice_factor", [1, 2, 3])
+def test_absorbed_run_matches_full_run(network, choice_factor):
+	G = watts_strogatz_csr(200, 4, 0.2, seed=2) if network == "ws" else Lattice(10, 10, True)
+	profiler = Profiler()
+	stopped = one_replica_simulation(G, W, 200, 0.3, 5.0, choice_factor, None, rng=4, profiler=profiler, return_state=True)
+	full = one_replica_simulation(G, W, 200, 0.3, 5.0, choice_factor, None, rng=4, early_stop=False, return_state=True)
+	assert len(profiler.steps) < 200
+	assert len(stopped[1]) == 200
+	assert list(stopped[1]) == list(full[1])
+	assert stopped[0] == pytest.approx(full[0], abs=1e-15)
+	assert np.array_equal(stopped[2]["strategy"], full[2]["strategy"])
+	assert np.array_equal(stopped[2]["influences"], full[2]["influences"])
+	without_series = one_replica_simulation(G, W, 200, 0.3, 5.0, choice_factor, None, rng=4, keep_series=False)
+	assert len(without_series[1]) == 0 and without_series[0] == pytest.approx(full[0], abs=1e-15)
+
+
+def test_window_stops_converged_run():
+	G = watts_strogatz_csr(500, 4, 0.2, seed=2)
+	profiler = Profiler()
+	# Any spread is within an epsilon of 1, the run stops once the window is full
+	p, series = one_replica_simulation(G, W, 100, 0.5, 0.01, 1, None, rng=4, convergence_window=5, convergence_epsilon=1.0, profiler=profiler)
+	assert len(profiler.steps) == 5
+	assert len(series) == 100
+	assert list(series)[5:] == [series[4]] * 95
+	assert p == pytest.approx(np.mean(series))
+
+
+def test_window_keeps_running_while_moving():
+	G = watts_strogatz_csr(500, 4, 0.2, seed=2)
+	plain, windowed = Profiler(), Profiler()
+	full = one_replica_simulation(G, W, 30, 0.5, 0.5, 1, None, rng=4, profiler=plain)
+	p, series = one_replica_simulation(G, W, 30, 0.5, 0.5, 1, None, rng=4, convergence_window=3, convergence_epsilon=0.0, profiler=windowed)
+	assert len(windowed.steps) == len(plain.steps)
+	assert list(series) == list(full[1])
+
+
+def test_window_without_early_stop_is_rejected():
+	with pytest.raises(ValueError):
+		one_replica_simulation(Lattice(5, 5, True), W, 10, 0.5, 1.0, 1, None, early_stop=False, convergence_window=5)
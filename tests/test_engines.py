@@ -0,0 +1,44 @@
+"""
+The CSR engine must give the same runs as the dict engine it replaces.
+"""
+import networkx as nx
+import numpy as np
+import pytest
+from csr_graph import to_csr
+from rng_streams import CounterStreams
+from evolutionary_game_theory import one_replica_simulation
+
+# Payoffs that are exact in binary, the dict engine adds the games one by one and the CSR engine
+# multiplies by the neighbor counts, which could otherwise round differently and break a tie
+W = np.array([[1.5, -0.25], [1.75, 0]])
+GRAPHS = {"ws": lambda: nx.watts_strogatz_graph(200, 6, 0.2, seed=3), "grid": lambda: nx.grid_2d_graph(10, 12),
+		"ba": lambda: nx.barabasi_albert_graph(150, 3, seed=1)}
+
+
+@pytest.mark.parametrize("graph", sorted(GRAPHS))
+@pytest.mark.parametrize("choice_factor", [1, 2])
+@pytest.mark.parametrize("counter_rng", [False, True])
+def test_csr_matches_dict_engine(graph, choice_factor, counter_rng):
+	G = GRAPHS[graph]()
+	runs = []
+	for engine in ("dict", "csr"):
+		rng = CounterStreams(3) if counter_rng else 3
+		# The dict engine never stops early
+		runs.append(one_replica_simulation(G, W, 25, 0.5, 0.5, choice_factor, None, engine=engine, rng=rng, early_stop=False, return_state=True))
+	(p, series, state), (p_csr, series_csr, state_csr) = runs
+	assert p == p_csr
+	assert list(series) == list(series_csr)
+	assert np.array_equal(state["strategy"], state_csr["strategy"])
+	assert np.array_equal(state["influences"], state_csr["influences"])
+
+
+def test_csr_accepts_networkx_and_csr_graphs():
+	G = GRAPHS["ws"]()
+	p, series = one_replica_simulation(G, W, 10, 0.5, 0.5, 1, None, rng=8)
+	p_csr, series_csr = one_replica_simulation(to_csr(G), W, 10, 0.5, 0.5, 1, None, rng=8)
+	assert p == p_csr and list(series) == list(series_csr)
+
+
+def test_unknown_engine_is_rejected():
+	with pytest.raises(ValueError):
+		one_replica_simulation(GRAPHS["grid"](), W, 5, 0.5, 0.5, 1, None, engine="gpu")
@@ -0,0 +1,52 @@
+"""
+Regression tests of the float64 Fermi rule against the former Decimal evaluation, and of the
+lookup table against expit.
+"""
+import logging
+from decimal import Decimal
+import numpy as np
+import pytest
+from graph_generators import watts_strogatz_csr
+from evolutionary_game_theory import one_replica_simulation, _fermi_updating_rule, _fermi_probabilities, _fermi_lookup_table
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+def _decimal_fermi(wi, wj, beta):
+	# The rule as it was computed before the float64 version
+	return 1 / (1 + Decimal(np.e) ** Decimal(-beta * (wj - wi)))
+
+
+@pytest.mark.parametrize("beta", [0.0, 0.0002588235294, 0.1, 1.0, 5.0])
+def test_expit_matches_decimal_reference(beta):
+	payoffs = np.linspace(-40, 40, 41)
+	for wi in payoffs:
+		for wj in payoffs:
+			reference = float(_decimal_fermi(float(wi), float(wj), beta))
+			assert abs(_fermi_updating_rule(wi, wj, beta) - reference) <= 1e-15
+	wi, wj = np.meshgrid(payoffs, payoffs)
+	reference = np.vectorize(lambda a, b: float(_decimal_fermi(float(a), float(b), beta)))(wi, wj)
+	assert np.max(np.abs(_fermi_probabilities(wi, wj, beta) - reference)) <= 1e-15
+
+
+def test_expit_saturates_without_overflow():
+	assert _fermi_updating_rule(0.0, 1e6, 1.0) == 1.0
+	assert _fermi_updating_rule(1e6, 0.0, 1.0) == 0.0
+
+
+@pytest.mark.parametrize("choice_factor", [1, 2])
+def test_lookup_table_matches_expit(choice_factor):
+	G = watts_strogatz_csr(300, 6, 0.2, seed=4)
+	for seed in range(3):
+		p, series = one_replica_simulation(G, W, 15, 0.5, 0.3, choice_factor, None, rng=seed, early_stop=False)
+		p_table, series_table = one_replica_simulation(G, W, 15, 0.5, 0.3, choice_factor, None, rng=seed, early_stop=False, fermi_table=True)
+		assert p == p_table
+		assert list(series) == list(series_table)
+
+
+def test_oversized_table_falls_back_to_expit(caplog):
+	degree = np.arange(1, 200)
+	with caplog.at_level(logging.WARNING):
+		assert _fermi_lookup_table(degree, W, 0.1, 1, max_entries=1000) is None
+	assert "using expit" in caplog.text
+	assert _fermi_lookup_table(degree[:3], W, 0.1, 1, max_entries=1000) is not None
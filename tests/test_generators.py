@@ -0,0 +1,15 @@
+"""
+Tests of the CSR network generators.
+"""
+import numpy as np
+from graph_generators import watts_strogatz_csr
+
+
+def test_watts_strogatz_has_no_repeated_edges():
+	# With p = 1 on a dense ring some edges run out of redraws and go back to their ring end
+	for seed in range(200):
+		csr = watts_strogatz_csr(10, 8, 1, seed=seed)
+		for node in range(10):
+			neighbors = csr.indices[csr.indptr[node]:csr.indptr[node + 1]]
+			assert len(np.unique(neighbors)) == len(neighbors)
+			assert node not in neighbors
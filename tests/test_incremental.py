@@ -0,0 +1,60 @@
+"""
+The incremental mode of the CSR engine must give the same runs as the full recomputation.
+"""
+import numpy as np
+import pytest
+import rng_streams
+from graph_generators import watts_strogatz_csr, grid_csr
+from metrics_writer import read_metrics
+from rng_streams import CounterStreams, draw_ranges
+from evolutionary_game_theory import one_replica_simulation
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+NETWORKS = {"ws": lambda: watts_strogatz_csr(1500, 6, 0.1, seed=1), "grid": lambda: grid_csr(30)}
+
+
+@pytest.mark.parametrize("network", sorted(NETWORKS))
+@pytest.mark.parametrize("choice_factor", [1, 2])
+@pytest.mark.parametrize("beta", [0.1, 5.0])
+@pytest.mark.parametrize("counter_rng", [False, True])
+@pytest.mark.parametrize("jump_cost", [1, rng_streams.JUMP_COST])
+def test_incremental_matches_full_recount(network, choice_factor, beta, counter_rng, jump_cost, monkeypatch):
+	# A jump cost of 1 makes the boundary update skip ahead in the stream whenever it can
+	monkeypatch.setattr(rng_streams, "JUMP_COST", jump_cost)
+	G = NETWORKS[network]()
+	runs = []
+	for incremental in (False, True):
+		rng = CounterStreams(11) if counter_rng else 11
+		runs.append(one_replica_simulation(G, W, 50, 0.5, beta, choice_factor, None, rng=rng, incremental=incremental,
+											early_stop=False, return_state=True))
+	(p, series, state), (p_inc, series_inc, state_inc) = runs
+	assert p == p_inc
+	assert list(series) == list(series_inc)
+	assert np.array_equal(state["strategy"], state_inc["strategy"])
+	assert np.array_equal(state["influences"], state_inc["influences"])
+
+
+def test_incremental_matches_full_with_table_and_metrics(tmp_path):
+	G = watts_strogatz_csr(1000, 4, 0.2, seed=2)
+	runs = []
+	for incremental in (False, True):
+		metrics_path = str(tmp_path / "run_{0}.metrics".format(incremental))
+		p, series = one_replica_simulation(G, W, 40, 0.5, 1.0, 1, None, rng=5, incremental=incremental, fermi_table=True, metrics_path=metrics_path)
+		runs.append((p, list(series), read_metrics(metrics_path)))
+	assert runs[0][:2] == runs[1][:2]
+	for name in runs[0][2].dtype.names:
+		assert np.array_equal(runs[0][2][name], runs[1][2][name])
+
+
+@pytest.mark.parametrize("make_rng", [lambda: np.random.default_rng(3), lambda: CounterStreams(3).generator(4),
+										lambda: np.random.Generator(np.random.MT19937(3))])
+def test_draw_ranges_matches_full_block(make_rng):
+	total = 100000
+	starts = np.array([0, 10, 11, 500, 4097, 99990])
+	stops = np.array([10, 11, 40, 503, 5000, 100000])
+	full, ranges = make_rng(), make_rng()
+	block = full.random(total)
+	expected = np.concatenate([block[start:stop] for start, stop in zip(starts, stops)])
+	assert np.array_equal(draw_ranges(ranges, total, starts, stops), expected)
+	# The generator continues as if the whole block had been drawn
+	assert np.array_equal(full.random(8), ranges.random(8))
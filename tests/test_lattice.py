@@ -0,0 +1,38 @@
+"""
+The stencil engine must give the same runs as the CSR engine on the same grid.
+"""
+import numpy as np
+import pytest
+from csr_graph import to_csr
+from graph_generators import Lattice
+from metrics_writer import read_metrics
+from rng_streams import CounterStreams
+from evolutionary_game_theory import one_replica_simulation
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+@pytest.mark.parametrize("periodic", [False, True])
+@pytest.mark.parametrize("choice_factor", [1, 2])
+@pytest.mark.parametrize("counter_rng", [False, True])
+def test_lattice_matches_csr(periodic, choice_factor, counter_rng, tmp_path):
+	lattice = Lattice(14, 17, periodic)
+	runs = []
+	for engine, G in (("lattice", lattice), ("csr", to_csr(lattice))):
+		metrics_path = str(tmp_path / (engine + ".bin"))
+		rng = CounterStreams(6) if counter_rng else 6
+		runs.append(one_replica_simulation(G, W, 30, 0.5, 0.8, choice_factor, None, engine=engine, rng=rng, early_stop=False,
+											metrics_path=metrics_path, return_state=True) + (read_metrics(metrics_path),))
+	(p, series, state, metrics), (p_csr, series_csr, state_csr, metrics_csr) = runs
+	assert p == p_csr
+	assert list(series) == list(series_csr)
+	assert np.array_equal(state["strategy"], state_csr["strategy"])
+	assert np.array_equal(state["influences"], state_csr["influences"])
+	assert np.array_equal(metrics, metrics_csr)
+
+
+def test_lattice_async_runs_on_csr():
+	lattice = Lattice(10, 10, True)
+	p, series = one_replica_simulation(lattice, W, 15, 0.5, 0.8, 3, None, rng=4)
+	p_csr, series_csr = one_replica_simulation(to_csr(lattice), W, 15, 0.5, 0.8, 3, None, rng=4)
+	assert p == p_csr and list(series) == list(series_csr)
@@ -0,0 +1,32 @@
+"""
+Replicas advanced in lockstep must give the same runs as replicas run one by one.
+"""
+import numpy as np
+import pytest
+from graph_generators import watts_strogatz_csr
+from replica_runner import run_replicas
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+@pytest.mark.parametrize("choice_factor", [1, 2])
+@pytest.mark.parametrize("early_stop", [False, True])
+@pytest.mark.parametrize("fermi_table", [False, True])
+def test_lockstep_matches_separate_replicas(choice_factor, early_stop, fermi_table):
+	G = watts_strogatz_csr(300, 4, 0.2, seed=2)
+	runs = []
+	for lockstep in (False, True):
+		# Counter-based streams give replica k the same numbers in both layouts
+		runs.append(run_replicas(G, W, 40, 0.5, 2.0, 5, choice_factor, seed=9, lockstep=lockstep, counter_rng=True,
+								early_stop=early_stop, fermi_table=fermi_table))
+	separate, lockstep = runs
+	assert len(lockstep) == 5
+	for (p, series), (p_lockstep, series_lockstep) in zip(separate, lockstep):
+		assert p == p_lockstep
+		assert list(series) == list(series_lockstep)
+
+
+def test_lockstep_rejects_streamed_output(tmp_path):
+	G = watts_strogatz_csr(50, 4, 0.2, seed=2)
+	with pytest.raises(ValueError):
+		run_replicas(G, W, 5, 0.5, 2.0, 2, 1, seed=9, lockstep=True, metrics_dir=str(tmp_path))
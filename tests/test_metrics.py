@@ -0,0 +1,87 @@
+"""
+Metrics files are read back while written, cut on resume and hold the series of the run.
+"""
+import os
+import numpy as np
+import pytest
+from graph_generators import watts_strogatz_csr
+from metrics_writer import METRICS_DTYPE, MetricsWriter, read_metrics, truncate_metrics
+from evolutionary_game_theory import one_replica_simulation
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+def _write(file_path, steps, buffer_steps, mode='wb', first=0):
+	with MetricsWriter(file_path, buffer_steps=buffer_steps, mode=mode) as writer:
+		for t in range(first, first + steps):
+			writer.write(t, t / 100, 2 * t, -t / 8)
+
+
+def _expected(steps, first=0):
+	t = np.arange(first, first + steps)
+	return np.array(list(zip(t, t / 100, 2 * t, -t / 8)), dtype=METRICS_DTYPE)
+
+
+@pytest.mark.parametrize("buffer_steps", [1, 7, 1024])
+def test_round_trip(buffer_steps, tmp_path):
+	file_path = str(tmp_path / "replica.metrics")
+	_write(file_path, 50, buffer_steps)
+	assert np.array_equal(read_metrics(file_path), _expected(50))
+	coop = read_metrics(file_path, fields=["coop"])
+	assert coop.dtype.names == ("coop",)
+	assert np.array_equal(coop["coop"], _expected(50)["coop"])
+
+
+def test_partial_trailing_chunk_is_ignored(tmp_path):
+	file_path = str(tmp_path / "replica.metrics")
+	_write(file_path, 20, 8)
+	size = os.path.getsize(file_path)
+	# A chunk cut anywhere, in its header or in its columns, is left out
+	with open(file_path, 'ab') as file:
+		file.write(np.int64(8).tobytes() + b"\0" * 40)
+	assert np.array_equal(read_metrics(file_path), _expected(20))
+	os.truncate(file_path, size + 3)
+	assert np.array_equal(read_metrics(file_path), _expected(20))
+	os.truncate(file_path, size - 5)
+	assert np.array_equal(read_metrics(file_path), _expected(16))
+
+
+def test_file_is_readable_while_written(tmp_path):
+	file_path = str(tmp_path / "replica.metrics")
+	writer = MetricsWriter(file_path, buffer_steps=10)
+	for t in range(25):
+		writer.write(t, t / 100, 2 * t, -t / 8)
+	assert np.array_equal(read_metrics(file_path), _expected(20))
+	writer.close()
+	assert np.array_equal(read_metrics(file_path), _expected(25))
+
+
+@pytest.mark.parametrize("steps", [0, 8, 13, 20, 40])
+def test_truncate_then_resume(steps, tmp_path):
+	file_path = str(tmp_path / "replica.metrics")
+	_write(file_path, 20, 8)
+	with open(file_path, 'ab') as file:
+		file.write(np.int64(8).tobytes() + b"\0" * 40)
+	truncate_metrics(file_path, steps)
+	kept = min(steps, 20)
+	assert np.array_equal(read_metrics(file_path), _expected(kept))
+	_write(file_path, 30 - kept, 8, mode='ab', first=kept)
+	assert np.array_equal(read_metrics(file_path), _expected(30))
+
+
+def test_truncate_missing_file(tmp_path):
+	truncate_metrics(str(tmp_path / "replica.metrics"), 10)
+	assert not os.path.exists(tmp_path / "replica.metrics")
+
+
+@pytest.mark.parametrize("early_stop", [False, True])
+def test_metrics_match_series(early_stop, tmp_path):
+	G = watts_strogatz_csr(300, 4, 0.2, seed=2)
+	metrics_path = str(tmp_path / "replica.metrics")
+	p, series = one_replica_simulation(G, W, 80, 0.5, 5.0 if early_stop else 1.0, 1, None, rng=3, early_stop=early_stop,
+									metrics_path=metrics_path)
+	metrics = read_metrics(metrics_path)
+	assert np.array_equal(metrics["step"], np.arange(80))
+	assert list(metrics["coop"]) == list(series)
+	assert metrics["coop"].mean() == pytest.approx(p)
+	assert np.all(metrics["flips"] >= 0)
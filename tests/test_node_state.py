@@ -0,0 +1,79 @@
+"""
+Tests of the influence tables and node-state snapshots.
+"""
+import ast
+import csv
+import networkx as nx
+import numpy as np
+import pytest
+from csr_graph import to_csr
+from graph_generators import GridLabels, Lattice
+from node_state import write_influence_table, read_snapshots, truncate_snapshots, INFLUENCE_HEADER
+from evolutionary_game_theory import one_replica_simulation
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+def _columns(n, seed=0):
+	rng = np.random.default_rng(seed)
+	return rng.integers(0, 2, n), rng.integers(0, 9, n), rng.integers(0, 1000, n)
+
+
+def _read_csv(file_path):
+	with open(file_path, newline='') as file:
+		rows = list(csv.reader(file))
+	return rows[0], rows[1:]
+
+
+@pytest.mark.parametrize("nodes", [range(1001), list(range(7, 1008)), GridLabels(13, 77), ["a", 'quote "b"', "c,d"] * 5],
+						ids=["range", "list", "grid", "text"])
+def test_csv_has_one_row_per_node(nodes, tmp_path):
+	strategy, degree, influences = _columns(len(nodes))
+	# Chunks that do not divide the number of nodes, the last node must not be dropped
+	header, rows = _read_csv(write_influence_table("t", nodes, strategy, degree, influences, directory=str(tmp_path), chunk_rows=100))
+	assert header == INFLUENCE_HEADER
+	assert len(rows) == len(nodes)
+	assert [row[0] for row in rows] == [str(node) for node in nodes]
+	assert np.array_equal(np.array([row[1:] for row in rows], dtype=np.int64), np.column_stack((strategy, degree, influences)))
+
+
+def test_grid_labels_round_trip(tmp_path):
+	lattice = Lattice(6, 9, False)
+	strategy, degree, influences = _columns(54)
+	_, rows = _read_csv(write_influence_table("t", GridLabels(6, 9), strategy, degree, influences, directory=str(tmp_path)))
+	labels = [ast.literal_eval(row[0]) for row in rows]
+	# The same labels and order as networkx gives the grid
+	assert labels == list(nx.grid_2d_graph(6, 9).nodes) == list(to_csr(lattice).nodes)
+	with np.load(write_influence_table("t", GridLabels(6, 9), strategy, degree, influences, "npz", directory=str(tmp_path))) as data:
+		assert [tuple(node) for node in data["node"].tolist()] == labels
+		assert np.array_equal(data["strategy"], strategy) and np.array_equal(data["influences"], influences)
+
+
+def test_npz_round_trip(tmp_path):
+	strategy, degree, influences = _columns(500)
+	with np.load(write_influence_table("t", range(500), strategy, degree, influences, "npz", directory=str(tmp_path))) as data:
+		assert data["node"].tolist() == list(range(500))
+		assert np.array_equal(data["degree"], degree)
+
+
+def test_unknown_table_format_is_rejected(tmp_path):
+	with pytest.raises(ValueError):
+		write_influence_table("t", range(3), *_columns(3), "xlsx", directory=str(tmp_path))
+
+
+def test_snapshots_read_back_at_expected_steps(tmp_path):
+	snapshot_path = str(tmp_path / "replica.snap")
+	G = nx.watts_strogatz_graph(200, 4, 0.2, seed=1)
+	_, _, state = one_replica_simulation(G, W, 10, 0.5, 1.0, 2, None, rng=2, early_stop=False, snapshot_path=snapshot_path,
+										snapshot_every=4, return_state=True)
+	snapshots = read_snapshots(snapshot_path)
+	assert snapshots["step"].tolist() == [0, 4, 8, 10]
+	assert np.array_equal(snapshots["strategy"][-1], state["strategy"])
+	assert np.array_equal(snapshots["influences"][-1], state["influences"])
+	assert snapshots["influences"][0].sum() == 0
+	# A snapshot still being written is ignored
+	with open(snapshot_path, "ab") as file:
+		file.write(b"\0" * 11)
+	assert len(read_snapshots(snapshot_path)) == 4
+	truncate_snapshots(snapshot_path, 2)
+	assert read_snapshots(snapshot_path)["step"].tolist() == [0, 4]
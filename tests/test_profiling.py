@@ -0,0 +1,73 @@
+"""
+Tests of the profiler of the simulation loop.
+"""
+import json
+import numpy as np
+import pytest
+import rng_streams
+from graph_generators import watts_strogatz_csr, Lattice
+from profiling import Profiler, NULL_PROFILER
+from rng_streams import draw_ranges
+from evolutionary_game_theory import one_replica_simulation
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+PHASES = {"payoffs", "update_rule", "commit", "io"}
+
+
+@pytest.mark.parametrize("network", ["ws", "lattice"])
+@pytest.mark.parametrize("choice_factor", [1, 2])
+def test_profiler_records_every_step(network, choice_factor):
+	G = watts_strogatz_csr(300, 4, 0.2, seed=2) if network == "ws" else Lattice(12, 12, True)
+	records = []
+	profiler = Profiler(callbacks=[records.append])
+	result = one_replica_simulation(G, W, 20, 0.5, 1.0, choice_factor, None, rng=3, early_stop=False, profiler=profiler)
+	assert result[0] == one_replica_simulation(G, W, 20, 0.5, 1.0, choice_factor, None, rng=3, early_stop=False, profiler=NULL_PROFILER)[0]
+	assert [record["step"] for record in profiler.steps] == list(range(20))
+	assert records == profiler.steps
+	summary = profiler.summary()
+	assert summary["steps"] == 20
+	assert {"payoffs", "update_rule", "io"} <= set(summary["phases"]) <= PHASES
+	edges = 2 * 12 * 12 * 2 if network == "lattice" else 300 * 4
+	assert summary["counters"]["edges"] == 20 * edges
+	assert summary["counters"]["rng_draws"] == (20 * edges if choice_factor == 1 else 0)
+	assert summary["counters"]["flips"] == sum(record["counters"]["flips"] for record in profiler.steps)
+	assert all(record["seconds"] >= sum(record["phases"].values()) for record in profiler.steps)
+
+
+def test_profiler_dumps(tmp_path):
+	profiler = Profiler()
+	one_replica_simulation(watts_strogatz_csr(200, 4, 0.2, seed=2), W, 10, 0.5, 1.0, 1, None, rng=3, early_stop=False, profiler=profiler)
+	profiler.dump_json(str(tmp_path / "profile.json"))
+	with open(str(tmp_path / "profile.json")) as file:
+		dump = json.load(file)
+	assert dump["summary"]["steps"] == 10 and len(dump["steps"]) == 10
+	profiler.dump_chrome_trace(str(tmp_path / "trace.json"))
+	with open(str(tmp_path / "trace.json")) as file:
+		events = json.load(file)["traceEvents"]
+	assert {event["ph"] for event in events} == {"X"}
+	assert [event["name"] for event in events if event["name"].startswith("step ")] == ["step " + str(t) for t in range(10)]
+	assert {event["name"] for event in events if not event["name"].startswith("step ")} <= PHASES
+	for event in events:
+		assert event["dur"] >= 0 and event["ts"] >= 0 and event["args"]["step"] in range(10)
+
+
+@pytest.mark.parametrize("bit_generator", [np.random.PCG64, np.random.MT19937])
+def test_boundary_update_counts_its_draws(bit_generator, monkeypatch):
+	# PCG64 skips ahead to every range, MT19937 cannot and draws the whole block every step
+	monkeypatch.setattr(rng_streams, "JUMP_COST", 1)
+	G = watts_strogatz_csr(2000, 4, 0.05, seed=1)
+	profiler = Profiler()
+	one_replica_simulation(G, W, 30, 0.5, 5.0, 1, None, rng=np.random.Generator(bit_generator(4)), incremental=True, early_stop=False,
+							profiler=profiler)
+	draws = [record["counters"]["rng_draws"] for record in profiler.steps]
+	if bit_generator is np.random.MT19937:
+		assert draws == [len(G.indices)] * 30
+	else:
+		entries = [record["counters"]["edges"] for record in profiler.steps]
+		assert draws == entries and min(draws) < len(G.indices)
+
+
+def test_draw_ranges_counts_draws():
+	starts, stops = np.array([100, 5000]), np.array([110, 5010])
+	for bit_generator, drawn in ((np.random.PCG64, 20), (np.random.MT19937, 100000), (np.random.Philox, 20 + 0 + 5000 % 4 + 100000 % 4)):
+		assert draw_ranges(np.random.Generator(bit_generator(1)), 100000, starts, stops, return_drawn=True)[1] == drawn
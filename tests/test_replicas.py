@@ -0,0 +1,54 @@
+"""
+Replicas run over a process pool must give the same results as in the calling process.
+"""
+import numpy as np
+import pytest
+from graph_generators import watts_strogatz_csr, Lattice
+from replica_runner import run_replicas, replica_pool
+from evolutionary_game_theory import multi_replica_simulation
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+@pytest.mark.parametrize("network", ["ws", "lattice"])
+def test_pool_matches_serial_run(network):
+	G = watts_strogatz_csr(400, 4, 0.2, seed=2) if network == "ws" else Lattice(15, 15, True)
+	serial = run_replicas(G, W, 30, 0.5, 1.0, 4, 1, seed=12)
+	parallel = run_replicas(G, W, 30, 0.5, 1.0, 4, 1, workers=2, seed=12)
+	assert [p for p, _ in serial] == [p for p, _ in parallel]
+	assert [list(series) for _, series in serial] == [list(series) for _, series in parallel]
+
+
+def test_open_pool_is_reused():
+	G = watts_strogatz_csr(400, 4, 0.2, seed=2)
+	with replica_pool(G, 2) as pool:
+		first = run_replicas(G, W, 20, 0.5, 1.0, 3, 2, seed=4, pool=pool)
+		second = run_replicas(G, W, 20, 0.5, 1.0, 3, 2, seed=4, pool=pool)
+	assert [p for p, _ in first] == [p for p, _ in second]
+
+
+def test_replicas_differ_and_seeds_repeat():
+	G = watts_strogatz_csr(400, 4, 0.2, seed=2)
+	first = run_replicas(G, W, 20, 0.5, 1.0, 3, 1, seed=4)
+	again = run_replicas(G, W, 20, 0.5, 1.0, 3, 1, seed=4)
+	assert [p for p, _ in first] == [p for p, _ in again]
+	assert len({p for p, _ in first}) > 1
+
+
+def test_generator_seed_is_reproducible():
+	G = watts_strogatz_csr(400, 4, 0.2, seed=2)
+	for counter_rng in (False, True):
+		first = run_replicas(G, W, 20, 0.5, 1.0, 3, 1, seed=np.random.default_rng(21), counter_rng=counter_rng)
+		again = run_replicas(G, W, 20, 0.5, 1.0, 3, 1, seed=np.random.default_rng(21), counter_rng=counter_rng)
+		assert [list(series) for _, series in first] == [list(series) for _, series in again]
+	# Further calls on the same Generator move on to new streams
+	rng = np.random.default_rng(21)
+	first = run_replicas(G, W, 20, 0.5, 1.0, 3, 1, seed=rng)
+	second = run_replicas(G, W, 20, 0.5, 1.0, 3, 1, seed=rng)
+	assert [p for p, _ in first] != [p for p, _ in second]
+
+
+def test_multi_replica_simulation_takes_a_generator_seed():
+	G = watts_strogatz_csr(400, 4, 0.2, seed=2)
+	first = multi_replica_simulation(G, W, 20, 0.5, 1.0, 3, 1, seed=np.random.default_rng(5))
+	assert first == multi_replica_simulation(G, W, 20, 0.5, 1.0, 3, 1, seed=np.random.default_rng(5))
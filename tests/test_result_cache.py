@@ -0,0 +1,77 @@
+"""
+Seeded replicas read back from the result cache must equal the ones simulated.
+"""
+import os
+import numpy as np
+import replica_runner
+from graph_generators import watts_strogatz_csr
+from result_cache import ResultCache
+from replica_runner import run_replicas
+from density_plots import _compute_cooperation_density_matrix
+
+W = np.array([[1.5, -0.3], [1.8, 0]])
+
+
+def _count_simulations(monkeypatch):
+	simulated = []
+	run_tasks = replica_runner._run_tasks
+
+	def counting(G, tasks, *args):
+		simulated.append(len(tasks))
+		return run_tasks(G, tasks, *args)
+
+	monkeypatch.setattr(replica_runner, "_run_tasks", counting)
+	return simulated
+
+
+def _batches(simulated):
+	# A fully cached run still hands an empty batch to _run_tasks
+	return [count for count in simulated if count]
+
+
+def test_cached_replicas_are_reused(tmp_path, monkeypatch):
+	G = watts_strogatz_csr(300, 4, 0.2, seed=2)
+	cache = ResultCache(str(tmp_path))
+	simulated = _count_simulations(monkeypatch)
+	uncached = run_replicas(G, W, 30, 0.5, 1.0, 5, 2, seed=8)
+	first = run_replicas(G, W, 30, 0.5, 1.0, 3, 2, seed=8, cache=cache)
+	# Only replicas 3 and 4 are missing
+	more = run_replicas(G, W, 30, 0.5, 1.0, 5, 2, seed=8, cache=cache)
+	again = run_replicas(G, W, 30, 0.5, 1.0, 5, 2, seed=8, cache=cache)
+	assert _batches(simulated) == [5, 3, 2]
+	for results in (first, more, again):
+		assert [p for p, _ in results] == [p for p, _ in uncached[:len(results)]]
+		assert [list(series) for _, series in results] == [list(series) for _, series in uncached[:len(results)]]
+
+
+def test_other_parameters_miss_the_cache(tmp_path, monkeypatch):
+	G = watts_strogatz_csr(300, 4, 0.2, seed=2)
+	cache = ResultCache(str(tmp_path))
+	simulated = _count_simulations(monkeypatch)
+	run_replicas(G, W, 30, 0.5, 1.0, 2, 1, seed=8, cache=cache)
+	run_replicas(G, W, 30, 0.5, 1.5, 2, 1, seed=8, cache=cache)
+	run_replicas(G, W, 30, 0.5, 1.0, 2, 1, seed=9, cache=cache)
+	run_replicas(watts_strogatz_csr(300, 4, 0.2, seed=3), W, 30, 0.5, 1.0, 2, 1, seed=8, cache=cache)
+	# Unseeded runs are never cached
+	run_replicas(G, W, 30, 0.5, 1.0, 2, 1, cache=cache)
+	assert _batches(simulated) == [2, 2, 2, 2, 2]
+
+
+def test_density_sweep_reuses_cache(tmp_path):
+	G = watts_strogatz_csr(60, 4, 0.2, seed=5)
+	cache = ResultCache(str(tmp_path))
+	first = _compute_cooperation_density_matrix(G, 0.5, 8, 2, 3, 0.5, seed=3, cache=cache)
+	entries = sorted(os.listdir(str(tmp_path)))
+	second = _compute_cooperation_density_matrix(G, 0.5, 8, 2, 3, 0.5, seed=3, cache=cache)
+	assert np.array_equal(first, second)
+	assert sorted(os.listdir(str(tmp_path))) == entries and len(entries) == 3 * 3 * 2
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+	G = watts_strogatz_csr(300, 4, 0.2, seed=2)
+	cache = ResultCache(str(tmp_path))
+	run_replicas(G, W, 30, 0.5, 1.0, 4, 1, seed=8, cache=cache)
+	names = sorted(os.listdir(str(tmp_path)), key=lambda name: os.stat(os.path.join(str(tmp_path), name)).st_mtime_ns)
+	cache.max_bytes = sum(os.path.getsize(os.path.join(str(tmp_path), name)) for name in names[2:])
+	assert cache.evict() == 2
+	assert sorted(os.listdir(str(tmp_path))) == sorted(names[2:])
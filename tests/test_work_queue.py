@@ -0,0 +1,96 @@
+"""
+Tests of the shared-directory work queue.
+"""
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import numpy as np
+from graph_generators import watts_strogatz_csr
+from replica_runner import run_replicas
+from work_queue import WorkQueue, queue_pool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+W = np.array([[1, -0.2], [1.3, 0]])
+
+
+def _start_worker(queue_dir, worker_id):
+	return subprocess.Popen([sys.executable, os.path.join(ROOT, "work_queue.py"), queue_dir, "--worker-id", worker_id, "--heartbeat", "0.1",
+							"--poll", "0.05", "--idle-exit", "3"], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _kill_on_claim(queue_dir, victim, workers):
+	claimed = os.path.join(queue_dir, "claimed")
+	while victim.poll() is None:
+		if any(name.endswith(".victim.claim") for name in os.listdir(claimed)):
+			# Let the replica get going before killing the worker, the other one starts afterwards
+			time.sleep(0.05)
+			victim.send_signal(signal.SIGKILL)
+			break
+		time.sleep(0.01)
+	workers.append(_start_worker(queue_dir, "survivor"))
+
+
+def _requeue(queue):
+	# The first look only records the claims, the second one finds them without heartbeat
+	queue.requeue_stale()
+	time.sleep(0.01)
+	return queue.requeue_stale()
+
+
+def test_killed_worker_replicas_complete_once(tmp_path, monkeypatch):
+	queue_dir = str(tmp_path)
+	G = watts_strogatz_csr(2000, 6, 0.1, seed=1)
+	expected = run_replicas(G, W, 60, 0.5, 0.01, 8, 1, seed=5)
+	requeued = []
+	requeue_stale = WorkQueue.requeue_stale
+	monkeypatch.setattr(WorkQueue, "requeue_stale", lambda self: requeued.extend(requeue_stale(self)) or requeued)
+	WorkQueue(queue_dir)
+	victim, workers = _start_worker(queue_dir, "victim"), []
+	killer = threading.Thread(target=_kill_on_claim, args=(queue_dir, victim, workers))
+	killer.start()
+	try:
+		with queue_pool(G, queue_dir, heartbeat_timeout=0.5, poll=0.05) as pool:
+			results = run_replicas(G, W, 60, 0.5, 0.01, 8, 1, seed=5, pool=pool)
+	finally:
+		killer.join()
+		victim.kill()
+		for worker in workers:
+			worker.wait()
+	assert victim.returncode == -signal.SIGKILL
+	assert len(requeued) == 1
+	assert [p for p, _ in results] == [p for p, _ in expected]
+	for p_series, expected_series in zip(results, expected):
+		assert list(p_series[1]) == list(expected_series[1])
+	for subdir in ("tasks", "claimed", "results"):
+		assert os.listdir(os.path.join(queue_dir, subdir)) == []
+
+
+def test_late_result_is_dropped(tmp_path):
+	queue = WorkQueue(str(tmp_path), heartbeat_timeout=0)
+	task_id = queue.submit("graph", ("task",))
+	first = queue.claim("first")
+	assert _requeue(queue) == [task_id]
+	second = queue.claim("second")
+	assert queue.complete(task_id, second[1], "second")
+	assert queue.take_result(task_id) == ("second", None)
+	# The first worker was thought dead but finishes the task
+	assert not queue.complete(task_id, first[1], "first")
+	assert queue.take_result(task_id) is None
+	queue.forget(task_id)
+	assert not queue.complete(task_id, first[1], "first")
+	assert os.listdir(os.path.join(str(tmp_path), "results")) == []
+
+
+def test_first_result_wins(tmp_path):
+	queue = WorkQueue(str(tmp_path), heartbeat_timeout=0)
+	task_id = queue.submit("graph", ("task",))
+	first = queue.claim("first")
+	assert _requeue(queue) == [task_id]
+	# The requeued task is still waiting, so the result of the first worker is kept
+	assert queue.complete(task_id, first[1], "first")
+	second = queue.claim("second")
+	assert not queue.complete(task_id, second[1], "second")
+	assert queue.take_result(task_id) == ("first", None)
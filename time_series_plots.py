@@ -1,44 +1,35 @@
 import os
 import numpy as np
-import networkx as nx
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
-import matplotlib.patches as mpatches
 import moviepy.video.io.ImageSequenceClip
-from evolutionary_game_theory import one_replica_simulation
+from replica_runner import run_replicas, metrics_file, snapshot_file
+from frame_renderer import FrameRenderer, submit_snapshots, FILM_DIR, VIDEO_DIR
+from metrics_writer import read_metrics
 
 path = os.path.split(os.path.realpath(__file__))
 
-def _plot_time_serie(G, W, steps, x0, beta, ax, color, choice_factor, title):
+def _plot_time_serie(time_series, ax, color):
 	"""
 	Plots a single time-series
 	Parameters
 	----------
-	G : nx.Graph
-	W : array
-		Payoff matrix
-	steps : int
-		Numebr of time-steps
-	x0 : float
-		Initial density of cooperators
-	beta : float
-		Models the importance of the difference of payoffs in a game
+	time_series : deque
+		Proportion of cooperators at every time-step of one game
 	ax : ax
 	color: str
 		Color of the plot
-	choice_factor : int
-		Choice of how nodes will decide to update their strategy
 	Returns
 	-------
-	p : float
-		Mean density
+	time_series : deque
+		The plotted time-series
 	"""
-	p, time_series = one_replica_simulation(G, W, steps, x0, beta, choice_factor, title)
 	ax.plot(time_series, c=color)
 	return time_series
 
 
-def plot_time_series(G, W, steps, x0, beta, games, choice_factor, title, saving_path=True):
+def plot_time_series(G, W, steps, x0, beta, games, choice_factor, title, saving_path=True, workers=1, seed=None, metrics_dir=None, pool=None, lockstep=False,
+						video_fps=None, cache=None, **options):
 	"""
 	Makes times series plots
 	Parameters
@@ -60,6 +51,25 @@ def plot_time_series(G, W, steps, x0, beta, games, choice_factor, title, saving_
 		Title of the plot
 	saving_path : bool, default True
 		If True, the image will be saved
+	workers : int, default 1
+		Number of worker processes running games in parallel
+	seed : int, optional
+		Root seed of the games' random streams
+	metrics_dir : str, optional
+		If given every game streams its per-step metrics to this directory while it runs and the
+		series are read back one game at a time instead of being held in memory
+	pool : ProcessPoolExecutor, optional
+		Pool opened by replica_runner.replica_pool for G, reused across calls
+	lockstep : bool, default False
+		If True all games advance together as one (games, N) strategy matrix
+	video_fps : int, optional
+		If given every game streams a snapshot of every step (or every snapshot_every steps) and a
+		video of each game is rendered from them once the games are done
+	cache : result_cache.ResultCache, optional
+		Games of a seeded run already simulated are read from it instead of run again, games that
+		stream metrics or snapshots always run
+	**options
+		Extra keyword arguments for one_replica_simulation, e.g. early_stop or convergence_window
 	-------
 	means_dict : dict
 		Mean proportion of cooperators at every stage
@@ -67,10 +77,23 @@ def plot_time_series(G, W, steps, x0, beta, games, choice_factor, title, saving_
 	means_arr = [0] * steps
 	plt.figure(figsize=(20, 10))
 	ax = plt.gca()
+	videoTitles = [title + ", Game=" + str(T) for T in range(1, games+1)]
+	if video_fps is not None:
+		snapshot_dir = os.path.normpath(path[0] + "/reports/snapshots/" + title.replace("/", "_"))
+		options = dict({"snapshot_every": 1}, **options, snapshot_dir=snapshot_dir)
+	if metrics_dir is None:
+		results = run_replicas(G, W, steps, x0, beta, games, choice_factor, titles=videoTitles, workers=workers, seed=seed, pool=pool, lockstep=lockstep,
+								cache=cache, **options)
+	else:
+		run_replicas(G, W, steps, x0, beta, games, choice_factor, titles=videoTitles, workers=workers, seed=seed,
+					metrics_dir=metrics_dir, pool=pool, keep_series=False, **options)
 	for T, c in tuple(zip(range(1, games+1), mcolors.XKCD_COLORS.keys())):
 		print("Game " + str(T))
-		videoTitle = title + ", Game=" + str(T)
-		time_series = _plot_time_serie(G, W, steps=steps, x0=x0, beta=beta, ax=ax, color=c, choice_factor=choice_factor, title=videoTitle)
+		if metrics_dir is None:
+			time_series = results[T-1][1]
+		else:
+			time_series = read_metrics(metrics_file(metrics_dir, T-1), fields=["coop"])["coop"]
+		time_series = _plot_time_serie(time_series, ax=ax, color=c)
 		for i in range(0, steps):
 			means_arr[i] = means_arr[i] + time_series[i]
 	for i in range(0, steps):
@@ -87,9 +110,16 @@ def plot_time_series(G, W, steps, x0, beta, games, choice_factor, title, saving_
 	# saving file to reports folder
 	if saving_path:
 		plt.savefig(os.path.normpath(path[0] + "/reports/figures/time_series/" + title + " " + ".jpeg"), dpi=500)
+	if video_fps is not None:
+		# Frames of every game are rendered by one pool, then each game becomes a video
+		with FrameRenderer(G, workers=max(workers, 2)) as renderer:
+			for T in range(1, games+1):
+				submit_snapshots(renderer, snapshot_file(snapshot_dir, T-1), videoTitles[T-1])
+		for videoTitle in videoTitles:
+			make_simulation_video(videoTitle, video_fps, title=videoTitle)
 	return means_arr
 
-def make_simulation_video(name, fps):
+def make_simulation_video(name, fps, title=None, frame_dir=FILM_DIR):
 	"""
 	Makes a video with the simulation evolution of the nodes strategies
 	Parameters
@@ -97,9 +127,13 @@ def make_simulation_video(name, fps):
 	name : str
 		Name of the video
 	fps : int
+	title : str, optional
+		Only the frames of this title are used, every frame of frame_dir when omitted
+	frame_dir : str, default FILM_DIR
 	"""
 	# make video
-	image_folder = os.path.normpath(path[0] + "/reports/figures/film")
-	image_files = [image_folder+'/'+img for img in os.listdir(image_folder) if img.endswith(".png")]
+	prefix = "" if title is None else title.replace("/", "_") + ", Step="
+	image_files = [os.path.join(frame_dir, img) for img in os.listdir(frame_dir) if img.endswith(".png") and img.startswith(prefix)]
 	clip = moviepy.video.io.ImageSequenceClip.ImageSequenceClip(sorted(image_files), fps=fps)
-	clip.write_videofile(os.path.normpath(path[0] + "/reports/videos/" + name + ".mp4"))
\ No newline at end of file
+	os.makedirs(VIDEO_DIR, exist_ok=True)
+	clip.write_videofile(os.path.join(VIDEO_DIR, name.replace("/", "_") + ".mp4"))
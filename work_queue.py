@@ -0,0 +1,529 @@
+"""
+This module contains a work queue that spreads replicas over several machines through a shared
+directory. The coordinator publishes the network once and every replica as a task file, workers on
+any host sharing the directory claim a task by renaming it, which only one of them can do, run it
+and write its result back. A worker refreshes the modification time of its claim while it runs and
+the coordinator puts back the tasks whose claim stopped changing, so the replicas of a dead worker
+are run by another one. Replica seeds travel with the tasks, a replica run twice gives the same
+result and the first one written is kept: results are linked in place under the task id, which
+fails once a result or the marker the coordinator leaves after taking it is there, so the late
+result of a worker thought dead is dropped.
+
+The files are pickles, the directory must only be writable by trusted users. Start the workers on
+every host with
+
+	python work_queue.py QUEUE_DIR --idle-exit 600
+
+and give the same directory to multi_replica_simulation, plot_cooperation_density_plot or
+batch.py --queue-dir.
+"""
+import os
+import time
+import uuid
+import pickle
+import socket
+import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Executor, Future
+from replica_runner import _init_worker, _run_replica
+from result_cache import graph_digest
+
+SUBDIRS = ("tasks", "claimed", "results", "graphs")
+
+
+def _write_pickle(file_path, value):
+	"""
+	Pickles a value to a file, atomically
+	Parameters
+	----------
+	file_path : str
+	value : object
+	"""
+	# Written under a temporary name so a reader never sees a partial file
+	partial = "{0}.{1}.partial".format(file_path, uuid.uuid4().hex)
+	with open(partial, "wb") as file:
+		pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(partial, file_path)
+
+
+def _read_pickle(file_path):
+	"""
+	Reads a file written by _write_pickle
+	Parameters
+	----------
+	file_path : str
+	Returns
+	-------
+	value : object
+	"""
+	with open(file_path, "rb") as file:
+		return pickle.load(file)
+
+
+class WorkQueue:
+	"""
+	Shared directory holding the networks, tasks, claims and results of a queue. Task ids sort in
+	submission order, so the workers take the oldest tasks first
+	Parameters
+	----------
+	queue_dir : str
+		Directory every coordinator and worker host can reach
+	heartbeat_timeout : float, default 60
+		Seconds a claim can go without a heartbeat before its task is requeued
+	"""
+
+	def __init__(self, queue_dir, heartbeat_timeout=60):
+		self.queue_dir = queue_dir
+		self.heartbeat_timeout = heartbeat_timeout
+		for name in SUBDIRS:
+			os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+		# Last modification time seen for each claim and when it was seen on this host's clock,
+		# so the hosts' clocks never need to agree
+		self._claims = {}
+
+	def _path(self, subdir, name):
+		"""
+		Returns the path of a file of the queue
+		Parameters
+		----------
+		subdir : str
+			One of SUBDIRS
+		name : str
+		Returns
+		-------
+		file_path : str
+		"""
+		return os.path.join(self.queue_dir, subdir, name)
+
+	def publish_graph(self, G):
+		"""
+		Stores a network for the workers, once per content
+		Parameters
+		----------
+		G : nx.Graph, CSRGraph or Lattice
+		Returns
+		-------
+		digest : str
+			graph_digest of the network, the tasks refer to it
+		"""
+		digest = graph_digest(G)
+		file_path = self._path("graphs", digest + ".pkl")
+		if not os.path.exists(file_path):
+			_write_pickle(file_path, G)
+		return digest
+
+	def load_graph(self, digest):
+		"""
+		Reads a network stored by publish_graph
+		Parameters
+		----------
+		digest : str
+		Returns
+		-------
+		G : nx.Graph, CSRGraph or Lattice
+		"""
+		return _read_pickle(self._path("graphs", digest + ".pkl"))
+
+	def submit(self, digest, task):
+		"""
+		Adds a task to the queue
+		Parameters
+		----------
+		digest : str
+			Network the task runs on
+		task : tuple
+			Task tuple of replica_runner._run_replica
+		Returns
+		-------
+		task_id : str
+		"""
+		task_id = "{0:020d}_{1}".format(time.time_ns(), uuid.uuid4().hex)
+		_write_pickle(self._path("tasks", task_id + ".task"), (digest, task))
+		return task_id
+
+	def claim(self, worker_id):
+		"""
+		Takes the oldest waiting task
+		Parameters
+		----------
+		worker_id : str
+			Name of the worker, it may not contain dots
+		Returns
+		-------
+		claim : tuple or None
+			(task_id, claim file, digest, task), None when no task is waiting
+		"""
+		for name in sorted(os.listdir(self._path("tasks", ""))):
+			if not name.endswith(".task"):
+				continue
+			task_id = name[:-len(".task")]
+			claim_path = self._path("claimed", "{0}.{1}.claim".format(task_id, worker_id))
+			try:
+				# Renaming is atomic, when several workers try the same task only one succeeds
+				os.rename(self._path("tasks", name), claim_path)
+			except FileNotFoundError:
+				continue
+			os.utime(claim_path)
+			digest, task = _read_pickle(claim_path)
+			return task_id, claim_path, digest, task
+		return None
+
+	def heartbeat(self, claim_path):
+		"""
+		Shows that the worker holding a claim is alive
+		Parameters
+		----------
+		claim_path : str
+		"""
+		try:
+			os.utime(claim_path)
+		except FileNotFoundError:
+			# The task was requeued, the worker still finishes it and its result stays valid
+			pass
+
+	def complete(self, task_id, claim_path, result=None, error=None):
+		"""
+		Writes the result of a claimed task and releases the claim. The result is dropped when
+		another run of the task already wrote one, or when the claim was requeued and the task is
+		not waiting anymore, i.e. another worker runs it or the coordinator took its result
+		Parameters
+		----------
+		task_id : str
+		claim_path : str
+		result : object, optional
+			Return value of the task
+		error : BaseException, optional
+			Exception raised by the task, the coordinator raises it again
+		Returns
+		-------
+		written : bool
+			False when the result was dropped
+		"""
+		if not os.path.exists(claim_path) and not os.path.exists(self._path("tasks", task_id + ".task")):
+			return False
+		file_path = self._path("results", task_id + ".result")
+		partial = "{0}.{1}.partial".format(file_path, uuid.uuid4().hex)
+		with open(partial, "wb") as file:
+			pickle.dump((result, error), file, protocol=pickle.HIGHEST_PROTOCOL)
+		try:
+			# Unlike a rename, a link never replaces the file already there
+			os.link(partial, file_path)
+			written = True
+		except FileExistsError:
+			written = False
+		finally:
+			os.remove(partial)
+		try:
+			os.remove(claim_path)
+		except FileNotFoundError:
+			pass
+		return written
+
+	def take_result(self, task_id):
+		"""
+		Reads the result of a task, leaving an empty marker in its place until forget is called so
+		that a late run of the task cannot write it again
+		Parameters
+		----------
+		task_id : str
+		Returns
+		-------
+		outcome : tuple or None
+			(result, error), None while the task is not done or once taken
+		"""
+		file_path = self._path("results", task_id + ".result")
+		try:
+			if os.path.getsize(file_path) == 0:
+				return None
+			outcome = _read_pickle(file_path)
+		except FileNotFoundError:
+			return None
+		partial = "{0}.{1}.partial".format(file_path, uuid.uuid4().hex)
+		open(partial, "wb").close()
+		os.replace(partial, file_path)
+		# A copy put back by requeue_stale is not needed anymore
+		try:
+			os.remove(self._path("tasks", task_id + ".task"))
+		except FileNotFoundError:
+			pass
+		return outcome
+
+	def forget(self, task_id):
+		"""
+		Removes the marker of a taken result. A worker still running the task afterwards drops its
+		result as long as the task is not waiting in the queue
+		Parameters
+		----------
+		task_id : str
+		"""
+		try:
+			os.remove(self._path("results", task_id + ".result"))
+		except FileNotFoundError:
+			pass
+
+	def cancel(self, task_id):
+		"""
+		Removes a task that no worker has claimed yet
+		Parameters
+		----------
+		task_id : str
+		Returns
+		-------
+		cancelled : bool
+		"""
+		try:
+			os.remove(self._path("tasks", task_id + ".task"))
+		except FileNotFoundError:
+			return False
+		return True
+
+	def requeue_stale(self):
+		"""
+		Puts back the tasks whose claim got no heartbeat for heartbeat_timeout seconds
+		Returns
+		-------
+		requeued : list
+			Ids of the tasks put back
+		"""
+		now = time.monotonic()
+		requeued = []
+		seen = {}
+		for name in os.listdir(self._path("claimed", "")):
+			if not name.endswith(".claim"):
+				continue
+			try:
+				mtime = os.stat(self._path("claimed", name)).st_mtime_ns
+			except FileNotFoundError:
+				continue
+			last_mtime, since = self._claims.get(name, (None, now))
+			if mtime != last_mtime:
+				since = now
+			seen[name] = (mtime, since)
+			if now - since > self.heartbeat_timeout:
+				task_id = name.split(".")[0]
+				try:
+					os.rename(self._path("claimed", name), self._path("tasks", task_id + ".task"))
+				except FileNotFoundError:
+					continue
+				seen.pop(name)
+				requeued.append(task_id)
+		self._claims = seen
+		return requeued
+
+
+class QueueExecutor(Executor):
+	"""
+	Executor running replica tasks on the workers of a WorkQueue, it stands in for the pool of
+	replica_pool so run_replicas and the density sweeps use the queue unchanged. A thread of the
+	coordinator collects the results and requeues the tasks of dead workers
+	Parameters
+	----------
+	queue : WorkQueue
+	digest : str
+		Network the tasks run on, stored with WorkQueue.publish_graph
+	poll : float, default 0.5
+		Seconds between two looks at the results
+	"""
+
+	def __init__(self, queue, digest, poll=0.5):
+		self.queue = queue
+		self.digest = digest
+		self.poll = poll
+		self._futures = {}
+		self._taken = []
+		self._lock = threading.Lock()
+		self._shutdown = threading.Event()
+		self._collector = threading.Thread(target=self._collect, daemon=True)
+		self._collector.start()
+
+	def submit(self, fn, *args, **kwargs):
+		"""
+		Queues one replica
+		Parameters
+		----------
+		fn : callable
+			Must be replica_runner._run_replica, the workers only run replicas
+		*args
+			The task tuple
+		Returns
+		-------
+		future : Future
+		"""
+		if fn is not _run_replica or len(args) != 1 or kwargs:
+			raise ValueError("A work queue only runs replica_runner._run_replica(task)")
+		if self._shutdown.is_set():
+			raise RuntimeError("Cannot submit to a queue executor after shutdown")
+		future = Future()
+		future.set_running_or_notify_cancel()
+		with self._lock:
+			self._futures[self.queue.submit(self.digest, args[0])] = future
+		return future
+
+	def _collect(self):
+		"""
+		Resolves the futures as the results arrive, until shutdown with nothing left to wait for
+		"""
+		while True:
+			with self._lock:
+				pending = list(self._futures)
+			if not pending and self._shutdown.is_set():
+				for task_id in self._taken:
+					self.queue.forget(task_id)
+				return
+			self.queue.requeue_stale()
+			for task_id in pending:
+				outcome = self.queue.take_result(task_id)
+				if outcome is None:
+					continue
+				with self._lock:
+					future = self._futures.pop(task_id)
+				self._taken.append(task_id)
+				result, error = outcome
+				if error is not None:
+					future.set_exception(error)
+				else:
+					future.set_result(result)
+			time.sleep(self.poll)
+
+	def shutdown(self, wait=True, *, cancel_futures=False):
+		"""
+		Stops accepting tasks
+		Parameters
+		----------
+		wait : bool, default True
+			If True waits for the results of the queued tasks
+		cancel_futures : bool, default False
+			If True removes the tasks no worker has claimed yet
+		"""
+		if cancel_futures:
+			with self._lock:
+				for task_id, future in list(self._futures.items()):
+					if self.queue.cancel(task_id):
+						self._futures.pop(task_id)
+						future.cancel()
+		self._shutdown.set()
+		if wait:
+			self._collector.join()
+
+
+@contextmanager
+def queue_pool(G, queue_dir, heartbeat_timeout=60, poll=0.5):
+	"""
+	Publishes a network to a work queue and opens an executor for its replicas, used like
+	replica_runner.replica_pool
+	Parameters
+	----------
+	G : nx.Graph, CSRGraph or Lattice
+	queue_dir : str
+		Directory shared with the workers
+	heartbeat_timeout : float, default 60
+		Seconds without heartbeat after which the task of a worker is requeued
+	poll : float, default 0.5
+		Seconds between two looks at the results
+	Yields
+	------
+	pool : QueueExecutor
+	"""
+	queue = WorkQueue(queue_dir, heartbeat_timeout)
+	executor = QueueExecutor(queue, queue.publish_graph(G), poll)
+	try:
+		yield executor
+	except BaseException:
+		executor.shutdown(wait=False, cancel_futures=True)
+		raise
+	executor.shutdown(wait=True)
+
+
+def _beat(queue, claim_path, interval, stop):
+	"""
+	Sends heartbeats for a claim until stop is set
+	Parameters
+	----------
+	queue : WorkQueue
+	claim_path : str
+	interval : float
+		Seconds between two heartbeats
+	stop : threading.Event
+	"""
+	while not stop.wait(interval):
+		queue.heartbeat(claim_path)
+
+
+def run_worker(queue_dir, worker_id=None, heartbeat_seconds=10, poll=1.0, idle_exit=None, max_tasks=None):
+	"""
+	Runs the tasks of a work queue one after another
+	Parameters
+	----------
+	queue_dir : str
+	worker_id : str, optional
+		Name of the worker, host name and process id when omitted
+	heartbeat_seconds : float, default 10
+		Seconds between two heartbeats, well below the coordinator's heartbeat_timeout
+	poll : float, default 1.0
+		Seconds between two looks for tasks when the queue is empty
+	idle_exit : float, optional
+		Stops after this many seconds without a task, runs forever when omitted
+	max_tasks : int, optional
+		Stops after running this many tasks
+	Returns
+	-------
+	done : int
+		Number of tasks run
+	"""
+	queue = WorkQueue(queue_dir)
+	if worker_id is None:
+		worker_id = "{0}-{1}".format(socket.gethostname(), os.getpid())
+	worker_id = worker_id.replace(".", "-")
+	digest = None
+	done = 0
+	idle_since = time.monotonic()
+	while max_tasks is None or done < max_tasks:
+		claim = queue.claim(worker_id)
+		if claim is None:
+			if idle_exit is not None and time.monotonic() - idle_since > idle_exit:
+				break
+			time.sleep(poll)
+			continue
+		task_id, claim_path, task_digest, task = claim
+		stop = threading.Event()
+		beat = threading.Thread(target=_beat, args=(queue, claim_path, heartbeat_seconds, stop), daemon=True)
+		beat.start()
+		try:
+			if task_digest != digest:
+				_init_worker(queue.load_graph(task_digest))
+				digest = task_digest
+			result, error = _run_replica(task), None
+		except Exception as exception:
+			result, error = None, exception
+		finally:
+			stop.set()
+			beat.join()
+		queue.complete(task_id, claim_path, result, error)
+		done += 1
+		idle_since = time.monotonic()
+	return done
+
+
+def main(argv=None):
+	"""
+	Parses the command line and runs a worker
+	Parameters
+	----------
+	argv : list, optional
+		Command line arguments, sys.argv when omitted
+	"""
+	parser = argparse.ArgumentParser(description="Runs the replicas of a shared work queue directory.")
+	parser.add_argument("queue_dir", help="directory shared with the coordinator")
+	parser.add_argument("--worker-id", dest="worker_id", help="name of the worker, host-pid by default")
+	parser.add_argument("--heartbeat", type=float, default=10, help="seconds between heartbeats")
+	parser.add_argument("--poll", type=float, default=1.0, help="seconds between looks for tasks")
+	parser.add_argument("--idle-exit", dest="idle_exit", type=float, help="stop after this many idle seconds")
+	parser.add_argument("--max-tasks", dest="max_tasks", type=int, help="stop after this many tasks")
+	args = parser.parse_args(argv)
+	done = run_worker(args.queue_dir, args.worker_id, args.heartbeat, args.poll, args.idle_exit, args.max_tasks)
+	print("Worker ran {0} tasks".format(done))
+
+
+if __name__ == "__main__":
+	main()